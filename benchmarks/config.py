@@ -0,0 +1,66 @@
+"""Compare loading a large config with the pure Python YAML loader against the validating LibYAML loader.
+
+Run from the repository root with `python -m benchmarks.config [--sources N] [--outputs N]`.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from icons.config import Loader, load_config
+from icons.scheduler import load_context
+
+from .corpus import write_config
+
+
+def main(sources: int, outputs: int, repeat: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_path = write_config(
+            Path(temp_dir) / 'icons-config.yaml',
+            [
+                {
+                    'type': 'folder',
+                    'path': f'png-{source_index}',
+                    'format': 'png',
+                    'outputs': [
+                        {
+                            'directory-override': f'group-{output_index}',
+                            'background': f'#{output_index % 256:02x}5a5b',
+                            'sizes': [16, 32, 64, 128, 256],
+                            'selectors': [f'icon-{index:05d}' for index in range(output_index % 8 + 1)],
+                        }
+                        for output_index in range(outputs)
+                    ],
+                }
+                for source_index in range(sources)
+            ],
+        )
+        print(f'{sources} sources with {outputs} outputs each, {config_path.stat().st_size / 1024:.0f} KiB')
+
+        def safe_load():
+            with open(config_path) as f:
+                return yaml.safe_load(f)
+
+        loaders = (('safe_load', safe_load), (f'load_config ({Loader.__name__})', lambda: load_config(config_path)))
+        for name, load in loaders:
+            start = time.perf_counter()
+            for _ in range(repeat):
+                icon_config = load()
+            loaded = time.perf_counter()
+            for _ in range(repeat):
+                load_context(icon_config, temp_dir)
+            compiled = time.perf_counter()
+            print(
+                f'{name:>30}: {(loaded - start) / repeat * 1000:7.1f} ms to load, '
+                f'{(compiled - loaded) / repeat * 1000:7.1f} ms to compile the context'
+            )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=50, help='number of sources in the config')
+    parser.add_argument('--outputs', type=int, default=40, help='number of outputs of each source')
+    parser.add_argument('--repeat', type=int, default=5, help='number of times to load the config')
+    main(**parser.parse_args().__dict__)
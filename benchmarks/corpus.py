@@ -0,0 +1,95 @@
+"""Generate synthetic icon corpora and matching configs for the benchmarks."""
+import random
+from pathlib import Path
+
+import yaml
+from PIL import Image, ImageDraw
+
+
+def generate_png_corpus(folder: Path, count: int, size: int = 64, complexity: int = 3, seed: int = 0) -> list[Path]:
+    """Generate black-on-transparent PNG icons, following the contribution guidelines for sources.
+
+    Args:
+        folder (Path): The folder to write the icons to.
+        count (int): The number of icons to generate.
+        size (int): The length of the longest side of each icon.
+        complexity (int): The number of shapes in each icon.
+        seed (int): The seed for the random shapes.
+
+    Returns:
+        list[Path]: The paths of the generated icons.
+    """
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    paths = []
+    for index in range(count):
+        img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(img)
+        for _ in range(complexity):
+            box = sorted(rng.randrange(size) for _ in range(2)), sorted(rng.randrange(size) for _ in range(2))
+            draw.ellipse((box[0][0], box[1][0], box[0][1], box[1][1]), fill=(0, 0, 0, 255))
+
+        path = folder / f'icon-{index:05d}.png'
+        img.save(path)
+        paths.append(path)
+    return paths
+
+
+def generate_svg_corpus(folder: Path, count: int, complexity: int = 3, seed: int = 0) -> list[Path]:
+    """Generate single-color SVG icons made of closed cubic Bézier paths, like most icon sets.
+
+    Args:
+        folder (Path): The folder to write the icons to.
+        count (int): The number of icons to generate.
+        complexity (int): The number of paths in each icon, each with as many curves.
+        seed (int): The seed for the random shapes.
+
+    Returns:
+        list[Path]: The paths of the generated icons.
+    """
+    rng = random.Random(seed)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    def point():
+        return f'{rng.uniform(0, 512):.2f} {rng.uniform(0, 512):.2f}'
+
+    paths = []
+    for index in range(count):
+        shapes = []
+        for _ in range(complexity):
+            curves = ' '.join(f'C {point()} {point()} {point()}' for _ in range(complexity))
+            shapes.append(f'<path d="M {point()} {curves} Z"/>')
+
+        path = folder / f'icon-{index:05d}.svg'
+        path.write_text(f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 512 512">{"".join(shapes)}</svg>')
+        paths.append(path)
+    return paths
+
+
+def write_config(path: Path, sources: list[dict], output_defaults: dict = None) -> Path:
+    """Write an icons config with the given sources.
+
+    Args:
+        path (Path): The path of the config file.
+        sources (list[dict]): The source configs.
+        output_defaults (dict): Overrides for the default output config.
+
+    Returns:
+        Path: The path of the config file.
+    """
+    config = {
+        'source-defaults': {'recurse': False},
+        'output-defaults': {
+            'format': 'png',
+            'sizes': [32],
+            'color': '#ffffff',
+            'background': '#000000',
+            'margin': '18%',
+        }
+        | (output_defaults or {}),
+        'sources': sources,
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    return path
@@ -0,0 +1,72 @@
+"""Measure the per-task payloads sent to the build workers, and a full build over many small icons.
+
+Run from the repository root with `python -m benchmarks.ipc [--count N]`.
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+import build
+from icons.scheduler import expand_jobs, load_context
+
+from .corpus import generate_png_corpus, write_config
+
+
+def _noop(*args):
+    return None
+
+
+def main(count: int, jobs: int):
+    processes = jobs or os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        generate_png_corpus(temp_dir / 'src' / 'png', count, size=64)
+        config_path = write_config(
+            temp_dir / 'icons-config.yaml',
+            [{'type': 'folder', 'path': 'png', 'format': 'png', 'outputs': [{'directory-override': 'general'}]}],
+        )
+
+        with open(config_path) as f:
+            context = load_context(yaml.safe_load(f), temp_dir / 'src')
+        compact_jobs = list(expand_jobs(context))
+
+        # the tasks as they were sent before the context moved to the worker initializer
+        full_jobs = [
+            (
+                context.sources[job.source_index],
+                context.input_configs[job.source_index],
+                job.image_path,
+                context.output_configs[job.source_index][job.output_index],
+                job.target_size,
+            )
+            for job in compact_jobs
+        ]
+
+        for name, tasks in (('full', full_jobs), ('compact', compact_jobs)):
+            payload = sum(len(pickle.dumps(task)) for task in tasks)
+            with multiprocessing.Pool(processes) as pool:
+                start = time.perf_counter()
+                pool.map(_noop, tasks, chunksize=1)
+                elapsed = time.perf_counter() - start
+            print(
+                f'{name:>7} tasks: {payload / len(tasks):.0f} bytes per task, '
+                f'{payload / 1024:.0f} KiB total, {elapsed * 1000:.0f} ms to dispatch {len(tasks)} tasks'
+            )
+
+        start = time.perf_counter()
+        build.main(config_path, source_folder=temp_dir / 'src', output_folder=temp_dir / 'output', jobs=jobs)
+        print(f'  build: {time.perf_counter() - start:.2f} s for {len(compact_jobs)} images on {processes} workers')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=2000, help='number of icons to generate')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes, defaults to the CPU count')
+    main(**parser.parse_args().__dict__)
@@ -0,0 +1,115 @@
+"""Compare builds with and without the threaded I/O stage, on a file system with artificial latency.
+
+Every listing, read and write sleeps for `--latency` milliseconds, like a network file system would take for a
+round trip, while the files themselves stay on the local disk. The baseline lists one source at a time and reads
+each image on the worker that renders it. Outputs are compared between the builds. Run from the repository root
+with `python -m benchmarks.latency [--latency MS] [--count N]`.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import partial, wraps
+from pathlib import Path
+
+import build
+from icons.manifest import BuildManifest
+from icons.scheduler import expand_jobs
+from icons.sources import BaseSource, DirectorySource
+
+from .corpus import generate_png_corpus, write_config
+
+
+def _delayed(function, latency: float):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        time.sleep(latency)
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+@contextmanager
+def slow_file_system(latency: float):
+    """Add `latency` seconds to every listing, read and write of a build, in this process and its forked workers."""
+    patches = [
+        (BaseSource, 'read'),
+        (BaseSource, 'map'),
+        (DirectorySource, '_glob'),
+        (build, 'write_atomic'),
+    ]
+    originals = [getattr(owner, name) for owner, name in patches]
+    try:
+        for (owner, name), original in zip(patches, originals):
+            setattr(owner, name, _delayed(original, latency))
+        yield
+    finally:
+        for (owner, name), original in zip(patches, originals):
+            setattr(owner, name, original)
+
+
+def run(config_path: Path, source_folder: Path, output_folder: Path, pipelined: bool, **options) -> float:
+    start = time.perf_counter()
+    if pipelined:
+        build.main(config_path, source_folder=source_folder, output_folder=output_folder, **options)
+    else:
+        # list the sources one after another, and read every image when its first job needs it
+        build.expand_jobs = partial(expand_jobs, threads=1)
+        try:
+            build.main(config_path, source_folder=source_folder, output_folder=output_folder, prefetch=0, **options)
+        finally:
+            build.expand_jobs = expand_jobs
+    return time.perf_counter() - start
+
+
+def main(count: int, sources: int, latency: float, jobs: int, writer_threads: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        source_folder = temp_dir / 'src'
+        for index in range(sources):
+            generate_png_corpus(source_folder / f'png-{index}', count // sources, size=128, seed=index)
+        config_path = write_config(
+            temp_dir / 'icons-config.yaml',
+            [
+                {
+                    'type': 'folder',
+                    'path': f'png-{index}',
+                    'format': 'png',
+                    'outputs': [{'directory-override': f'general-{index}'}],
+                }
+                for index in range(sources)
+            ],
+            output_defaults={'sizes': [128, 64, 32]},
+        )
+
+        with slow_file_system(latency / 1000):
+            # both builds write on the same threads, so the time saved is from listing and reading
+            options = {'jobs': jobs, 'writer_threads': writer_threads}
+            baseline_time = run(config_path, source_folder, temp_dir / 'baseline', pipelined=False, **options)
+            pipelined_time = run(config_path, source_folder, temp_dir / 'pipelined', pipelined=True, **options)
+
+        print(f'{count} images in {sources} sources, {latency:.0f} ms per listing, read and write, {jobs} workers')
+        print(f' baseline: {baseline_time:6.2f} s')
+        print(f'pipelined: {pipelined_time:6.2f} s')
+
+        baseline = BuildManifest.load(temp_dir / 'baseline').entries
+        pipelined = BuildManifest.load(temp_dir / 'pipelined').entries
+        different = sorted(
+            path
+            for path in baseline.keys() | pipelined.keys()
+            if baseline.get(path, {}).get('hash') != pipelined.get(path, {}).get('hash')
+        )
+        print(f'{len(pipelined)} files, {len(different)} different from the baseline')
+        if different:
+            sys.exit(f'The pipelined build differs from the baseline: {", ".join(different[:10])}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=200, help='number of generated images')
+    parser.add_argument('--sources', type=int, default=4, help='number of source folders to split the images into')
+    parser.add_argument('--latency', type=float, default=20, help='milliseconds added to every file system call')
+    parser.add_argument('-j', '--jobs', type=int, default=2, help='number of worker processes')
+    parser.add_argument('--writer-threads', type=int, default=8, help='number of writer threads per worker')
+    main(**parser.parse_args().__dict__)
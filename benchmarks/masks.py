@@ -0,0 +1,123 @@
+"""Compare coloring every render separately against filling one alpha mask per size, for outputs in many colors.
+
+The baseline recolors each PNG and rasterizes each SVG once per color, like the inputs did before they shared
+masks between colors. Run from the repository root with `python -m benchmarks.masks [--colors N]`.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import ImageChops
+
+from icons import input_provider, output_provider, source_provider
+from icons.inputs import StandardInput, fill_mask
+
+from .corpus import generate_svg_corpus
+
+SIZES = [512, 256, 128, 96, 64, 48, 32, 16]
+COLORS = ['#ffffff', '#000000', '#1e90ff', '#ff4500', '#2e8b57', '#9370db', '#ffd700', '#708090', '#c71585', '#00ced1']
+
+
+def _bytes(images) -> int:
+    return sum(img.width * img.height * len(img.getbands()) for img in images)
+
+
+def _input(source, image_path: Path):
+    # the rasterizer draws the masks of SVG images, like it does for sources that set fast-rasterizer
+    return input_provider.get({'path': image_path, 'source': source, 'format': source.format, 'fast-rasterizer': True})
+
+
+def _cached_bytes(input_) -> int:
+    cache = input_.render_cache
+    return _bytes(cache.get(key) for key in cache)
+
+
+def baseline(source, image_path: Path, outputs: list) -> tuple[dict, float, int]:
+    input_ = _input(source, image_path)
+    start = time.perf_counter()
+    images = {}
+    colored = []
+    for output in outputs:
+        if input_.is_vector:
+            # parse and rasterize every size again for each color
+            shape = _input(source, image_path).shape
+        else:
+            decoded = input_.ingest(color=None)
+            colored.append(StandardInput._change_color(decoded, '#000000', output.color, input_.delta_rank))
+        for target_size, core_size in output.generate_sizes():
+            if input_.is_vector:
+                colored.append(fill_mask(shape.mask(core_size), output.color))
+            img = colored[-1]
+            try:
+                images[output.color, target_size], _ = output.generate(img, input_, target_size, core_size)
+            except ValueError:
+                continue
+    return images, time.perf_counter() - start, _cached_bytes(input_) + _bytes(colored)
+
+
+def masked(source, image_path: Path, outputs: list) -> tuple[dict, float, int]:
+    input_ = _input(source, image_path)
+    start = time.perf_counter()
+    images = {}
+    for output in outputs:
+        for target_size, core_size in output.generate_sizes():
+            try:
+                img = output.ingest(input_, core_size)
+                images[output.color, target_size], _ = output.generate(img, input_, target_size, core_size)
+            except ValueError:
+                continue
+    return images, time.perf_counter() - start, _cached_bytes(input_)
+
+
+def main(source_folder: Path, colors: int, count: int, repeat: int):
+    outputs = [
+        output_provider.get({'format': 'png', 'sizes': SIZES, 'color': color, 'background': '#202020', 'margin': '10%'})
+        for color in COLORS[:colors]
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generate_svg_corpus(Path(temp_dir) / 'svg', count)
+        folders = [(source_folder, 'png', 'png'), (Path(temp_dir), 'svg', 'svg')]
+
+        totals = [0.0, 0.0]
+        for base_path, folder, image_format in folders:
+            source = source_provider.get(
+                {'type': 'folder', 'path': folder, 'format': image_format}, base_path=base_path
+            )
+            for image_path in sorted(source.get()):
+                input_ = _input(source, image_path)
+                if not input_.maskable or (input_.is_vector and input_.shape is None):
+                    print(f'{image_path.name:>20}: not maskable, skipped')
+                    continue
+
+                baseline_time = masked_time = float('inf')
+                for _ in range(repeat):
+                    expected, elapsed, baseline_bytes = baseline(source, image_path, outputs)
+                    baseline_time = min(baseline_time, elapsed)
+                    actual, elapsed, masked_bytes = masked(source, image_path, outputs)
+                    masked_time = min(masked_time, elapsed)
+                totals[0] += baseline_time
+                totals[1] += masked_time
+
+                # compare every color and size, per channel, in 0-255 levels
+                max_diff = 0
+                for key, img in expected.items():
+                    difference = ImageChops.difference(img, actual[key])
+                    max_diff = max(max_diff, *(high for _, high in difference.getextrema()))
+                print(
+                    f'{image_path.name:>20}: per color {baseline_time * 1000:6.1f} ms, masks {masked_time * 1000:6.1f} '
+                    f'ms, {baseline_bytes / 2 ** 20:5.1f} MiB vs {masked_bytes / 2 ** 20:5.1f} MiB of renders, '
+                    f'max diff {max_diff:3d}'
+                )
+
+    print(f'{"total":>20}: per color {totals[0] * 1000:6.1f} ms, masks {totals[1] * 1000:6.1f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--source-folder', type=Path, default=Path('src'), help='path to source folder')
+    parser.add_argument('--colors', type=int, default=len(COLORS), help='number of colored outputs of each image')
+    parser.add_argument('--count', type=int, default=5, help='number of generated SVG documents')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing runs')
+    main(**parser.parse_args().__dict__)
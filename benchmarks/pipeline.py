@@ -0,0 +1,194 @@
+"""Time each stage of the build pipeline over a synthetic corpus, and compare the results across commits.
+
+Run from the repository root with `python -m benchmarks.pipeline [--out results.json] [--compare baseline.json]`.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+import PIL
+import yaml
+
+from icons import input_provider, output_provider
+from icons.scheduler import expand_jobs, load_context
+
+from .corpus import generate_png_corpus, generate_svg_corpus, write_config
+
+STAGES = ['enumerate', 'load', 'ingest', 'adjust_core', 'add_background', 'save']
+
+
+class StageTimer:
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+
+    @contextmanager
+    def __call__(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[stage] += time.perf_counter() - start
+            self.calls[stage] += 1
+
+    def results(self) -> dict:
+        return {
+            stage: {
+                'total': self.totals[stage],
+                'calls': self.calls[stage],
+                'mean': self.totals[stage] / self.calls[stage] if self.calls[stage] else 0,
+            }
+            for stage in STAGES
+        }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(corpus_folder: Path, config_path: Path, output_folder: Path) -> dict:
+    timer = StageTimer()
+    with open(config_path) as f:
+        icon_config = yaml.safe_load(f)
+
+    with timer('enumerate'):
+        context = load_context(icon_config, corpus_folder)
+        build_jobs = list(expand_jobs(context))
+
+    outputs = [
+        [output_provider.get(config, base_path=output_folder) for config in configs]
+        for configs in context.output_configs
+    ]
+    inputs = {}
+    for build_job in build_jobs:
+        input_key = (build_job.source_index, build_job.image_path)
+        if input_key not in inputs:
+            source = context.sources[build_job.source_index]
+            with timer('load'):
+                inputs[input_key] = input_provider.get(
+                    {'path': build_job.image_path, 'source': source, 'format': source.format}
+                )
+        input_ = inputs[input_key]
+        output = outputs[build_job.source_index][build_job.output_index]
+
+        core_size = output.plan.core_size(build_job.target_size)
+        kwargs = {'color': output.color}
+        if input_.is_vector:
+            kwargs['size'] = core_size
+        with timer('ingest'):
+            img = input_.ingest(**kwargs)
+
+        with timer('adjust_core'):
+            img = output._adjust_core(img, core_size)
+        with timer('add_background'):
+            img = output._add_background(img, build_job.target_size)
+
+        with timer('save'):
+            output_path = output.generate_path(input_, build_job.target_size)
+            data = output.encode(img)
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            output_path.write_bytes(data)
+
+    results = timer.results()
+    return {'jobs': len(build_jobs), 'stages': results, 'total': sum(stage['total'] for stage in results.values())}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Print the change in each stage against the baseline, returning whether any stage regressed."""
+    regressed = False
+    print(f'\ncompared to {baseline.get("revision") or "baseline"}:')
+    for stage in STAGES + ['total']:
+        current = results['total'] if stage == 'total' else results['stages'][stage]['total']
+        previous = baseline['total'] if stage == 'total' else baseline['stages'][stage]['total']
+        if not previous:
+            continue
+        change = current / previous - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f'{stage:>15}: {previous * 1000:9.1f} ms -> {current * 1000:9.1f} ms ({change:+.1%}){flag}')
+    return regressed
+
+
+def main(
+    png_count: int,
+    svg_count: int,
+    complexity: int,
+    png_size: int,
+    sizes: list[int],
+    seed: int,
+    out: Path,
+    compare_to: Path,
+    threshold: float,
+):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        corpus_folder = temp_dir / 'src'
+        sources = []
+        if png_count:
+            generate_png_corpus(corpus_folder / 'png', png_count, size=png_size, complexity=complexity, seed=seed)
+            sources.append({'type': 'folder', 'path': 'png', 'format': 'png', 'outputs': [{}]})
+        if svg_count:
+            generate_svg_corpus(corpus_folder / 'svg', svg_count, complexity=complexity, seed=seed)
+            sources.append({'type': 'folder', 'path': 'svg', 'format': 'svg', 'outputs': [{}]})
+
+        config_path = write_config(temp_dir / 'icons-config.yaml', sources, {'sizes': sizes})
+        results = run(corpus_folder, config_path, temp_dir / 'output')
+
+    results = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+        'corpus': {
+            'png_count': png_count,
+            'svg_count': svg_count,
+            'complexity': complexity,
+            'png_size': png_size,
+            'sizes': sizes,
+            'seed': seed,
+        },
+    } | results
+
+    print(f'{results["jobs"]} jobs at {results["revision"] or "unknown revision"}:')
+    for stage, timing in results['stages'].items():
+        print(f'{stage:>15}: {timing["total"] * 1000:9.1f} ms over {timing["calls"]:6d} calls')
+    print(f'{"total":>15}: {results["total"] * 1000:9.1f} ms')
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if compare_to:
+        with open(compare_to) as f:
+            baseline = json.load(f)
+        if baseline['corpus'] != results['corpus']:
+            print('warning: the baseline was run on a different corpus', file=sys.stderr)
+        if compare(results, baseline, threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--png-count', type=int, default=200, help='number of PNG icons to generate')
+    parser.add_argument('--svg-count', type=int, default=200, help='number of SVG icons to generate')
+    parser.add_argument('--complexity', type=int, default=3, help='number of shapes per generated icon')
+    parser.add_argument('--png-size', type=int, default=512, help='size of the generated PNG icons')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 64], help='output sizes to generate')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the generated icons')
+    parser.add_argument('--out', type=Path, help='path to write the results to as JSON')
+    parser.add_argument('--compare', dest='compare_to', type=Path, help='path to previous results to compare to')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown ratio reported as a regression')
+    main(**parser.parse_args().__dict__)
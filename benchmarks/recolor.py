@@ -0,0 +1,76 @@
+"""Compare the band-based recoloring in `StandardInput` against the original pixel loop.
+
+The original loop read the red channel for all three deltas, so it matched pixels by their red channel alone
+and shifted every channel by the red delta. The band version matches and shifts each channel by its own delta,
+so the outputs only agree on gray pixels, e.g. the black and anti-aliased pixels of contributed images, and
+differ for colored pixels with a red channel close to the color being replaced. The pixels that differ are
+reported.
+
+Run from the repository root with `python -m benchmarks.recolor [image ...]`.
+"""
+import argparse
+import timeit
+
+from PIL import Image, ImageChops
+from PIL.ImageColor import getrgb
+
+from icons.inputs import StandardInput
+
+
+def loop_change_color(img: Image, from_color, to_color, delta_rank=10):
+    """The original per-pixel implementation, unchanged, including reading the red channel for every delta."""
+    from_color = getrgb(from_color)
+    to_color = getrgb(to_color)
+
+    img_data = img.load()
+    for x in range(0, img.size[0]):
+        for y in range(0, img.size[1]):
+            r_delta = img_data[x, y][0] - from_color[0]
+            g_delta = img_data[x, y][0] - from_color[0]
+            b_delta = img_data[x, y][0] - from_color[0]
+            if abs(r_delta) <= delta_rank and abs(g_delta) <= delta_rank and abs(b_delta) <= delta_rank:
+                img_data[x, y] = (
+                    to_color[0] + r_delta,
+                    to_color[1] + g_delta,
+                    to_color[2] + b_delta,
+                    img_data[x, y][3],
+                )
+
+
+def main(paths: list[str], color: str, delta_rank: int, repeat: int):
+    for path in paths:
+        img = Image.open(path).convert('RGBA')
+
+        loop_img = img.copy()
+        loop_time = min(
+            timeit.repeat(
+                lambda: loop_change_color(loop_img.copy(), '#000000', color, delta_rank), number=1, repeat=repeat
+            )
+        )
+        loop_change_color(loop_img, '#000000', color, delta_rank)
+
+        band_time = min(
+            timeit.repeat(
+                lambda: StandardInput._change_color(img, '#000000', color, delta_rank), number=1, repeat=repeat
+            )
+        )
+        band_img = StandardInput._change_color(img, '#000000', color, delta_rank)
+
+        # the outputs only agree on gray pixels, see above
+        red, green, blue, alpha = ImageChops.difference(loop_img, band_img).split()
+        difference = ImageChops.lighter(ImageChops.lighter(red, green), ImageChops.lighter(blue, alpha))
+        changed = img.width * img.height - difference.histogram()[0]
+        print(
+            f'{path} ({img.width}x{img.height}): loop {loop_time * 1000:.1f} ms, '
+            f'bands {band_time * 1000:.2f} ms, {loop_time / band_time:.0f}x faster, '
+            f'{changed} of {img.width * img.height} pixels differ'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('paths', nargs='*', default=['src/png/it-glue.png', 'src/png/webroot.png'])
+    parser.add_argument('--color', default='#ffffff', help='color to recolor to')
+    parser.add_argument('--delta-rank', type=int, default=10, help='per-channel color tolerance')
+    parser.add_argument('--repeat', type=int, default=5, help='number of timing runs')
+    main(**parser.parse_args().__dict__)
@@ -0,0 +1,82 @@
+"""Compare direct resizing against chained resampling over a size ladder.
+
+Run from the repository root with `python -m benchmarks.resample [--ratio R]`.
+"""
+import argparse
+import time
+from pathlib import Path
+
+from PIL import ImageChops, ImageStat
+
+from icons import input_provider, output_provider, source_provider
+
+LADDER = [512, 256, 192, 152, 144, 128, 96, 72, 64, 48, 32, 16]
+# the folder the paths of the outputs are generated in, though nothing is written to it
+OUTPUT_FOLDER = Path('output')
+
+
+def render_ladder(source, image_path, output_config: dict) -> tuple[dict, float]:
+    # use a fresh input for every run, so nothing is cached between them
+    input_ = input_provider.get({'path': image_path, 'source': source, 'format': source.format})
+    output = output_provider.get(output_config, base_path=OUTPUT_FOLDER)
+
+    start = time.perf_counter()
+    images = {}
+    for target_size, core_size in output.generate_sizes():
+        img = input_.ingest(color=output.color)
+        try:
+            images[target_size], _ = output.generate(img, input_, target_size, core_size)
+        except ValueError:
+            continue
+    return images, time.perf_counter() - start
+
+
+def main(source_folder: Path, ratio: float, repeat: int):
+    source = source_provider.get({'type': 'folder', 'path': 'png', 'format': 'png'}, base_path=source_folder)
+
+    output_config = {
+        'format': 'png',
+        'sizes': LADDER,
+        'color': '#ffffff',
+        'background': '#000000',
+        'margin': '18%',
+    }
+
+    total_direct = total_chained = 0
+    worst_max_diff = worst_mean_diff = 0
+    for image_path in sorted(source.get()):
+        direct_time = chained_time = float('inf')
+        for _ in range(repeat):
+            direct, elapsed = render_ladder(source, image_path, output_config)
+            direct_time = min(direct_time, elapsed)
+            chained, elapsed = render_ladder(source, image_path, output_config | {'resample-chain': ratio})
+            chained_time = min(chained_time, elapsed)
+        total_direct += direct_time
+        total_chained += chained_time
+
+        # compare every size, per channel, in 0-255 levels
+        max_diff = mean_diff = 0
+        for target_size, img in direct.items():
+            difference = ImageChops.difference(img, chained[target_size])
+            max_diff = max(max_diff, *(high for _, high in difference.getextrema()))
+            mean_diff = max(mean_diff, *ImageStat.Stat(difference).mean)
+
+        print(
+            f'{image_path.name:>20}: direct {direct_time * 1000:6.1f} ms, chained {chained_time * 1000:6.1f} ms, '
+            f'max diff {max_diff:3d}, worst mean diff {mean_diff:.3f}'
+        )
+        worst_max_diff = max(worst_max_diff, max_diff)
+        worst_mean_diff = max(worst_mean_diff, mean_diff)
+
+    print(
+        f'{"total":>20}: direct {total_direct * 1000:6.1f} ms, chained {total_chained * 1000:6.1f} ms, '
+        f'max diff {worst_max_diff:3d}, worst mean diff {worst_mean_diff:.3f}'
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--source-folder', type=Path, default=Path('src'), help='path to source folder')
+    parser.add_argument('--ratio', type=float, default=3.0, help='minimum intermediate to target size ratio')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing runs')
+    main(**parser.parse_args().__dict__)
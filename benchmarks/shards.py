@@ -0,0 +1,112 @@
+"""Build a generated corpus in shards, as separate processes like separate CI agents, and merge them.
+
+The merged output folder is compared file by file against an unsharded build of the same config, and merging
+without one of the shards is checked to fail. Run from the repository root with
+`python -m benchmarks.shards [--shards N] [--count N]`.
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from icons.manifest import BuildManifest
+
+from .corpus import generate_png_corpus, write_config
+
+
+def build(config_path: Path, source_folder: Path, output_folder: Path, jobs: int, *args: str) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, 'build.py', '-c', config_path, '-s', source_folder, '-o', output_folder, '-j', str(jobs)]
+        + list(args),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def wait(process: subprocess.Popen) -> None:
+    _, stderr = process.communicate()
+    if process.returncode:
+        raise RuntimeError(f'{" ".join(map(str, process.args))} failed:\n{stderr}')
+
+
+def main(shards: int, count: int, jobs: int):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        generate_png_corpus(temp_dir / 'src' / 'png', count, size=256)
+        config_path = write_config(
+            temp_dir / 'icons-config.yaml',
+            [
+                {
+                    'type': 'folder',
+                    'path': 'png',
+                    'format': 'png',
+                    'outputs': [
+                        {'directory-override': 'white'},
+                        {'directory-override': 'red', 'color': '#ff0000', 'resample-chain': True},
+                        {'directory-override': 'ico', 'format': 'ico', 'sizes': [16, 32, 48]},
+                        {'directory-override': 'sprites', 'format': 'sprite'},
+                    ],
+                }
+            ],
+            output_defaults={'sizes': [256, 128, 64, 32]},
+        )
+        source_folder = temp_dir / 'src'
+
+        start = time.perf_counter()
+        wait(build(config_path, source_folder, temp_dir / 'full', jobs * shards))
+        full_time = time.perf_counter() - start
+
+        # run every shard at once, each with its share of the workers, as they would on separate agents
+        start = time.perf_counter()
+        shard_folders = [temp_dir / f'shard-{index}' for index in range(1, shards + 1)]
+        processes = [
+            build(config_path, source_folder, shard_folder, jobs, '--shard', f'{index}/{shards}')
+            for index, shard_folder in enumerate(shard_folders, 1)
+        ]
+        for process in processes:
+            wait(process)
+        sharded_time = time.perf_counter() - start
+        sizes = [len(BuildManifest.load(shard_folder).entries) for shard_folder in shard_folders]
+
+        start = time.perf_counter()
+        wait(build(config_path, source_folder, temp_dir / 'merged', jobs, '--merge', *shard_folders))
+        merge_time = time.perf_counter() - start
+
+        print(f'{count} images, {shards} shards of {", ".join(map(str, sizes))} files')
+        print(f'unsharded build: {full_time:6.2f} s with {jobs * shards} workers')
+        print(f'  sharded build: {sharded_time:6.2f} s with {jobs} workers per shard, {merge_time:.2f} s to merge')
+
+        # the merged folder should hold exactly the files of the unsharded build, with the same contents
+        full = BuildManifest.load(temp_dir / 'full').entries
+        merged = BuildManifest.load(temp_dir / 'merged').entries
+        different = sorted(
+            path
+            for path in full.keys() | merged.keys()
+            if full.get(path, {}).get('hash') != merged.get(path, {}).get('hash')
+        )
+        on_disk = sorted(
+            path.relative_to(temp_dir / 'merged').as_posix()
+            for path in (temp_dir / 'merged').rglob('*')
+            if path.is_file() and not path.name.startswith('.')
+        )
+        print(f'{len(merged)} merged files, {len(different)} different from the unsharded build')
+        if different or on_disk != sorted(merged):
+            sys.exit(f'The merged build differs from the unsharded build: {", ".join(different[:10])}')
+
+        # merging without a shard must fail, rather than silently leave its outputs out
+        process = build(config_path, source_folder, temp_dir / 'incomplete', jobs, '--merge', *shard_folders[1:])
+        _, stderr = process.communicate()
+        if process.returncode == 0:
+            sys.exit('Merging without the first shard succeeded')
+        print(f'merging without shard 1/{shards} failed as expected: {stderr.strip().splitlines()[1].strip()}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=3, help='number of shards')
+    parser.add_argument('--count', type=int, default=60, help='number of generated images')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of workers per shard')
+    main(**parser.parse_args().__dict__)
@@ -0,0 +1,118 @@
+"""Measure the cold start of the build, with the providers importing implementations lazily and eagerly.
+
+The eager case imports every implementation module up front, like the package did before the providers
+imported them on first use. Modules that can't be imported here, e.g. cairosvg without the cairo library, are
+skipped. Run from the repository root with `python -m benchmarks.startup`.
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from importlib import import_module
+
+LAZY_MODULES = ('build',)
+EAGER_MODULES = (
+    'build',
+    'icons.sources',
+    'icons.inputs',
+    'icons.svg',
+    'icons.outputs',
+    'icons.renderer',
+    'cairosvg',
+    'requests',
+)
+
+
+def _import(modules):
+    for module in modules:
+        import_module(module)
+
+
+def _noop(_):
+    return os.getpid()
+
+
+def import_error(module: str) -> str | None:
+    """Import a module in a fresh interpreter, returning the last line of the error if it fails."""
+    result = subprocess.run([sys.executable, '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode:
+        return (result.stderr.strip().splitlines() or ['unknown error'])[-1]
+    return None
+
+
+def import_times(modules: tuple[str, ...]) -> list[tuple[int, str]]:
+    """Import the modules in a fresh interpreter and get the cumulative import time of each module in µs."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {", ".join(modules)}'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.removeprefix('import time:').split('|')
+        # only keep top-level imports, since they include the time of everything they import
+        if not name.startswith('  '):
+            times.append((int(cumulative), name.strip()))
+    return times
+
+
+def cold_start(modules: tuple[str, ...], repeat: int) -> float:
+    """Get the fastest of several runs of a fresh interpreter importing the modules, in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', f'import {", ".join(modules)}'], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def spawn_pool(modules: tuple[str, ...], processes: int) -> float:
+    """Get the time to start a pool of spawned workers that import the modules, in seconds."""
+    start = time.perf_counter()
+    with multiprocessing.get_context('spawn').Pool(processes, initializer=_import, initargs=(modules,)) as pool:
+        # wait for every worker to finish starting
+        pool.map(_noop, range(processes * 4), chunksize=1)
+    return time.perf_counter() - start
+
+
+def main(repeat: int, jobs: int):
+    processes = jobs or os.cpu_count() or 1
+    # modules that can't be imported here, e.g. cairosvg without the cairo library, are left out of both
+    eager_modules = []
+    for module in EAGER_MODULES:
+        error = import_error(module)
+        if error:
+            print(f'{module} is unavailable ({error}), skipping it')
+        else:
+            eager_modules.append(module)
+
+    for name, modules in (('eager', tuple(eager_modules)), ('lazy', LAZY_MODULES)):
+        times = import_times(modules)
+        slowest = sorted(times, reverse=True)[:5]
+        print(f'{name:>5}: {sum(cumulative for cumulative, _ in times) / 1000:.0f} ms of imports')
+        for cumulative, module in slowest:
+            print(f'         {cumulative / 1000:7.1f} ms  {module}')
+        print(f'         {cold_start(modules, repeat) * 1000:7.0f} ms to start an interpreter and import everything')
+        print(f'         {spawn_pool(modules, processes) * 1000:7.0f} ms to spawn {processes} workers')
+
+    result = subprocess.run(
+        [sys.executable, '-c', f'import sys, {", ".join(LAZY_MODULES)}; print(*sys.modules)'],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = set(result.stdout.split())
+    for module in ('PIL.Image', 'cairosvg', 'requests'):
+        print(f'{module} is {"" if module in imported else "not "}imported by the build at startup')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5, help='number of cold starts to take the fastest of')
+    parser.add_argument('-j', '--jobs', type=int, help='number of workers to spawn, defaults to the CPU count')
+    main(**parser.parse_args().__dict__)
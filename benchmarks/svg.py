@@ -0,0 +1,205 @@
+"""Compare the fast rasterizer against cairosvg, in speed and in the pixels they render.
+
+The rasterizer is only used by sources that set `fast-rasterizer: true`, and this reports whether it's faster
+for the documents given. Every document is rendered at each size by both and timed, with how many times faster
+the rasterizer is (below 1 when it's slower), and documents the rasterizer renders more than `--max-diff`
+levels away from cairosvg in any pixel are reported, with a non-zero exit code. Documents the rasterizer
+doesn't support are listed, since they're rendered with cairosvg. Without cairosvg, only the rasterizer is
+timed. Edge cases of path data, e.g. arcs, relative commands, implicit commands after a move and the evenodd
+rule, are compared too, and the rasterizer must render each the same as an equivalent document without it.
+Degenerate ones, e.g. polygons without area or coordinates too large to scale, must render or fall back to
+cairosvg without raising anything else. Malformed path data is checked to be rejected, rather than parsed
+forever. Run from the repository root with `python -m benchmarks.svg [--count N]`.
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from PIL import ImageChops, ImageStat
+
+from icons import input_provider, source_provider
+from icons.rasterizer import Unsupported, parse_svg
+
+from .corpus import generate_svg_corpus
+
+SIZES = [16, 32, 64, 128, 256, 512]
+COLOR = '#1e90ff'
+# path data the rasterizer must reject, so the documents fall back to cairosvg
+INVALID_PATHS = [
+    'M0 0 L10 0 L10 10 Z 5 5',
+    'm0 0 l10 0 l0 10 z 5',
+    'M0 0 L10',
+    'M0 0 A5 5 0 2 1 10 10',
+]
+# documents whose path data uses less common commands or degenerate values, by name, compared against cairosvg
+EDGE_CASES = {
+    'arc-circle': '<path d="M4 12 A8 8 0 0 1 20 12 A8 8 0 0 1 4 12 Z"/>',
+    'arc-flags': '<path d="M3 12 A9 6 30 1 0 21 12 A4 4 0 0 1 3 12 Z"/>',
+    'relative': '<path d="m4 4 h16 v16 h-16 z"/>',
+    'implicit': '<path d="M4 4 20 4 20 20 4 20 z"/>',
+    'implicit-relative': '<path d="m4 4 16 0 0 16 -16 0 z"/>',
+    'evenodd': '<path fill-rule="evenodd" d="M2 2 H22 V22 H2 Z M7 7 H17 V17 H7 Z"/>',
+    'horizontal-path': '<path d="M0 5 L10 5 L20 5 Z"/><rect x="4" y="8" width="16" height="8"/>',
+    'horizontal-polygon': '<polygon points="0,5 10,5 20,5"/><rect x="4" y="8" width="16" height="8"/>',
+    'non-finite': '<path d="M0 0 L1e400 5 L3 8 Z"/><rect x="4" y="8" width="16" height="8"/>',
+}
+# edge cases the rasterizer must render like an equivalent document without them
+EQUIVALENTS = {
+    'arc-circle': '<circle cx="12" cy="12" r="8"/>',
+    'relative': '<rect x="4" y="4" width="16" height="16"/>',
+    'implicit': '<path d="M4 4 L20 4 L20 20 L4 20 Z"/>',
+    'implicit-relative': '<path d="M4 4 L20 4 L20 20 L4 20 Z"/>',
+    'evenodd': '<path d="M2 2 H22 V22 H2 Z M7 7 V17 H17 V7 Z"/>',
+    'horizontal-path': '<rect x="4" y="8" width="16" height="8"/>',
+    'horizontal-polygon': '<rect x="4" y="8" width="16" height="8"/>',
+}
+
+
+def _document(body: str) -> str:
+    return f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 24 24">{body}</svg>'
+
+
+def check_edge_cases(max_diff: int) -> list[str]:
+    """Render each edge case with the rasterizer, returning those that fail or differ from their equivalent.
+
+    Edge cases may be unsupported, since they're rendered with cairosvg then, but must not raise anything else.
+    """
+    failed = []
+    for name, body in EDGE_CASES.items():
+        try:
+            shape = parse_svg(_document(body).encode())
+            masks = {size: shape.mask(size) for size in SIZES}
+        except Unsupported:
+            continue
+        except Exception as e:
+            failed.append(f'{name} ({type(e).__name__}: {e})')
+            continue
+        if name not in EQUIVALENTS:
+            continue
+
+        expected = parse_svg(_document(EQUIVALENTS[name]).encode())
+        for size, mask in masks.items():
+            difference = ImageChops.difference(mask, expected.mask(size))
+            if difference.getextrema()[1] > max_diff:
+                failed.append(f'{name} at {size} px')
+                break
+    return failed
+
+
+def check_invalid_paths(timeout: float = 1.0) -> list[str]:
+    """Parse each invalid path, returning those that weren't rejected within the timeout."""
+    failed = []
+    for data in INVALID_PATHS:
+        document = f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 16 16"><path d="{data}"/></svg>'
+        result = []
+
+        def parse():
+            try:
+                parse_svg(document.encode())
+            except Unsupported:
+                result.append(True)
+
+        # a daemon thread, so a parser stuck in a loop doesn't keep the benchmark from exiting
+        thread = threading.Thread(target=parse, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        if not result:
+            failed.append(data)
+    return failed
+
+
+def render(source, image_path: Path, fast: bool) -> tuple[dict, float]:
+    # use a fresh input for every run, so nothing is cached between them
+    input_ = input_provider.get({'path': image_path, 'source': source, 'format': 'svg', 'fast-rasterizer': fast})
+    start = time.perf_counter()
+    images = {size: input_.ingest(size=size, color=COLOR) for size in SIZES}
+    return images, time.perf_counter() - start
+
+
+def main(source_folder: Path, count: int, max_diff: int, repeat: int):
+    try:
+        import cairosvg  # noqa: F401
+    except (ImportError, OSError) as e:
+        print(f'cairosvg is unavailable ({str(e).splitlines()[0]}), only timing the rasterizer')
+        has_cairo = False
+    else:
+        has_cairo = True
+
+    invalid = check_invalid_paths()
+    if invalid:
+        print(f'{len(invalid)} invalid paths were not rejected: {"; ".join(invalid)}')
+        sys.exit(1)
+    different = check_edge_cases(max_diff)
+    if different:
+        print(f'{len(different)} edge cases failed or differ from their equivalents: {", ".join(different)}')
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generate_svg_corpus(Path(temp_dir) / 'svg', count)
+        (Path(temp_dir) / 'edge').mkdir()
+        for name, body in EDGE_CASES.items():
+            (Path(temp_dir) / 'edge' / f'{name}.svg').write_text(_document(body))
+        folders = [(source_folder, 'svg'), (Path(temp_dir), 'svg'), (Path(temp_dir), 'edge')]
+
+        total_fast = total_cairo = 0
+        # the documents the rasterizer renders faster than cairosvg, of those both rendered
+        faster = compared = 0
+        failed = []
+        for base_path, folder in folders:
+            source = source_provider.get({'type': 'folder', 'path': folder, 'format': 'svg'}, base_path=base_path)
+            for image_path in sorted(source.get()):
+                input_config = {'path': image_path, 'source': source, 'format': 'svg', 'fast-rasterizer': True}
+                if input_provider.get(input_config).shape is None:
+                    print(f'{image_path.name:>30}: unsupported, rendered with cairosvg')
+                    continue
+
+                fast_time = cairo_time = float('inf')
+                for _ in range(repeat):
+                    fast, elapsed = render(source, image_path, fast=True)
+                    fast_time = min(fast_time, elapsed)
+                    if has_cairo:
+                        cairo, elapsed = render(source, image_path, fast=False)
+                        cairo_time = min(cairo_time, elapsed)
+                total_fast += fast_time
+                if not has_cairo:
+                    print(f'{image_path.name:>30}: rasterizer {fast_time * 1000:6.1f} ms')
+                    continue
+                total_cairo += cairo_time
+                compared += 1
+                faster += fast_time < cairo_time
+
+                # compare every size, per channel, in 0-255 levels
+                worst = mean = 0
+                for size, img in fast.items():
+                    difference = ImageChops.difference(img, cairo[size])
+                    worst = max(worst, *(high for _, high in difference.getextrema()))
+                    mean = max(mean, *ImageStat.Stat(difference).mean)
+                if worst > max_diff:
+                    failed.append(image_path.name)
+                print(
+                    f'{image_path.name:>30}: rasterizer {fast_time * 1000:6.1f} ms, cairosvg {cairo_time * 1000:6.1f} '
+                    f'ms, {cairo_time / fast_time:5.2f}x, max diff {worst:3d}, worst mean diff {mean:.3f}'
+                )
+
+    if has_cairo:
+        print(
+            f'{"total":>30}: rasterizer {total_fast * 1000:6.1f} ms, cairosvg {total_cairo * 1000:6.1f} ms, '
+            f'{total_cairo / total_fast:5.2f}x, rasterizer faster for {faster} of {compared} documents'
+        )
+    else:
+        print(f'{"total":>30}: rasterizer {total_fast * 1000:6.1f} ms, cairosvg unavailable, nothing to compare to')
+    if failed:
+        print(f'{len(failed)} documents differ from cairosvg by more than {max_diff} levels: {", ".join(failed)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--source-folder', type=Path, default=Path('src'), help='path to source folder')
+    parser.add_argument('--count', type=int, default=20, help='number of generated documents to compare')
+    parser.add_argument('--max-diff', type=int, default=8, help='largest difference allowed in any pixel')
+    parser.add_argument('--repeat', type=int, default=3, help='number of timing runs')
+    main(**parser.parse_args().__dict__)
@@ -1,27 +1,91 @@
+import argparse
+import cProfile
+import json
 import logging
+import mmap
 import multiprocessing
+import os
 import tempfile
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from itertools import chain
+from multiprocessing.util import Finalize
 from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
 
-import yaml
+from icons import input_provider, output_provider
+from icons.config import ConfigError, load_config
+from icons.downloads import fetch_sources
+from icons.files import LINK_MODES, link_file, write_atomic
+from icons.manifest import BuildManifest, hash_bytes, output_key
+from icons.memory import parse_size, peak_rss, plan_memory
+from icons.metrics import metrics
+from icons.prefetch import Prefetcher
+from icons.scheduler import (
+    BuildContext,
+    BuildJob,
+    PackJob,
+    batch_jobs,
+    chunk_size,
+    expand_jobs,
+    image_jobs,
+    is_selected,
+    load_context,
+    sheet_jobs,
+)
+from icons.shards import Shard, ShardError, merge_shards, save_shard, select_jobs
+from icons.watch import POLL_INTERVAL, Changes, diff, file_stamp, snapshot
 
-from icons import source_provider, input_provider, output_provider
+if TYPE_CHECKING:
+    # the outputs import Pillow, which is only needed once a build starts
+    from icons.outputs import BaseOutput
 
 
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.WARNING)
+# the icons package logs through its own logger, which follows the level of this one
+PACKAGE_LOGGER = logging.getLogger('icons')
+PACKAGE_LOGGER.setLevel(logging.WARNING)
 # set up console logging
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
 
 # disable debug logging for other packages
 logging.getLogger('PIL').setLevel(logging.INFO)
 logging.getLogger('requests').setLevel(logging.INFO)
+logging.getLogger('urllib3').setLevel(logging.INFO)
 
 
 # defaults
 SOURCE_FOLDER = Path('source')
 OUTPUT_FOLDER = Path('output')
 TEMP_FOLDER = Path(tempfile.gettempdir())
+# the number of inputs each worker keeps loaded, so jobs for the same image share ingested images
+CACHED_INPUTS = 8
+# the number of threads each worker encodes and writes images on, while it renders the next ones
+WRITER_THREADS = 2
+# the number of rendered images each worker holds while they wait to be written, before it stops rendering
+PENDING_WRITES = 16
+# the number of source files each worker reads ahead of the job using them, on as many threads
+PREFETCH = 4
+
+# per-process state set up by init_worker()
+_worker_state = {}
+
+
+class WorkerOptions(NamedTuple):
+    """Settings every worker is set up with."""
+
+    writer_threads: int = WRITER_THREADS
+    pending_writes: int = PENDING_WRITES
+    # whether workers check if cached inputs changed on disk before reusing them
+    revalidate: bool = False
+    # the cheapest way to give a shared render's file to the other outputs, see LINK_MODES
+    link_mode: str = LINK_MODES[0]
+    # options passed to every input the workers load, e.g. the size of its render cache
+    input_options: dict = None
+    prefetch: int = PREFETCH
 
 
 def main(
@@ -29,99 +93,763 @@ def main(
     source_folder: str | Path = SOURCE_FOLDER,
     output_folder: str | Path = OUTPUT_FOLDER,
     single_processing: bool = False,
+    incremental: bool = False,
+    jobs: int = None,
+    writer_threads: int = WRITER_THREADS,
+    profile: bool = False,
+    metrics_out: str | Path = None,
+    cprofile_out: str | Path = None,
+    watch: bool = False,
+    poll_interval: float = POLL_INTERVAL,
+    link_mode: str = LINK_MODES[0],
+    max_memory: str | int = None,
+    shard: Shard = None,
+    merge: list[str | Path] = None,
+    prefetch: int = PREFETCH,
 ):
-    # configure providers with base paths
-    source_provider.base_path = Path(source_folder)
-    # set the base_path for the output_provider down below instead of here to avoid multiprocessing issues
+    # collect per-stage metrics from every process when asked to report them
+    metrics.configure(enabled=bool(profile or metrics_out), trace=bool(metrics_out))
 
     # open the icons-config.yaml file
-    with open(config, 'r') as f:
-        icon_config = yaml.safe_load(f)
-
-    for source_config in icon_config['sources']:
-        # combine the default config with the source config
-        defaulted_source_config = icon_config['source-defaults'] | source_config
-        LOGGER.debug('Processing source config: %s', defaulted_source_config)
-        source = source_provider.get(defaulted_source_config)
-
-        # use multiprocessing to speed up generation
-        if not single_processing:
-            with multiprocessing.Pool() as pool:
-                pool.starmap(
-                    process_input,
-                    (
-                        (defaulted_source_config, source, image_path, icon_config['output-defaults'], output_folder)
-                        for image_path in source.get()
-                    ),
-                )
-        else:
-            for image_path in source.get():
-                process_input(
-                    defaulted_source_config, source, image_path, icon_config['output-defaults'], output_folder
-                )
+    with metrics.time('load_config'):
+        icon_config = load_config(config)
 
+    # load the manifest of the previous build, skipping outputs that are unchanged when building incrementally
+    manifest = BuildManifest.load(output_folder)
 
-def process_input(defaulted_source_config, source, image_path, output_config_defaults, output_folder):
-    output_provider.base_path = Path(output_folder)
-    LOGGER.debug('Found %s image: %s', source.format, image_path)
+    # expand the whole config up front, so a single pool can balance the work across every source
+    context = load_context(icon_config, source_folder)
+    # download every url source in parallel before any rendering starts
+    with metrics.time('fetch'):
+        fetch_sources(context.sources)
+    with metrics.time('enumerate'):
+        build_jobs = list(expand_jobs(context))
 
-    # pass input as a dict since that's what the builder expects
-    input_ = input_provider.get({'path': image_path, 'source': source, 'format': source.format})
+    # combine the output folders of every shard instead of building
+    if merge:
+        merged = merge_shards(context, build_jobs, merge, output_folder, link_mode)
+        print(f'Merged {len(merged.entries)} outputs from {len(merge)} shards into {output_folder}')
+        return
+    # build a disjoint slice of the jobs, which every shard of the build computes the same way
+    if shard:
+        build_jobs, units = select_jobs(context, build_jobs, shard)
+        LOGGER.info('Building %s jobs for %s images of shard %s', len(build_jobs), len(units), shard)
+    LOGGER.debug('Scheduling %s jobs', len(build_jobs))
+    # outputs that generate the same image share a job, so count the renders that sharing saved
+    saved = sum(len(build_job.duplicates) for build_job in build_jobs if isinstance(build_job, BuildJob))
+    metrics.count('renders_saved', saved)
 
-    for output_config in defaulted_source_config['outputs']:
-        defaulted_output_config = output_config_defaults | output_config
+    # use multiprocessing to speed up generation
+    processes = None if single_processing else jobs or os.cpu_count() or 1
+    # workers only check whether cached inputs changed on disk when watching
+    options = WorkerOptions(writer_threads=writer_threads, revalidate=watch, link_mode=link_mode, prefetch=prefetch)
+    if max_memory:
+        max_size = max((size for configs in context.output_configs for config in configs for size in config['sizes']))
+        plan = plan_memory(parse_size(max_memory), processes or 1, CACHED_INPUTS, max_size)
+        if processes:
+            processes = plan.processes
+        LOGGER.info(
+            'Planned %s workers with %s cached pixels per input and %s pending writes for a %.0f MiB memory budget',
+            processes or 1,
+            plan.max_cached_pixels,
+            plan.pending_writes,
+            parse_size(max_memory) / 1024**2,
+        )
+        # map large files instead of reading them, except when watching, since editors may truncate them
+        input_options = {'max-cached-pixels': plan.max_cached_pixels, 'memory-map': not watch}
+        options = options._replace(pending_writes=plan.pending_writes, input_options=input_options)
 
-        # skip output if image not specified by any selectors
-        selectors = defaulted_output_config.get('selectors')
-        if selectors and selectors != '*' and input_.path.with_suffix('').name not in selectors:
-            LOGGER.debug('Skipping output %s for %s since it is not in selectors', defaulted_output_config, input_.path)
-            continue
+    with JobRunner(output_folder, processes, options, cprofile_out) as runner:
+        with metrics.time('render'):
+            runner.start(context, manifest if incremental else None)
+            entries = runner.run(build_jobs)
+        metrics.peak('peak_rss_main', peak_rss())
 
-        LOGGER.debug('Applying output config: %s', defaulted_output_config)
-        output = output_provider.get(defaulted_output_config)
+        # remove outputs whose sources or output configs no longer exist
+        if incremental:
+            for path in manifest.prune(entries):
+                LOGGER.info('Removed stale output %s', path)
+        else:
+            manifest.entries = entries
+        manifest.save()
+        if shard:
+            save_shard(output_folder, shard, context, units)
 
-        for target_size, core_size in output.generate_sizes():
-            LOGGER.debug('Generating %s px image with a %s px core', target_size, core_size)
-            kwargs = {'color': output.color}
-            if input_.is_vector:
-                kwargs['size'] = core_size
-            input_image = input_.ingest(**kwargs)
+        if saved:
+            print(f'Saved {saved} renders by sharing them between outputs that generate identical images')
+        if profile:
+            print(metrics.summary())
+        if metrics_out:
+            with open(metrics_out, 'w') as f:
+                json.dump(metrics.to_trace(), f)
+            LOGGER.info('Wrote metrics to %s, which can be opened in chrome://tracing or Perfetto', metrics_out)
 
-            # input_image will always be available, so ignore the warning
+        if watch:
             try:
-                # noinspection PyUnboundLocalVariable
-                output_image, output_path = output.generate(
-                    img=input_image, input=input_, target_size=target_size, core_size=core_size
-                )
+                watch_changes(config, source_folder, runner, context, manifest, poll_interval)
+            except KeyboardInterrupt:
+                # the workers were interrupted too, so don't wait for them
+                runner.close(terminate=True)
+
+
+class JobRunner:
+    """Runs jobs in a pool of workers, or in this process, keeping the workers around between runs.
+
+    Args:
+        output_folder (str | Path): The folder to write outputs to.
+        processes (int): The number of worker processes, or None to run jobs in this process.
+        options (WorkerOptions): The settings to set up each worker with.
+        cprofile_out (str | Path): If set, the path to write cProfile stats for one worker to.
+    """
+
+    def __init__(
+        self,
+        output_folder: str | Path,
+        processes: int = None,
+        options: WorkerOptions = WorkerOptions(),
+        cprofile_out: str | Path = None,
+    ):
+        self.output_folder = output_folder
+        self.processes = processes
+        self.options = options
+        self.cprofile_out = cprofile_out
+        self.pool = None
+        self.profiler = cProfile.Profile() if cprofile_out and not processes else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # don't wait on the workers if the build failed or was interrupted
+        self.close(terminate=exc_type is not None)
+
+    def start(self, context: BuildContext, manifest: BuildManifest = None) -> None:
+        """Set up the workers for a context, replacing any workers set up for a previous one.
+
+        Args:
+            context (BuildContext): The context to resolve jobs against.
+            manifest (BuildManifest): If set, the manifest of the previous build to skip unchanged outputs with.
+        """
+        # the context and manifest are sent once per worker, so jobs only need to carry indexes and paths
+        worker_args = (context, self.output_folder, manifest, self.options)
+        self.context = context
 
-            except ValueError as e:
-                LOGGER.warning(f'{str(e)}, skipping %s px image for %s.', target_size, input_.path)
+        if not self.processes:
+            close_worker()
+            init_worker(*worker_args)
+            return
+
+        self.close()
+        # a worker that fails to set up is replaced by the pool forever, so fail once here instead
+        build_outputs(context, self.output_folder)
+        if self.cprofile_out:
+            # the first worker to create the stats file is profiled, so one left by an earlier run must go
+            Path(self.cprofile_out).unlink(missing_ok=True)
+        initargs = worker_args + (metrics.enabled, metrics.trace, self.cprofile_out)
+        self.pool = multiprocessing.Pool(self.processes, initializer=init_worker, initargs=initargs)
+
+    def run(self, build_jobs: list[BuildJob], force: bool = False) -> dict[str, dict]:
+        """Render the images for the jobs, merging the workers' metrics into this process.
+
+        Args:
+            build_jobs (list[BuildJob]): The jobs to run.
+            force (bool): Whether to render every job, even if the manifest says its output is current.
+
+        Returns:
+            dict[str, dict]: The manifest entries for the jobs.
+        """
+        entries = {}
+        if not self.processes:
+            if self.profiler:
+                self.profiler.enable()
+            result, snapshot = process_batch(build_jobs, force)
+            if self.profiler:
+                self.profiler.disable()
+            entries.update(result)
+            # batches drain the metrics of the process they run in, which is this one
+            metrics.merge(snapshot)
+            return entries
+
+        batches = batch_jobs(build_jobs, chunk_size(len(build_jobs), self.processes))
+        for result, snapshot in self.pool.imap_unordered(partial(process_batch, force=force), batches):
+            entries.update(result)
+            metrics.merge(snapshot)
+        return entries
+
+    def close(self, terminate: bool = False) -> None:
+        if self.pool is not None:
+            if terminate:
+                self.pool.terminate()
+            else:
+                # let the workers exit cleanly, so the profiled worker can write its stats
+                self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if not self.processes:
+            close_worker()
+            if self.profiler:
+                self.profiler.dump_stats(self.cprofile_out)
+
+
+def watch_changes(
+    config: str | Path,
+    source_folder: str | Path,
+    runner: JobRunner,
+    context: BuildContext,
+    manifest: BuildManifest,
+    poll_interval: float = POLL_INTERVAL,
+) -> None:
+    """Rebuild the outputs affected by each change to the config or the source images, until interrupted.
+
+    Args:
+        config (str | Path): The path to the config file.
+        source_folder (str | Path): The folder source paths are relative to.
+        runner (JobRunner): The runner the initial build used, already started for the context.
+        context (BuildContext): The context of the initial build.
+        manifest (BuildManifest): The manifest of the initial build, kept up to date with each rebuild.
+        poll_interval (float): The number of seconds between checks for changes.
+    """
+    config_stamp = file_stamp(config)
+    stamps = snapshot(context)
+    print(f'Watching {config} and {len(stamps)} source images for changes, press Ctrl+C to stop')
+
+    while True:
+        time.sleep(poll_interval)
+        try:
+            new_config_stamp = file_stamp(config)
+            if new_config_stamp != config_stamp:
+                # remember the edit even if it fails, so a broken config is only reported once
+                config_stamp = new_config_stamp
+                context = rebuild_config(config, source_folder, runner, context, manifest)
+                stamps = snapshot(context)
                 continue
 
-            # save the generated image
-            LOGGER.info('Saving generated image to %s', output_path)
-            # ensure parent path folder has been created
-            output_path.parent.mkdir(parents=True, exist_ok=True)
-            output_image.save(output_path, format=output.format)
+            new_stamps = snapshot(context)
+            changes = diff(stamps, new_stamps)
+            if changes:
+                rebuild_images(runner, context, manifest, changes, new_stamps)
+            # only accept the snapshot once its images are built, so failed images are retried
+            stamps = new_stamps
+
+        except Exception as e:
+            # keep watching, since the file is usually still being edited
+            LOGGER.error('Rebuild failed: %s', e, exc_info=LOGGER.isEnabledFor(logging.DEBUG))
+
+
+def rebuild_images(
+    runner: JobRunner, context: BuildContext, manifest: BuildManifest, changes: Changes, stamps: dict
+) -> None:
+    """Rebuild every output of the changed images, and delete the outputs of removed ones.
+
+    Outputs that pack every image of a source into shared files are rebuilt if any image they select changed.
+    """
+    start = time.perf_counter()
+    build_jobs = [
+        build_job
+        for source_index, image_path in sorted(changes.changed)
+        for build_job in image_jobs(context, source_index, image_path)
+    ]
+    for source_index in {source_index for source_index, _ in changes.changed | changes.removed}:
+        touched_paths = [path for index, path in changes.changed | changes.removed if index == source_index]
+        image_paths = [path for index, path in stamps if index == source_index]
+        for pack_job in sheet_jobs(context, source_index, image_paths):
+            names = context.selectors[source_index][pack_job.output_index]
+            if any(is_selected(names, path) for path in touched_paths):
+                build_jobs.append(pack_job)
+    # the images changed on disk, so their outputs are stale no matter what the manifest says
+    entries = runner.run(build_jobs, force=True)
+
+    touched = {str(image_path) for _, image_path in changes.changed | changes.removed}
+    keep = {path: entry for path, entry in manifest.entries.items() if entry['source'] not in touched}
+    for path in manifest.prune(keep | entries):
+        LOGGER.info('Removed stale output %s', path)
+    manifest.save()
+
+    print(
+        f'Rebuilt {len(entries)} outputs for {len(changes.changed)} changed and {len(changes.removed)} removed '
+        f'images in {time.perf_counter() - start:.2f} s'
+    )
+
+
+def rebuild_config(
+    config: str | Path, source_folder: str | Path, runner: JobRunner, context: BuildContext, manifest: BuildManifest
+):
+    """Rebuild the outputs whose source or output config changed, and delete the outputs no longer configured.
+
+    Returns:
+        BuildContext: The context for the new config.
+    """
+    start = time.perf_counter()
+    new_context = load_context(load_config(config), source_folder)
+    fetch_sources(new_context.sources)
+
+    old_keys = set(chain.from_iterable(context.config_keys))
+    new_keys = set(chain.from_iterable(new_context.config_keys))
+    if old_keys == new_keys:
+        LOGGER.info('No outputs are affected by the config change')
+        return context
+
+    # only outputs whose defaulted source and output config changed need building
+    build_jobs = [
+        build_job
+        for build_job in expand_jobs(new_context)
+        if any(
+            new_context.config_keys[build_job.source_index][output_index] not in old_keys
+            for output_index in build_job.output_indexes
+        )
+    ]
+    # the workers hold the old context, so restart them with the new one
+    runner.start(new_context, manifest)
+    entries = runner.run(build_jobs)
+
+    keep = {path: entry for path, entry in manifest.entries.items() if entry.get('config') in new_keys}
+    for path in manifest.prune(keep | entries):
+        LOGGER.info('Removed stale output %s', path)
+    manifest.save()
+
+    print(f'Checked {len(build_jobs)} outputs affected by the config change in {time.perf_counter() - start:.2f} s')
+    return new_context
+
+
+def init_worker(
+    context: BuildContext,
+    output_folder,
+    manifest=None,
+    options=WorkerOptions(),
+    profile=None,
+    trace=False,
+    cprofile_out=None,
+):
+    _worker_state['context'] = context
+    _worker_state['manifest'] = manifest
+    _worker_state['output_manifest'] = manifest or BuildManifest(output_folder)
+    _worker_state['inputs'] = OrderedDict()
+    _worker_state['options'] = options
+    _worker_state['writer'] = ThreadPoolExecutor(max_workers=options.writer_threads, thread_name_prefix='writer')
+    _worker_state['reader'] = (
+        ThreadPoolExecutor(max_workers=options.prefetch, thread_name_prefix='reader') if options.prefetch else None
+    )
+    # folders already created by this worker, so each one is only created once
+    _worker_state['created_folders'] = set()
+
+    # build the outputs once per worker instead of once per job
+    _worker_state['outputs'] = build_outputs(context, output_folder)
+
+    # metrics are already configured when running in the main process
+    if profile is not None:
+        metrics.configure(enabled=profile, trace=trace)
+    if cprofile_out:
+        _profile_first_worker(cprofile_out)
+
+
+def build_outputs(context: BuildContext, output_folder) -> list[list['BaseOutput']]:
+    """Build the outputs of every source in a context, with the plans compiled with the config.
+
+    Raises:
+        ValueError: If an output can't be built, e.g. since Pillow lacks its codec.
+    """
+    return [
+        [
+            output_provider.get(output_config | {'plan': plan}, base_path=output_folder)
+            for output_config, plan in zip(output_configs, plans)
+        ]
+        for output_configs, plans in zip(context.output_configs, context.plans)
+    ]
+
+
+def close_worker():
+    """Wait for the writes of the worker set up in this process, if any."""
+    writer = _worker_state.pop('writer', None)
+    if writer is not None:
+        writer.shutdown()
+    reader = _worker_state.pop('reader', None)
+    if reader is not None:
+        reader.shutdown(cancel_futures=True)
+
+
+def _profile_first_worker(cprofile_out):
+    # the first worker to create the stats file is profiled, the rest are left alone
+    try:
+        open(cprofile_out, 'x').close()
+    except FileExistsError:
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    def dump():
+        profiler.disable()
+        profiler.dump_stats(cprofile_out)
+
+    # finalizers run when a pool worker exits cleanly
+    Finalize(profiler, dump, exitpriority=10)
+
+
+def get_input(source_index: int, image_path: Path):
+    """Get the input for an image, reusing it if the worker loaded it for a recent job."""
+    inputs = _worker_state['inputs']
+    context = _worker_state['context']
+    source = context.sources[source_index]
+    input_key = (source_index, image_path)
+
+    # when watching, the image may have changed on disk since it was cached
+    stamp = source.stamp(image_path) if _worker_state['options'].revalidate else None
+    cached = inputs.get(input_key)
+    if cached is not None and cached[0] == stamp:
+        inputs.move_to_end(input_key)
+        return cached[1]
+
+    # pass input as a dict since that's what the builder expects
+    with metrics.time('load', path=image_path):
+        input_ = input_provider.get(
+            {'path': image_path, 'source': source, 'format': source.format}
+            | context.input_configs[source_index]
+            | (_worker_state['options'].input_options or {})
+        )
+    metrics.count('inputs_loaded')
+    prefetcher = _worker_state.get('prefetcher')
+    byte_string = prefetcher.take(input_key) if prefetcher is not None else None
+    if byte_string is not None:
+        input_.preload(byte_string)
+
+    inputs[input_key] = (stamp, input_)
+    if len(inputs) > CACHED_INPUTS:
+        inputs.popitem(last=False)
+    return input_
+
+
+def read_image(input_key: tuple[int, Path]) -> bytes | mmap.mmap:
+    """Load the contents of an image the way its input would, on a reader thread."""
+    source_index, image_path = input_key
+    memory_map = (_worker_state['options'].input_options or {}).get('memory-map', False)
+    byte_string = _worker_state['context'].sources[source_index].load(image_path, memory_map)
+    # mapped files are only read when they're decoded, so ask the OS to read them now instead
+    if isinstance(byte_string, mmap.mmap) and hasattr(byte_string, 'madvise'):
+        byte_string.madvise(mmap.MADV_WILLNEED)
+    return byte_string
+
+
+def release_input(source_index: int, image_path: Path) -> None:
+    """Drop an input's loaded file and cached renders once the batch has no more jobs for it."""
+    cached = _worker_state['inputs'].pop((source_index, image_path), None)
+    if cached is not None:
+        cached[1].release()
+        metrics.count('inputs_released')
+
+
+def process_batch(build_jobs: list[BuildJob | PackJob], force: bool = False) -> tuple[dict[str, dict], dict | None]:
+    """Render the images for a batch of jobs, encoding and saving each one while the next is rendered.
+
+    Args:
+        build_jobs (list[BuildJob | PackJob]): The jobs to render.
+        force (bool): Whether to render every job, even if the manifest says its output is current.
+
+    Returns:
+        tuple[dict[str, dict], dict | None]: The manifest entries for the jobs, and a snapshot of
+            the worker's metrics if profiling.
+    """
+    # the last job in the batch that uses each input, so the input can be released right after it
+    last_jobs = {
+        (build_job.source_index, image_path): index
+        for index, build_job in enumerate(build_jobs)
+        for image_path in job_image_paths(build_job)
+    }
+
+    # read the images the worker hasn't loaded yet in the order the jobs use them, while the jobs render
+    reader = _worker_state['reader']
+    if reader is not None:
+        image_keys = [input_key for input_key in last_jobs if input_key not in _worker_state['inputs']]
+        _worker_state['prefetcher'] = Prefetcher(reader, read_image, image_keys, _worker_state['options'].prefetch)
+
+    entries = {}
+    pending = deque()
+    pending_writes = _worker_state['options'].pending_writes
+    for index, build_job in enumerate(build_jobs):
+        if isinstance(build_job, PackJob):
+            with metrics.time('pack_job', images=len(build_job.image_paths)):
+                result = process_pack_job(build_job, force)
+        else:
+            with metrics.time('job', path=build_job.image_path, size=build_job.target_size):
+                result = process_job(build_job, force)
+        metrics.count('jobs')
+
+        if isinstance(result, Future):
+            pending.append(result)
+        else:
+            entries.update(result)
+        # bound the rendered images waiting to be written, by waiting for the oldest one
+        while len(pending) > pending_writes:
+            with metrics.time('wait_for_writes'):
+                entries.update(pending.popleft().result())
+
+        for image_path in job_image_paths(build_job):
+            if last_jobs[(build_job.source_index, image_path)] == index:
+                release_input(build_job.source_index, image_path)
+
+    prefetcher = _worker_state.pop('prefetcher', None)
+    if prefetcher is not None:
+        prefetcher.close()
+
+    # wait for the writer threads to finish the batch
+    with metrics.time('wait_for_writes'):
+        while pending:
+            entries.update(pending.popleft().result())
+    metrics.peak('peak_rss_worker', peak_rss())
+    return entries, metrics.drain()
+
+
+def job_image_paths(build_job: BuildJob | PackJob) -> tuple[Path, ...]:
+    return build_job.image_paths if isinstance(build_job, PackJob) else (build_job.image_path,)
+
+
+def process_job(build_job: BuildJob, force: bool = False) -> dict[str, dict] | Future:
+    """Render the image for a job, and queue it to be encoded and saved.
+
+    Returns:
+        dict[str, dict] | Future: The manifest entries for the job, or a future for them if the image
+            is being written.
+    """
+    manifest = _worker_state['manifest']
+    output_manifest = _worker_state['output_manifest']
+    input_ = get_input(build_job.source_index, build_job.image_path)
+    target_size = build_job.target_size
+    context = _worker_state['context']
+
+    # the job's output renders the image, and outputs that generate the same image get a copy of its file
+    destinations = {}
+    for output_index in build_job.output_indexes:
+        output_config = context.output_configs[build_job.source_index][output_index]
+        output_path = _worker_state['outputs'][build_job.source_index][output_index].generate_path(input_, target_size)
+        with metrics.time('hash'):
+            key = output_key(input_.content_hash, output_config, target_size)
+        # the config key lets watch mode find the outputs of configs that didn't change
+        config = context.config_keys[build_job.source_index][output_index]
+        entry = {'key': key, 'source': str(input_.path), 'config': config}
+        destinations.setdefault(output_path, (output_manifest.relative(output_path), entry))
+
+    # skip sizes that were already built from the same source bytes and output config
+    if (
+        not force
+        and manifest is not None
+        and all(manifest.is_current(output_path, entry['key']) for output_path, (_, entry) in destinations.items())
+    ):
+        LOGGER.debug('Skipping unchanged %s px image for %s', target_size, input_.path)
+        metrics.count('skipped')
+        return {
+            relative_path: manifest.entries[relative_path] | {'config': entry['config']}
+            for relative_path, entry in destinations.values()
+        }
+
+    output = _worker_state['outputs'][build_job.source_index][build_job.output_index]
+    LOGGER.debug('Applying output config: %s', context.output_configs[build_job.source_index][build_job.output_index])
+    output_image = render_image(input_, output, target_size)
+    if output_image is None:
+        return {}
+
+    return _worker_state['writer'].submit(write_output, output, output_image, destinations)
+
+
+def process_pack_job(pack_job: PackJob, force: bool = False) -> dict[str, dict] | Future:
+    """Render every size of the job's images in memory, and queue them to be packed and saved.
+
+    Returns:
+        dict[str, dict] | Future: The manifest entries for the packed files, or a future for them if the
+            files are being written.
+    """
+    manifest = _worker_state['manifest']
+    output_manifest = _worker_state['output_manifest']
+    context = _worker_state['context']
+    output_config = context.output_configs[pack_job.source_index][pack_job.output_index]
+    output = _worker_state['outputs'][pack_job.source_index][pack_job.output_index]
+    config = context.config_keys[pack_job.source_index][pack_job.output_index]
+    inputs = [get_input(pack_job.source_index, image_path) for image_path in pack_job.image_paths]
+
+    # the packed files depend on every image and size in them, so they share a key
+    output_paths = output.pack_paths(inputs)
+    relative_paths = [output_manifest.relative(output_path) for output_path in output_paths]
+    with metrics.time('hash'):
+        key = hash_bytes(
+            *(
+                output_key(input_.content_hash, output_config, target_size)
+                for input_ in inputs
+                for target_size in output.target_sizes
+            )
+        )
+    if not force and manifest is not None and all(manifest.is_current(path, key) for path in output_paths):
+        LOGGER.debug('Skipping unchanged %s', ', '.join(relative_paths))
+        metrics.count('skipped')
+        return {path: manifest.entries[path] | {'config': config} for path in relative_paths}
+
+    # render each image and size once, largest first so chained resampling can reuse them
+    renders = {}
+    for input_ in inputs:
+        renders[input_] = {}
+        for target_size in sorted(output.target_sizes, reverse=True):
+            output_image = render_image(input_, output, target_size)
+            if output_image is not None:
+                renders[input_][target_size] = output_image
+
+    source = inputs[0].path if len(inputs) == 1 else context.sources[pack_job.source_index]
+    entry = {'key': key, 'source': str(source), 'config': config}
+    return _worker_state['writer'].submit(write_pack, output, renders, entry)
+
+
+def render_image(input_, output, target_size: int):
+    """Render one size of an output for an input, or None if the input can't be rendered at that size."""
+    core_size = output.plan.core_size(target_size)
+    LOGGER.debug('Generating %s px image with a %s px core', target_size, core_size)
+    with metrics.time('ingest', size=core_size, color=output.color):
+        input_image = output.ingest(input_, core_size)
+
+    try:
+        output_image, _ = output.generate(img=input_image, input=input_, target_size=target_size, core_size=core_size)
+
+    except ValueError as e:
+        LOGGER.warning(f'{str(e)}, skipping %s px image for %s.', target_size, input_.path)
+        metrics.count('failed')
+        return None
+
+    return output_image
+
+
+def write_output(output, output_image, destinations: dict[Path, tuple[str, dict]]) -> dict[str, dict]:
+    # encode the generated image in memory so it can be hashed for the manifest
+    with metrics.time('encode', format=output.format):
+        data = output.encode(output_image)
+    data_hash = hash_bytes(data)
+
+    # write the file once, and link every other destination to it
+    entries = {}
+    first_path = None
+    for output_path, (relative_path, entry) in destinations.items():
+        if first_path is None:
+            write_file(output_path, data)
+            first_path = output_path
+        else:
+            link_output(first_path, output_path)
+        entries[relative_path] = entry | {'hash': data_hash}
+    return entries
+
+
+def write_pack(output, renders: dict, entry: dict) -> dict[str, dict]:
+    with metrics.time('pack', format=output.format):
+        files = output.pack(renders)
+
+    output_manifest = _worker_state['output_manifest']
+    entries = {}
+    for output_path, data in files.items():
+        write_file(output_path, data)
+        entries[output_manifest.relative(output_path)] = entry | {'hash': hash_bytes(data)}
+    return entries
+
+
+def size_argument(value: str) -> int:
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def shard_argument(value: str) -> Shard:
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def write_file(output_path: Path, data: bytes) -> None:
+    # save the generated image
+    LOGGER.info('Saving generated image to %s', output_path)
+    with metrics.time('write'):
+        ensure_folder(output_path.parent)
+        write_atomic(output_path, data)
+    metrics.count('bytes_written', len(data))
+
+
+def link_output(source_path: Path, output_path: Path) -> None:
+    LOGGER.info('Linking %s to %s', output_path, source_path)
+    with metrics.time('link'):
+        ensure_folder(output_path.parent)
+        method = link_file(source_path, output_path, _worker_state['options'].link_mode)
+    metrics.count(f'linked_{method}')
+
+
+def ensure_folder(folder: Path) -> None:
+    # only create each folder once per worker
+    created_folders = _worker_state['created_folders']
+    if folder not in created_folders:
+        folder.mkdir(parents=True, exist_ok=True)
+        created_folders.add(folder)
 
 
 if __name__ == '__main__':
     # set up argument parsing
-    import argparse
-
     parser = argparse.ArgumentParser()
     parser.add_argument('-v', '--verbose', action='store_true', help='enable verbose logging')
     parser.add_argument('-d', '--debug', action='store_true', help='enable debug logging')
-    parser.add_argument('-S', '--single-processing', action='store_true', help='enable multiprocessing')
+    parser.add_argument('-S', '--single-processing', action='store_true', help='disable multiprocessing')
+    parser.add_argument('-j', '--jobs', type=int, help='number of worker processes, defaults to the CPU count')
+    parser.add_argument(
+        '--writer-threads', type=int, default=WRITER_THREADS, help='number of threads per worker encoding images'
+    )
     parser.add_argument('-c', '--config', default='icons-config.yaml', help='path to config file')
     parser.add_argument('-s', '--source-folder', default=SOURCE_FOLDER, help='path to source folder')
     parser.add_argument('-o', '--output-folder', default=OUTPUT_FOLDER, help='path to output folder')
+    parser.add_argument(
+        '-i', '--incremental', action='store_true', help='only rebuild outputs whose source or config changed'
+    )
+    parser.add_argument('-p', '--profile', action='store_true', help='print the time spent in each stage')
+    parser.add_argument('--metrics-out', help='path to write stage metrics to, in the Chrome trace event format')
+    parser.add_argument('--cprofile-out', help='path to write cProfile stats for one worker to')
+    parser.add_argument(
+        '-w', '--watch', action='store_true', help='keep running, rebuilding outputs when their sources change'
+    )
+    parser.add_argument(
+        '--link-mode',
+        choices=LINK_MODES,
+        default=LINK_MODES[0],
+        help='cheapest way to share a render between outputs that generate identical images, falling back to the next',
+    )
+    parser.add_argument(
+        '-m',
+        '--max-memory',
+        type=size_argument,
+        help='memory budget for the build, e.g. 4G, which limits the workers, their caches and pending writes',
+    )
+    parser.add_argument(
+        '--prefetch',
+        type=int,
+        default=PREFETCH,
+        help='number of source files each worker reads ahead of the jobs using them, 0 to read them when used',
+    )
+    parser.add_argument(
+        '--shard',
+        type=shard_argument,
+        help='only build shard i of N, e.g. 2/4, which is a stable slice of the images that other shards skip',
+    )
+    parser.add_argument(
+        '--merge',
+        nargs='+',
+        metavar='SHARD_FOLDER',
+        help='combine the output folders of every shard of the build into the output folder, checking them first',
+    )
+    parser.add_argument(
+        '--poll-interval', type=float, default=POLL_INTERVAL, help='seconds between checks for changes when watching'
+    )
 
     args = parser.parse_args().__dict__
+    if args['watch'] and (args['shard'] or args['merge']):
+        parser.error("--watch can't be combined with --shard or --merge")
+    if args['shard'] and args['merge']:
+        parser.error("--shard and --merge can't be combined")
     if args.pop('verbose'):
         LOGGER.setLevel(logging.INFO)
     if args.pop('debug'):
         LOGGER.setLevel(logging.DEBUG)
+    PACKAGE_LOGGER.setLevel(LOGGER.level)
 
     # run the main function
-    main(**args)
+    try:
+        main(**args)
+    except (ConfigError, ShardError) as e:
+        parser.exit(1, f'{e}\n')
@@ -1,5 +1,12 @@
-from icons.inputs import input_provider
-from icons.outputs import output_provider
-from icons.sources import source_provider
+from icons.providers import input_provider, output_provider, source_provider
 
-__all__ = ['source_provider', 'input_provider', 'output_provider']
+__all__ = ['source_provider', 'input_provider', 'output_provider', 'Renderer']
+
+
+def __getattr__(name):
+    # the renderer pulls in the config loader and every source, so only import it when it's used
+    if name == 'Renderer':
+        from icons.renderer import Renderer
+
+        return Renderer
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
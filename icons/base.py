@@ -1,3 +1,4 @@
+from importlib import import_module
 from pathlib import Path, PurePath
 
 
@@ -14,7 +15,7 @@ class Base:
             self.base_path.mkdir(parents=True, exist_ok=True)
 
     def __str__(self):
-        return self.__class__.__name__ + ' for ' + self.path
+        return f'{self.__class__.__name__} for {self.path}'
 
 
 class BaseBuilder:
@@ -36,6 +37,8 @@ class BaseBuilder:
 class BaseProvider:
     def __init__(self, base_path: str | Path = '', fallback_key: str = 'format', fallback_method='get'):
         self._builders = {}
+        # the modules that register the builders of keys, imported the first time one of their keys is used
+        self._modules = {}
         self.base_path = Path(base_path)
         self.fallback_key = fallback_key
         self.fallback_method = fallback_method
@@ -47,15 +50,40 @@ class BaseProvider:
         for key in keys:
             self._builders[key] = builder
 
-    def get(self, key: str, values: dict = None) -> Base:
+    def register_lazy(self, keys: str | list[str], module: str) -> None:
+        """Register the module that registers the builders for the keys, without importing it yet."""
+        if isinstance(keys, str):
+            keys = [keys]
+
+        for key in keys:
+            self._modules[key] = module
+
+    def keys(self) -> list[str]:
+        """Get every key with a registered builder, including those whose module isn't imported yet."""
+        return list(dict.fromkeys([*self._builders, *self._modules]))
+
+    def get_builder(self, key: str) -> BaseBuilder:
+        builder = self._builders.get(key)
+        if not builder and key in self._modules:
+            # importing the module registers its builders
+            import_module(self._modules[key])
+            builder = self._builders.get(key)
+        if not builder:
+            raise ValueError(f'No builder registered for type "{key}".')
+        return builder
+
+    def get_class(self, key: str) -> type:
+        """Get the class built for a key, without building it."""
+        return self.get_builder(key).build_class
+
+    def get(self, key: str, values: dict = None, base_path: str | Path = None) -> Base:
         if isinstance(key, dict):
             # assign "key" to values
             if values is None:
                 values = key
             key = getattr(key, self.fallback_method)(self.fallback_key)
 
-        builder = self._builders.get(key)
-        if not builder:
-            raise ValueError(f'No builder registered for type "{key}".')
+        builder = self.get_builder(key)
 
-        return builder(values, base_path=self.base_path)
+        # an explicit base path lets callers build objects without changing the provider's default
+        return builder(values, base_path=self.base_path if base_path is None else base_path)
@@ -0,0 +1,76 @@
+from collections import OrderedDict, namedtuple
+from typing import Callable, Hashable, Iterator
+
+from PIL import Image
+
+# 16 megapixels, or 64 MiB of RGBA data
+DEFAULT_MAX_PIXELS = 4096 * 4096
+
+RenderKey = namedtuple('RenderKey', ['color', 'size', 'margin', 'background'], defaults=(None, None, None, None))
+# alpha masks are shared by every color, so they're only keyed by size, and the chain ratio of resampled masks
+MaskKey = namedtuple('MaskKey', ['size', 'chain_ratio'], defaults=(None, None))
+
+
+class RenderCache:
+    """A least-recently-used cache of rendered images, bounded by the total number of cached pixels.
+
+    Cached images are shared between callers, so they must not be modified in place.
+    """
+
+    def __init__(self, max_pixels: int = DEFAULT_MAX_PIXELS):
+        self.max_pixels = max_pixels
+        self.pixels = 0
+        self.hits = 0
+        self.misses = 0
+        self._images = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._images
+
+    def __len__(self) -> int:
+        return len(self._images)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        # iterate over a copy, so callers can update the cache while iterating
+        return iter(list(self._images))
+
+    def get(self, key: Hashable) -> Image.Image | None:
+        img = self._images.get(key)
+        if img is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._images.move_to_end(key)
+        return img
+
+    def put(self, key: Hashable, img: Image.Image) -> None:
+        size = img.width * img.height
+        # don't let a single oversized image flush the rest of the cache
+        if size > self.max_pixels:
+            return
+
+        if key in self._images:
+            self.pixels -= self._pixels_of(self._images.pop(key))
+        self._images[key] = img
+        self.pixels += size
+
+        # evict the least recently used images until we're back within budget
+        while self.pixels > self.max_pixels:
+            _, evicted = self._images.popitem(last=False)
+            self.pixels -= self._pixels_of(evicted)
+
+    def get_or_render(self, key: Hashable, render: Callable[[], Image.Image]) -> Image.Image:
+        img = self.get(key)
+        if img is None:
+            img = render()
+            self.put(key, img)
+        return img
+
+    def clear(self) -> None:
+        self._images.clear()
+        self.pixels = 0
+
+    @staticmethod
+    def _pixels_of(img: Image.Image) -> int:
+        return img.width * img.height
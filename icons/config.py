@@ -0,0 +1,276 @@
+import inspect
+import re
+from functools import cache
+from pathlib import Path
+from typing import NamedTuple
+
+import yaml
+
+from .providers import input_provider, output_provider, source_provider
+
+# LibYAML parses several times faster than the pure Python loader, but PyYAML may be built without it
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# whole pixels, e.g. 8px, or a percentage of the size, e.g. 18%
+MARGIN_PATTERN = re.compile(r'^\s*(?:\d+\s*px|\d+(?:\.\d+)?\s*%)$')
+
+# source options that aren't passed to the source, but used to build its inputs and outputs
+SOURCE_OPTIONS = ('type', 'outputs', 'delta-rank', 'fast-rasterizer')
+# output options that aren't passed to the output, but used to schedule its jobs
+OUTPUT_OPTIONS = ('selectors',)
+# constructor arguments that are set by the build, not the config
+BUILD_OPTIONS = ('base-path', 'plan', 'source')
+
+
+class ConfigIssue(NamedTuple):
+    # the keys and indexes leading to the invalid value, e.g. ('sources', 0, 'outputs', 1, 'margin')
+    location: tuple[str | int, ...]
+    message: str
+    # the line of the config file the value is on, if known
+    line: int = None
+
+    def __str__(self):
+        line = f' (line {self.line})' if self.line else ''
+        return f'{_format_location(self.location)}{line}: {self.message}'
+
+
+class ConfigError(ValueError):
+    """Raised with every issue found in a config, so they can all be fixed at once."""
+
+    def __init__(self, issues: list[ConfigIssue]):
+        self.issues = issues
+        super().__init__('Invalid config:\n' + '\n'.join(f'  {issue}' for issue in issues))
+
+
+def load_config(config: str | Path) -> dict:
+    """Load and validate a config file.
+
+    Raises:
+        ConfigError: If the config is invalid, with the line of each issue.
+    """
+    with open(config, 'r') as f:
+        text = f.read()
+    icon_config = yaml.load(text, Loader=Loader)
+
+    issues = validate_config(icon_config)
+    if issues:
+        # only build the node tree, which is much slower than loading, to find the lines of invalid values
+        root = yaml.compose(text, Loader=Loader)
+        raise ConfigError([issue._replace(line=_find_line(root, issue.location)) for issue in issues])
+    return icon_config
+
+
+def check_config(icon_config: dict) -> None:
+    """Validate a parsed config, raising a ConfigError with every issue found."""
+    issues = validate_config(icon_config)
+    if issues:
+        raise ConfigError(issues)
+
+
+def validate_config(icon_config: dict) -> list[ConfigIssue]:
+    """Find every issue in a parsed config.
+
+    Values inherited from `source-defaults` or `output-defaults` are checked in every source or output that
+    uses them, and their issues are reported at the default.
+
+    Returns:
+        list[ConfigIssue]: The issues found, in the order they were found.
+    """
+    if not isinstance(icon_config, dict):
+        return [ConfigIssue((), 'must be a mapping')]
+
+    issues = []
+    # the first output writing each sprite sheet, keyed by its directory and name
+    sprite_sheets = {}
+    source_defaults = _mapping(icon_config, 'source-defaults', issues)
+    output_defaults = _mapping(icon_config, 'output-defaults', issues)
+    sources = icon_config.get('sources')
+    if not isinstance(sources, list) or not sources:
+        issues.append(ConfigIssue(('sources',), 'must be a non-empty list of sources'))
+        return issues
+
+    for source_index, source_config in enumerate(sources):
+        location = ('sources', source_index)
+        if not isinstance(source_config, dict):
+            issues.append(ConfigIssue(location, 'must be a mapping'))
+            continue
+        issues.extend(_validate_source(source_defaults | source_config, source_config, location))
+
+        outputs = (source_defaults | source_config).get('outputs')
+        if not isinstance(outputs, list) or not outputs:
+            issues.append(ConfigIssue((*location, 'outputs'), 'must be a non-empty list of outputs'))
+            continue
+        for output_index, output_config in enumerate(outputs):
+            output_location = (*location, 'outputs', output_index)
+            if not isinstance(output_config, dict):
+                issues.append(ConfigIssue(output_location, 'must be a mapping'))
+                continue
+            output = output_defaults | output_config
+            issues.extend(_validate_output(output, output_config, output_location))
+            if output.get('format') == 'sprite':
+                # sprite sheets and their maps are named after the output, not its images, so they can collide
+                sheet = (str(output.get('directory-override') or ''), str(output.get('file-prefix') or 'sprite'))
+                if sheet in sprite_sheets:
+                    issues.append(
+                        ConfigIssue(
+                            output_location,
+                            f'writes the same sprite sheet as {_format_location(sprite_sheets[sheet])}, '
+                            f'set a different file-prefix or directory-override',
+                        )
+                    )
+                else:
+                    sprite_sheets[sheet] = output_location
+
+    # report issues with a default once, even if every source or output inherits it
+    return list(dict.fromkeys(issues))
+
+
+def _mapping(icon_config: dict, key: str, issues: list[ConfigIssue]) -> dict:
+    value = icon_config.get(key) or {}
+    if not isinstance(value, dict):
+        issues.append(ConfigIssue((key,), 'must be a mapping'))
+        return {}
+    return value
+
+
+def _validate_source(config: dict, own_config: dict, location: tuple) -> list[ConfigIssue]:
+    issues = []
+
+    def report(key, message):
+        # values the source doesn't set itself come from the defaults
+        issues.append(ConfigIssue((*location, key) if key in own_config else ('source-defaults', key), message))
+
+    source_type = config.get('type')
+    if source_type not in source_provider.keys():
+        report('type', f'must be one of {", ".join(source_provider.keys())}')
+        source_class = None
+    else:
+        source_class = source_provider.get_class(source_type)
+    if config.get('format') not in input_provider.keys():
+        report('format', f'must be one of {", ".join(input_provider.keys())}')
+    if not isinstance(config.get('path'), str) or not config['path']:
+        report('path', 'must be a path')
+    if 'recurse' in config and not isinstance(config['recurse'], bool):
+        report('recurse', 'must be true or false')
+    if 'delta-rank' in config and not _is_int(config['delta-rank'], minimum=0):
+        report('delta-rank', 'must be a whole number of at least 0')
+    if 'fast-rasterizer' in config and not isinstance(config['fast-rasterizer'], bool):
+        report('fast-rasterizer', 'must be true or false')
+
+    if source_class is not None:
+        options = _options(source_class)
+        for key in config:
+            if key not in options and key not in SOURCE_OPTIONS:
+                report(key, f'is not an option of {source_type} sources')
+    return issues
+
+
+def _validate_output(config: dict, own_config: dict, location: tuple) -> list[ConfigIssue]:
+    # imported here, since they import Pillow, which isn't needed until a config is checked
+    from PIL.ImageColor import getrgb
+
+    from .outputs import get_core_image_size
+
+    issues = []
+
+    def report(key, message):
+        issues.append(ConfigIssue((*location, key) if key in own_config else ('output-defaults', key), message))
+
+    output_format = config.get('format')
+    if output_format not in output_provider.keys():
+        report('format', f'must be one of {", ".join(output_provider.keys())}')
+        output_class = None
+    else:
+        output_class = output_provider.get_class(output_format)
+
+    sizes = config.get('sizes')
+    if not isinstance(sizes, list) or not sizes or not all(_is_int(size, minimum=1) for size in sizes):
+        report('sizes', 'must be a non-empty list of sizes in pixels')
+        sizes = []
+
+    margin = config.get('margin')
+    if (
+        margin is not None
+        and not _is_int(margin, minimum=0)
+        and not (isinstance(margin, str) and MARGIN_PATTERN.match(margin))
+    ):
+        report('margin', 'must be a number of pixels, e.g. 8 or 8px, or a percentage, e.g. 18%')
+    elif margin:
+        too_small = [size for size in sizes if get_core_image_size(size, margin) < 1]
+        if too_small:
+            report('margin', f'leaves no room for the image at {", ".join(map(str, too_small))} px')
+
+    for key in ('color', 'background'):
+        value = config.get(key)
+        if value is None or (key == 'background' and value == 'transparent'):
+            continue
+        try:
+            getrgb(value)
+        except (ValueError, AttributeError):
+            report(key, f'{value!r} is not a color')
+
+    selectors = config.get('selectors')
+    if selectors not in (None, '*') and (
+        not isinstance(selectors, list) or not all(isinstance(selector, str) for selector in selectors)
+    ):
+        report('selectors', "must be '*' or a list of image names")
+    for key in ('directory-override', 'file-prefix'):
+        if config.get(key) is not None and not isinstance(config[key], str):
+            report(key, 'must be a string')
+    resample_chain = config.get('resample-chain')
+    if not isinstance(resample_chain, (bool, type(None))) and not (
+        isinstance(resample_chain, (int, float)) and resample_chain >= 1
+    ):
+        report('resample-chain', 'must be true, false or a ratio of at least 1')
+    if config.get('encoder') is not None and not isinstance(config['encoder'], dict):
+        report('encoder', 'must be a mapping of encoder options')
+
+    if output_class is not None:
+        options = _options(output_class)
+        for key in config:
+            if key not in options and key not in OUTPUT_OPTIONS:
+                report(key, f'is not an option of {output_format} outputs')
+        # options the output can't be built with here, e.g. sizes its files can't hold or a missing codec
+        for key, message in output_class.check_options(output_format, sizes).items():
+            report(key, message)
+    return issues
+
+
+@cache
+def _options(build_class: type) -> frozenset[str]:
+    """Get the config keys a class accepts, from the arguments of every constructor it inherits."""
+    options = set()
+    for cls in build_class.__mro__:
+        init = cls.__dict__.get('__init__')
+        if init is None:
+            continue
+        for parameter in inspect.signature(init).parameters.values():
+            if parameter.kind not in (parameter.VAR_KEYWORD, parameter.VAR_POSITIONAL) and parameter.name != 'self':
+                options.add(parameter.name.replace('_', '-'))
+    return frozenset(options.difference(BUILD_OPTIONS))
+
+
+def _format_location(location: tuple) -> str:
+    location = ''.join(f'[{part}]' if isinstance(part, int) else f'.{part}' for part in location)
+    return location.lstrip('.') or 'config'
+
+
+def _is_int(value, minimum: int) -> bool:
+    # YAML booleans are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+
+def _find_line(node: yaml.Node, location: tuple) -> int | None:
+    """Find the line of the value at a location, or of its closest parent that exists."""
+    line = node.start_mark.line + 1 if node is not None else None
+    for part in location:
+        if isinstance(node, yaml.MappingNode):
+            node = next((value for key, value in node.value if key.value == part), None)
+        elif isinstance(node, yaml.SequenceNode) and isinstance(part, int) and part < len(node.value):
+            node = node.value[part]
+        else:
+            node = None
+        if node is None:
+            break
+        line = node.start_mark.line + 1
+    return line
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path, PurePosixPath
+from typing import Iterable
+
+from .manifest import hash_bytes
+
+LOGGER = logging.getLogger(__name__)
+
+CACHE_FOLDER = Path(tempfile.gettempdir()) / 'icons-downloads'
+INDEX_NAME = 'index.json'
+# connect and read timeouts, in seconds
+TIMEOUT = (10, 60)
+CHUNK_SIZE = 1024 * 1024
+MAX_WORKERS = 8
+
+
+class Downloader:
+    """Downloads files into a local cache, revalidating cached files with their ETag or Last-Modified headers."""
+
+    def __init__(
+        self,
+        cache_folder: str | Path = CACHE_FOLDER,
+        session: 'requests.Session' = None,
+        timeout: float | tuple[float, float] = TIMEOUT,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.cache_folder = Path(cache_folder)
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self.max_workers = max_workers
+
+        # reuse connections across downloads, with enough of them for every fetching thread
+        if session is None:
+            # requests takes a while to import, so only import it once something is downloaded
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+        self._lock = threading.Lock()
+        self.index = self._load_index()
+
+    @property
+    def index_path(self) -> Path:
+        return self.cache_folder / INDEX_NAME
+
+    def path_for(self, url: str) -> Path:
+        # keep each url in a folder named by its hash, so files with the same name from different urls don't clash
+        return self.cache_folder / hash_bytes(url)[:16] / PurePosixPath(url).name
+
+    def fetch(self, url: str) -> Path:
+        """Download the url into the cache, unless the cached copy is still current.
+
+        Args:
+            url (str): The url to download.
+
+        Returns:
+            Path: The path of the cached file.
+        """
+        path = self.path_for(url)
+        path.parent.mkdir(exist_ok=True)
+
+        # ask the server to skip the body if our copy is still current
+        headers = {}
+        entry = self.index.get(url, {})
+        if path.exists():
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last-modified'):
+                headers['If-Modified-Since'] = entry['last-modified']
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == HTTPStatus.NOT_MODIFIED:
+                LOGGER.debug('Cached download of %s is current', url)
+                return path
+            response.raise_for_status()
+
+            # stream to a temporary file, then move it into place so an interrupted download is never used
+            LOGGER.info('Downloading %s', url)
+            partial_path = path.with_name(path.name + '.part')
+            with open(partial_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(partial_path, path)
+
+            entry = {
+                'etag': response.headers.get('ETag'),
+                'last-modified': response.headers.get('Last-Modified'),
+            }
+
+        with self._lock:
+            self.index[url] = entry
+            self._save_index()
+        return path
+
+    def fetch_all(self, urls: Iterable[str]) -> dict[str, Path]:
+        """Download the urls concurrently.
+
+        Args:
+            urls (Iterable[str]): The urls to download.
+
+        Returns:
+            dict[str, Path]: The cached file path for each url.
+        """
+        urls = list(dict.fromkeys(urls))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(urls, executor.map(self.fetch, urls)))
+
+    def _load_index(self) -> dict[str, dict]:
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self) -> None:
+        with open(self.index_path, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+
+
+def fetch_sources(sources: Iterable, downloader: Downloader = None) -> None:
+    """Download the files for every source that requires fetching, in parallel.
+
+    Args:
+        sources (Iterable[BaseSource]): The sources to fetch.
+        downloader (Downloader): The downloader to use, defaults to one using the shared cache folder.
+    """
+    sources = [source for source in sources if source.requires_fetching]
+    if not sources:
+        return
+
+    downloader = downloader or Downloader()
+    paths = downloader.fetch_all(source.url for source in sources)
+    for source in sources:
+        source.download_path = paths[source.url]
@@ -0,0 +1,76 @@
+import os
+import shutil
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # reflinks are only attempted on Linux
+    fcntl = None
+
+# the ioctl that clones a file's extents on copy-on-write file systems such as Btrfs and XFS, from linux/fs.h
+FICLONE = 0x40049409
+
+# ways to give a file a second path, from cheapest to most expensive
+LINK_MODES = ('hardlink', 'reflink', 'copy')
+
+
+def _temp_path(path: Path) -> Path:
+    # unique per thread, so writer threads and workers never share a temporary file
+    return path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+
+def _replace(path: Path, create) -> None:
+    # create the file next to its destination and move it into place, so readers never see a partial file,
+    # and files hardlinked to the old one keep their contents
+    temp_path = _temp_path(path)
+    try:
+        create(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Write the data to a path, replacing any existing file in a single step."""
+    _replace(path, lambda temp_path: temp_path.write_bytes(data))
+
+
+def _reflink(source: Path, destination: Path) -> None:
+    if fcntl is None:
+        raise OSError('Reflinks are not supported on this platform')
+    with open(source, 'rb') as source_file, open(destination, 'wb') as destination_file:
+        fcntl.ioctl(destination_file.fileno(), FICLONE, source_file.fileno())
+
+
+_LINKERS = {
+    'hardlink': os.link,
+    'reflink': _reflink,
+    'copy': shutil.copyfile,
+}
+
+
+def link_file(source: Path, destination: Path, mode: str = 'hardlink') -> str:
+    """Give the source file's contents a second path, as cheaply as the mode and file system allow.
+
+    Modes are tried from the given one to the most expensive, since hardlinks don't work across devices
+    and reflinks need a copy-on-write file system.
+
+    Args:
+        source (Path): The file to link.
+        destination (Path): The path to link it to, replacing any existing file.
+        mode (str): The cheapest mode to try, one of LINK_MODES.
+
+    Returns:
+        str: The mode that was used.
+    """
+    for method in LINK_MODES[LINK_MODES.index(mode) :]:
+        try:
+            _replace(destination, lambda temp_path: _LINKERS[method](source, temp_path))
+        except OSError:
+            if method == LINK_MODES[-1]:
+                raise
+            continue
+        return method
@@ -1,18 +1,26 @@
 import io
+import mmap
 from abc import abstractmethod
-from functools import partial
+from functools import cached_property, partial
 
-from PIL import Image
+from PIL import Image, ImageChops
 from PIL.ImageColor import getrgb
-from cairosvg.colors import color as cairo_color
-from cairosvg.parser import Tree
-from cairosvg.surface import PNGSurface
 
-from .base import BaseProvider, Base
+from .base import Base
+from .cache import DEFAULT_MAX_PIXELS, MaskKey, RenderCache, RenderKey
+from .manifest import hash_bytes
+from .providers import input_provider
 from .sources import BaseSource
 from .utils import register
 
 
+def fill_mask(mask: Image, color: str | tuple[int, int, int]) -> Image:
+    """Fill an alpha mask with a color, which is how every colored render of a maskable input is made."""
+    img = Image.new('RGBA', mask.size, getrgb(color)[:3] if isinstance(color, str) else color)
+    img.putalpha(mask)
+    return img
+
+
 # don't inherit from Base since we don't need path processing
 class BaseInput(Base):
     @property
@@ -20,138 +28,168 @@ class BaseInput(Base):
     def is_vector(self) -> bool:
         pass
 
-    def __init__(self, source: BaseSource, **kwargs):
+    def __init__(
+        self, source: BaseSource, max_cached_pixels: int = DEFAULT_MAX_PIXELS, memory_map: bool = False, **kwargs
+    ):
         self.source = source
         kwargs.setdefault('format', source.format)
         super().__init__(**kwargs)
+        self.memory_map = memory_map
 
-        # load the image as a byte string, so we only need to read the source file once
-        with open(self.path, 'rb') as f:
-            self.byte_string = f.read()
+        # renders are shared by every output that asks for the same variant of the image
+        self.render_cache = RenderCache(max_pixels=max_cached_pixels)
 
     def __str__(self):
         text = super().__str__()
         text += f' from {str(self.source)}'
         return text
 
+    @cached_property
+    def byte_string(self) -> bytes | mmap.mmap:
+        # load the image on first use, and only once, so inputs that are skipped are never read.
+        # Mapped files are paged in by the OS as they're decoded instead of being copied into memory
+        return self.source.load(self.path, self.memory_map)
+
+    def preload(self, byte_string: bytes | mmap.mmap) -> None:
+        """Use contents that were already loaded, e.g. by a prefetching thread, instead of loading them on first use."""
+        self.__dict__['byte_string'] = byte_string
+
+    @cached_property
+    def content_hash(self) -> str:
+        return hash_bytes(self.byte_string)
+
+    def release(self) -> None:
+        """Drop the loaded file and cached renders, which are loaded again if the input is used after."""
+        byte_string = self.__dict__.pop('byte_string', None)
+        if isinstance(byte_string, mmap.mmap):
+            byte_string.close()
+        self.render_cache.clear()
+        self.__dict__.pop('maskable', None)
+
+    @property
+    def maskable(self) -> bool:
+        """Whether the image in any color is its alpha mask filled with the color, so colors can share one mask."""
+        return False
+
+    def _open(self) -> io.BytesIO | mmap.mmap:
+        # mapped files can be read by Pillow as they are, without copying them into a BytesIO
+        byte_string = self.byte_string
+        if isinstance(byte_string, mmap.mmap):
+            byte_string.seek(0)
+            return byte_string
+        return io.BytesIO(byte_string)
+
+    def _ingest_cached(self, **kwargs) -> Image:
+        return self.render_cache.get_or_render(RenderKey(**kwargs), partial(self._render, **kwargs))
+
+    def _ingest_mask_cached(self, **kwargs) -> Image:
+        return self.render_cache.get_or_render(MaskKey(**kwargs), partial(self._render_mask, **kwargs))
+
+    @abstractmethod
+    def _render(self, **kwargs) -> Image:
+        pass
+
+    def _render_mask(self, **kwargs) -> Image:
+        raise NotImplementedError(f'{type(self).__name__} has no alpha mask')
+
 
 class BaseLossyInput(BaseInput):
     is_vector = False
 
-    @abstractmethod
     def ingest(self, color: str) -> Image:
+        return self._ingest_cached(color=color)
+
+    def ingest_mask(self) -> Image:
+        return self._ingest_mask_cached()
+
+    @abstractmethod
+    def _render(self, color: str) -> Image:
         pass
 
 
 class BaseLosslessInput(BaseInput):
     is_vector = True
 
-    @abstractmethod
     def ingest(self, size: int, color: str) -> Image:
+        return self._ingest_cached(size=size, color=color)
+
+    def ingest_mask(self, size: int) -> Image:
+        return self._ingest_mask_cached(size=size)
+
+    @abstractmethod
+    def _render(self, size: int, color: str) -> Image:
         pass
 
 
-input_provider = BaseProvider()
 register_input = partial(register, provider=input_provider)
 
 
 @register_input('png', 'jpg', 'jpeg')
 class StandardInput(BaseLossyInput):
-    def __init__(self, **kwargs):
-        self._cached_colorized_image = None
+    def __init__(self, delta_rank: int = 10, **kwargs):
+        self.delta_rank = delta_rank
         super().__init__(**kwargs)
 
-    def ingest(self, color: str):
-        # add a colored image cache since ingest() can be called multiple times
-        # without any change in output
-        if self._cached_colorized_image is None:
-            # create io.BytesIO object from the new byte string, then pass it to Pillow
-            img = Image.open(io.BytesIO(self.byte_string))
+    def _render(self, color: str):
+        if not color:
+            # pass a file-like object for the byte string to Pillow
+            img = Image.open(self._open())
 
-            # convert to RGBA if not already, then colorize
+            # convert to RGBA if not already
             if img.mode != 'RGBA':
                 img = img.convert('RGBA')
-            self._change_color(img, from_color='#000000', to_color=color)
+            return img
 
-            self._cached_colorized_image = img
+        if self.maskable:
+            return fill_mask(self.ingest_mask(), color)
 
-        return self._cached_colorized_image
+        # colorize the decoded image, which is cached under the uncolored key
+        return self._change_color(
+            self.ingest(color=None), from_color='#000000', to_color=color, delta_rank=self.delta_rank
+        )
 
-    @staticmethod
-    def _change_color(img: Image, from_color, to_color, delta_rank=10):
-        from_color = getrgb(from_color)
-        to_color = getrgb(to_color)
-
-        img_data = img.load()
-        for x in range(0, img.size[0]):
-            for y in range(0, img.size[1]):
-                r_delta = img_data[x, y][0] - from_color[0]
-                g_delta = img_data[x, y][0] - from_color[0]
-                b_delta = img_data[x, y][0] - from_color[0]
-                if abs(r_delta) <= delta_rank and abs(g_delta) <= delta_rank and abs(b_delta) <= delta_rank:
-                    img_data[x, y] = (
-                        to_color[0] + r_delta,
-                        to_color[1] + g_delta,
-                        to_color[2] + b_delta,
-                        img_data[x, y][3],
-                    )
-
-
-def specify_color(rgba_map, target_color: tuple[float] = None):
-    # fallback to input color if no target color is specified
-    if target_color is None:
-        return rgba_map
-
-    r, g, b, a = rgba_map
-    # only use the first 3 values of the target color to keep the current alpha channel
-    return target_color[:3] + (a,)
-
-
-@register_input('svg')
-class SvgInput(BaseLosslessInput):
-    def ingest(self, size, color):
-        kwargs = {}
-
-        # specify color settings as needed
-        if color:
-            kwargs['map_rgba'] = partial(specify_color, target_color=cairo_color(color))
-
-        # specify output size to scale the vector as needed
-        new_byte_string = self.convert(self.byte_string, output_width=size, output_height=size, **kwargs)
-        # create io.BytesIO object from the new byte string, then pass it to Pillow
-        return Image.open(io.BytesIO(new_byte_string))
+    def _render_mask(self) -> Image:
+        return self.ingest(color=None).getchannel('A')
+
+    @cached_property
+    def maskable(self) -> bool:
+        # recoloring keeps each pixel's offset from black, so it's only a fill of the mask if every visible pixel is
+        # black, as contributed images should be. Invisible pixels are dropped by the premultiplied resize anyway
+        *rgb_bands, alpha_band = self.ingest(color=None).split()
+        visible = alpha_band.point(lambda v: 255 if v else 0)
+        return all(ImageChops.darker(band, visible).getextrema()[1] == 0 for band in rgb_bands)
 
     @staticmethod
-    def convert(
-        bytestring=None,
-        *,
-        dpi=96,
-        parent_width=None,
-        parent_height=None,
-        scale=1,
-        unsafe=False,
-        background_color=None,
-        map_rgba=None,
-        map_image=None,
-        output_width=None,
-        output_height=None,
-        **kwargs,
-    ):
-        tree = Tree(bytestring=bytestring, unsafe=unsafe, **kwargs)
-        output = io.BytesIO()
-        instance = PNGSurface(
-            tree,
-            output,
-            dpi,
-            None,
-            parent_width,
-            parent_height,
-            scale,
-            output_width,
-            output_height,
-            background_color,
-            map_rgba=map_rgba,
-            map_image=map_image,
-        )
-        instance.finish()
-        return output.getvalue()
+    def _change_color(img: Image, from_color, to_color, delta_rank=10) -> Image:
+        """Shift every pixel within `delta_rank` of `from_color` towards `to_color`.
+
+        Each RGB channel is matched and shifted independently, keeping the pixel's offset
+        from `from_color` so anti-aliased edges retain their shading. The work is done
+        with Pillow band operations, so the image buffer is only walked in C.
+
+        Args:
+            img (Image): The RGBA image to recolor.
+            from_color (str): The color to replace.
+            to_color (str): The color to replace it with.
+            delta_rank (int): The maximum per-channel difference from `from_color` for a
+                pixel to be recolored.
+
+        Returns:
+            Image: A new, recolored RGBA image.
+        """
+        from_color = getrgb(from_color)[:3]
+        to_color = getrgb(to_color)[:3]
+
+        *rgb_bands, alpha_band = img.split()
+        shifted_bands = []
+        match_mask = None
+        for band, from_value, to_value in zip(rgb_bands, from_color, to_color):
+            # the lookup tables are only 256 entries, so the lambdas stay cheap
+            band_mask = band.point(lambda v, f=from_value: 255 if abs(v - f) <= delta_rank else 0)
+            match_mask = band_mask if match_mask is None else ImageChops.darker(match_mask, band_mask)
+            shifted_bands.append(band.point(lambda v, f=from_value, t=to_value: min(max(t + v - f, 0), 255)))
+
+        # only take the shifted values where every channel is within range
+        rgb = Image.composite(Image.merge('RGB', shifted_bands), Image.merge('RGB', rgb_bands), match_mask)
+        rgb.putalpha(alpha_band)
+        return rgb
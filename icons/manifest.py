@@ -0,0 +1,121 @@
+import hashlib
+import json
+from functools import cache
+from pathlib import Path
+
+MANIFEST_NAME = '.icons-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def hash_bytes(*parts: bytes | str) -> str:
+    """Generate a SHA-256 hex digest for the given parts.
+
+    Args:
+        *parts (bytes | str): The parts to hash, strings are UTF-8 encoded.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode()
+        # prefix each part with its length so parts can't bleed into each other
+        digest.update(len(part).to_bytes(8, 'little'))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+@cache
+def code_version() -> str:
+    """Generate a hash of the package source, so outputs are rebuilt whenever the code changes."""
+    package_path = Path(__file__).parent
+    return hash_bytes(*(path.read_bytes() for path in sorted(package_path.glob('*.py'))))
+
+
+def output_key(source_hash: str, output_config: dict, target_size: int) -> str:
+    """Generate the content address of a single output file.
+
+    Args:
+        source_hash (str): The hash of the source file's bytes.
+        output_config (dict): The defaulted output config.
+        target_size (int): The size of the output image.
+
+    Returns:
+        str: The key for the output.
+    """
+    # selectors only decide which images get the output, they don't change the image itself
+    config = {key: value for key, value in output_config.items() if key != 'selectors'}
+    config = json.dumps(config, sort_keys=True, default=str)
+    return hash_bytes(source_hash, config, str(target_size), code_version())
+
+
+def config_key(source_config: dict, output_config: dict) -> str:
+    """Generate a key for everything in the config that affects the outputs of one output config for one source.
+
+    Args:
+        source_config (dict): The defaulted source config, without its outputs.
+        output_config (dict): The defaulted output config.
+
+    Returns:
+        str: The key for the pair of configs.
+    """
+    return hash_bytes(
+        json.dumps(source_config, sort_keys=True, default=str), json.dumps(output_config, sort_keys=True, default=str)
+    )
+
+
+class BuildManifest:
+    """Maps each generated file, relative to the output folder, to the key it was built from and its hash."""
+
+    def __init__(self, output_folder: str | Path, entries: dict[str, dict] = None):
+        self.output_folder = Path(output_folder)
+        self.entries = entries if entries is not None else {}
+
+    @property
+    def path(self) -> Path:
+        return self.output_folder / MANIFEST_NAME
+
+    @classmethod
+    def load(cls, output_folder: str | Path) -> 'BuildManifest':
+        manifest = cls(output_folder)
+        try:
+            with open(manifest.path, 'r') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return manifest
+
+        # discard manifests written in an older format
+        if data.get('version') == MANIFEST_VERSION:
+            manifest.entries = data['entries']
+        return manifest
+
+    def save(self) -> None:
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'entries': self.entries}, f, indent=2, sort_keys=True)
+
+    def relative(self, output_path: Path) -> str:
+        return Path(output_path).relative_to(self.output_folder).as_posix()
+
+    def is_current(self, output_path: Path, key: str) -> bool:
+        entry = self.entries.get(self.relative(output_path))
+        return entry is not None and entry['key'] == key and Path(output_path).exists()
+
+    def prune(self, keep: dict[str, dict]) -> list[Path]:
+        """Replace the entries with `keep`, deleting any previously generated file that isn't in it.
+
+        Args:
+            keep (dict[str, dict]): The entries generated by the current run.
+
+        Returns:
+            list[Path]: The paths of the deleted files.
+        """
+        pruned = []
+        for relative_path in self.entries.keys() - keep.keys():
+            path = self.output_folder / relative_path
+            path.unlink(missing_ok=True)
+            pruned.append(path)
+
+        self.entries = dict(keep)
+        return pruned
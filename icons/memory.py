@@ -0,0 +1,85 @@
+import logging
+import re
+import sys
+from typing import NamedTuple
+
+try:
+    import resource
+except ImportError:
+    # peak memory isn't tracked on Windows
+    resource = None
+
+LOGGER = logging.getLogger(__name__)
+
+# rough resident memory of a process before it renders anything: the interpreter, Pillow and cairo
+PROCESS_BASELINE = 96 * 1024 * 1024
+# the least memory a worker is given for caching and in-flight images
+MIN_RENDER_MEMORY = 32 * 1024 * 1024
+# bytes per pixel of the RGBA images that are cached and written
+BYTES_PER_PIXEL = 4
+
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*$', re.IGNORECASE)
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+
+class MemoryPlan(NamedTuple):
+    """How a build splits a memory budget between its workers."""
+
+    processes: int
+    # the pixels each input may keep in its render cache
+    max_cached_pixels: int
+    # the rendered images each worker may hold while they wait to be written
+    pending_writes: int
+
+
+def parse_size(value: str | int) -> int:
+    """Parse a number of bytes, with an optional binary unit, e.g. `512M` or `4GiB`."""
+    if isinstance(value, int):
+        return value
+
+    match = SIZE_PATTERN.match(value)
+    if match is None:
+        raise ValueError(f'Invalid memory size: {value}')
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit.upper()])
+
+
+def plan_memory(max_memory: int, processes: int, cached_inputs: int, max_size: int) -> MemoryPlan:
+    """Split a memory budget between the main process and its workers.
+
+    Workers are dropped until each one has at least MIN_RENDER_MEMORY above its baseline. Half of what
+    each worker has left goes to the render caches of its cached inputs, and the other half to rendered
+    images waiting to be written. A budget too small for a single worker is exceeded with a warning, since
+    the build can't run with less.
+
+    Args:
+        max_memory (int): The budget for the whole build, in bytes.
+        processes (int): The number of workers wanted.
+        cached_inputs (int): The number of inputs each worker keeps loaded.
+        max_size (int): The largest size of any output, which bounds the size of a rendered image.
+
+    Returns:
+        MemoryPlan: The plan for the budget.
+    """
+    worker_memory = max_memory - PROCESS_BASELINE
+    if worker_memory < PROCESS_BASELINE + MIN_RENDER_MEMORY:
+        LOGGER.warning(
+            'A memory budget of %.0f MiB is too small for a single worker, the build needs at least %.0f MiB',
+            max_memory / 1024**2,
+            (2 * PROCESS_BASELINE + MIN_RENDER_MEMORY) / 1024**2,
+        )
+    processes = max(1, min(processes, worker_memory // (PROCESS_BASELINE + MIN_RENDER_MEMORY)))
+    render_memory = max(worker_memory // processes - PROCESS_BASELINE, MIN_RENDER_MEMORY)
+
+    max_cached_pixels = render_memory // 2 // cached_inputs // BYTES_PER_PIXEL
+    pending_writes = max(1, render_memory // 2 // (max_size * max_size * BYTES_PER_PIXEL))
+    return MemoryPlan(processes, max_cached_pixels, pending_writes)
+
+
+def peak_rss() -> int | None:
+    """Get the peak resident memory of the current process in bytes, or None if it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Collects stage timings, counters and, optionally, trace events for the current process.
+
+    Snapshots from other processes can be merged in, so the build can report on the whole
+    pool. While disabled, timing and counting are no-ops.
+    """
+
+    def __init__(self, enabled: bool = False, trace: bool = False):
+        self.enabled = enabled
+        self.trace = trace
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        # the highest value seen for each gauge, e.g. the peak memory of any worker
+        self.peaks = {}
+        self.events = []
+        # stages can be timed from writer threads as well as the main thread
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool, trace: bool = False) -> None:
+        # discard anything collected before, including metrics inherited by forked workers
+        self.enabled = enabled
+        self.trace = trace
+        self.reset()
+
+    def reset(self) -> None:
+        self.timings.clear()
+        self.calls.clear()
+        self.counters.clear()
+        self.peaks.clear()
+        self.events = []
+
+    @contextmanager
+    def time(self, stage: str, **args):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            with self._lock:
+                self.timings[stage] += duration / 1e9
+                self.calls[stage] += 1
+                if self.trace:
+                    # complete events in the Chrome trace event format, in microseconds
+                    self.events.append(
+                        {
+                            'name': stage,
+                            'ph': 'X',
+                            'ts': start / 1000,
+                            'dur': duration / 1000,
+                            'pid': os.getpid(),
+                            'tid': threading.get_ident(),
+                            'args': {key: str(value) for key, value in args.items()},
+                        }
+                    )
+
+    def count(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += value
+
+    def peak(self, name: str, value: int | None) -> None:
+        if self.enabled and value is not None:
+            with self._lock:
+                self.peaks[name] = max(self.peaks.get(name, value), value)
+
+    def drain(self) -> dict | None:
+        """Generate a snapshot of everything collected so far, and reset the collected metrics."""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            snapshot = self._snapshot()
+            self.reset()
+        return snapshot
+
+    def _snapshot(self) -> dict:
+        return {
+            'timings': dict(self.timings),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+            'peaks': dict(self.peaks),
+            'events': self.events,
+        }
+
+    def merge(self, snapshot: dict | None) -> None:
+        if not snapshot:
+            return
+
+        for stage, duration in snapshot['timings'].items():
+            self.timings[stage] += duration
+        for stage, calls in snapshot['calls'].items():
+            self.calls[stage] += calls
+        for name, value in snapshot['counters'].items():
+            self.counters[name] += value
+        for name, value in snapshot['peaks'].items():
+            self.peaks[name] = max(self.peaks.get(name, value), value)
+        self.events.extend(snapshot['events'])
+
+    def summary(self) -> str:
+        """Generate a table of the time spent in each stage, followed by the counters.
+
+        Stages can be nested, e.g. `job` includes `ingest`, and times from workers are summed,
+        so totals can add up to more than the wall-clock time.
+        """
+        lines = [f'{"stage":<16}{"calls":>10}{"total ms":>12}{"mean ms":>10}']
+        for stage, duration in sorted(self.timings.items(), key=lambda item: item[1], reverse=True):
+            calls = self.calls[stage]
+            lines.append(f'{stage:<16}{calls:>10}{duration * 1000:>12.1f}{duration * 1000 / calls:>10.2f}')
+
+        if self.counters:
+            lines.append('')
+            lines.extend(f'{name:<16}{value:>10}' for name, value in sorted(self.counters.items()))
+        if self.peaks:
+            # peaks are memory sizes in bytes
+            lines.append('')
+            lines.extend(f'{name:<16}{value / 2**20:>10.1f} MiB' for name, value in sorted(self.peaks.items()))
+        return '\n'.join(lines)
+
+    def to_trace(self) -> dict:
+        """Generate the collected metrics in the Chrome trace event format, with the totals as extra data."""
+        return {
+            'traceEvents': self.events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'timings': dict(self.timings),
+                'calls': dict(self.calls),
+                'counters': dict(self.counters),
+                'peaks': dict(self.peaks),
+            },
+        }
+
+
+# metrics for the current process, enabled by the build when profiling
+metrics = Metrics()
@@ -1,12 +1,25 @@
+import io
+import json
+import struct
+from abc import abstractmethod
+from dataclasses import dataclass
 from functools import partial
 from pathlib import Path
 
-from PIL import Image
+from PIL import Image, features
+from PIL.ImageColor import getrgb
 
-from .base import Base, BaseProvider
-from .inputs import BaseInput
+from .base import Base
+from .cache import MaskKey, RenderKey
+from .inputs import BaseInput, fill_mask
+from .metrics import metrics
+from .packing import shelf_pack
+from .providers import output_provider
 from .utils import register
 
+# intermediates must be at least this many times larger than the target to be resampled from
+DEFAULT_CHAIN_RATIO = 3.0
+
 
 def get_core_image_size(target_size: int, margin: int | str) -> int:
     """Generate the margin and image size for a given image size and margin.
@@ -49,7 +62,52 @@ def get_core_image_size(target_size: int, margin: int | str) -> int:
     raise ValueError(f'Invalid margin type: {type(margin)}')
 
 
+def parse_rgba(color: str | None) -> tuple[int, int, int, int] | None:
+    """Parse a color into an RGBA tuple, keeping None as it is."""
+    if color is None:
+        return None
+    if color == 'transparent':
+        return 0, 0, 0, 0
+    rgba = getrgb(color)
+    return rgba if len(rgba) == 4 else (*rgba, 255)
+
+
+@dataclass(frozen=True, slots=True)
+class SizePlan:
+    target: int
+    core: int
+
+
+@dataclass(frozen=True, slots=True)
+class OutputPlan:
+    """The sizes and colors of an output, computed once when the config is loaded instead of for every job."""
+
+    sizes: tuple[SizePlan, ...]
+    background: tuple[int, int, int, int] | None
+    color: tuple[int, int, int] | None = None
+
+    @classmethod
+    def compile(
+        cls, sizes: list[int], margin: int | str = None, background: str = None, color: str = None
+    ) -> 'OutputPlan':
+        return cls(
+            tuple(SizePlan(target_size, get_core_image_size(target_size, margin)) for target_size in sizes),
+            parse_rgba(background),
+            getrgb(color)[:3] if color else None,
+        )
+
+    def core_size(self, target_size: int) -> int:
+        # outputs have a handful of sizes, so a scan beats hashing
+        for size in self.sizes:
+            if size.target == target_size:
+                return size.core
+        raise KeyError(f'The output has no {target_size} px size')
+
+
 class BaseOutput(Base):
+    # how renders are grouped into files: None writes a file per image and size, see BasePackedOutput for the rest
+    packing = None
+
     def __init__(
         self,
         sizes: list[int],
@@ -58,31 +116,91 @@ class BaseOutput(Base):
         color: bool = None,
         background: str = None,
         margin: str = None,
+        resample_chain: bool | float = False,
+        encoder: dict = None,
+        plan: OutputPlan = None,
         **kwargs,
     ):
         super().__init__(**kwargs)
+        issues = self.check_options(self.format, sizes)
+        if issues:
+            raise ValueError('; '.join(issues.values()))
         self.directory_override = directory_override
         self.file_prefix = file_prefix
         self.target_sizes = sizes
         self.target_margin = margin
         self.color = color
         self.background = background
+        # builds pass the plan compiled with the config, so it's only compiled here for standalone outputs
+        self.plan = plan or OutputPlan.compile(sizes, margin, background, color)
+
+        # resample smaller sizes from cached intermediates instead of the full source image
+        if resample_chain is True:
+            resample_chain = DEFAULT_CHAIN_RATIO
+        self.chain_ratio = float(resample_chain) if resample_chain else None
+        self._background_canvases = {}
+
+        # options passed to Pillow when saving, with dashes in the keys converted to underscores
+        encoder = {key.replace('-', '_'): value for key, value in (encoder or {}).items()}
+        self.quantize = encoder.pop('quantize', None)
+        self.encoder_options = encoder
+
+    @classmethod
+    def check_options(cls, output_format: str, sizes: list[int]) -> dict[str, str]:
+        """Find the options an output of this class can't be built with, without building it.
+
+        Configs are checked with this when they're loaded, so they fail once with the line of the option,
+        instead of in every worker.
+
+        Args:
+            output_format (str): The format of the output.
+            sizes (list[int]): The sizes of the output.
+
+        Returns:
+            dict[str, str]: The issue with each option that can't be used, keyed by the option.
+        """
+        return {}
 
     def generate_sizes(self) -> int:
-        for target_size in self.target_sizes:
-            yield target_size, get_core_image_size(target_size, self.target_margin)
+        for size in self.plan.sizes:
+            yield size.target, size.core
+
+    def ingest(self, input_: BaseInput, core_size: int) -> Image:
+        """Ingest the image to generate a size from, which is the input's alpha mask if it can be filled in the color.
+
+        Args:
+            input_ (BaseInput): The input to ingest.
+            core_size (int): The size of the core image, which vector inputs are rendered at.
+
+        Returns:
+            Image: The ingested image, in the output's color, or an `L` mask to fill with it.
+        """
+        kwargs = {'size': core_size} if input_.is_vector else {}
+        if self.color and input_.maskable:
+            return input_.ingest_mask(**kwargs)
+        return input_.ingest(color=self.color, **kwargs)
 
     def generate(self, img: Image, input: BaseInput, target_size: int, core_size: int) -> (Image, Path):
         input_ = input
 
-        dest_path = self._generate_path(input_, target_size)
+        dest_path = self.generate_path(input_, target_size)
 
-        img = self._adjust_core(img, core_size)
-        img = self._add_background(img, target_size)
+        with metrics.time('adjust_core', size=core_size):
+            if img.mode == 'L':
+                img = self._adjust_mask(img, input_, core_size)
+            elif self.chain_ratio and not input_.is_vector:
+                img = self._adjust_core_chained(img, input_, core_size)
+            else:
+                img = self._adjust_core(img, core_size)
+        if img.mode == 'L':
+            with metrics.time('fill_mask', size=core_size):
+                img = fill_mask(img, self.plan.color)
+        with metrics.time('add_background', size=target_size):
+            img = self._add_background(img, target_size)
 
         return img, dest_path
 
-    def _generate_path(self, input_: BaseInput, target_size: int) -> Path:
+    def generate_path(self, input_: BaseInput, target_size: int = None) -> Path:
         # remove the part of the path shared between the source and output base paths
         if self.directory_override:
             dest_path = self.directory_override
@@ -96,8 +214,10 @@ class BaseOutput(Base):
                 ]
             )
 
-        # rename the file and add the appropriate suffix
-        filename_parts = [input_.path.with_suffix('').name, str(target_size)]
+        # rename the file and add the appropriate suffix, leaving out the size for files holding every size
+        filename_parts = [input_.path.with_suffix('').name]
+        if target_size is not None:
+            filename_parts.append(str(target_size))
         # prepend prefix if set
         if self.file_prefix:
             filename_parts.insert(0, self.file_prefix)
@@ -107,7 +227,7 @@ class BaseOutput(Base):
         return self.base_path / dest_path / file_name
 
     @staticmethod
-    def _adjust_core(img: Image, core_size: int) -> Image:
+    def _core_dimensions(img: Image, core_size: int) -> tuple[int, int]:
         # if the image dimensions aren't square, determine the longest side and scale
         # the other side while keeping the aspect ratio
         if img.width != img.height:
@@ -122,18 +242,80 @@ class BaseOutput(Base):
         if core_dimensions[0] > img.width or core_dimensions[1] > img.height:
             raise ValueError('The target size cannot be larger than the original image size')
 
+        return core_dimensions
+
+    @classmethod
+    def _adjust_core(cls, img: Image, core_size: int) -> Image:
+        core_dimensions = cls._core_dimensions(img, core_size)
+
         # resize the image to the core size using the Hamming filter since it
         # balances downscaling performance and quality
         return img.resize(core_dimensions, resample=Image.HAMMING)
 
-    def _add_background(self, img: Image, target_size: int) -> Image:
-        target_dimensions = (target_size, target_size)
+    def _adjust_mask(self, mask: Image, input_: BaseInput, core_size: int) -> Image:
+        """Resize an alpha mask to the core size, once for every output filling it in a different color.
+
+        Resized masks are kept in the input's render cache, which costs a quarter of a resized color image.
+        """
+        core_dimensions = self._core_dimensions(mask, core_size)
+        if mask.size == core_dimensions:
+            return mask
+        if self.chain_ratio:
+            return self._adjust_core_chained(mask, input_, core_size)
+        return input_.render_cache.get_or_render(
+            MaskKey(size=core_dimensions), partial(mask.resize, core_dimensions, resample=Image.HAMMING)
+        )
 
-        # generate background
-        if self.background == 'transparent':
-            background_img = Image.new('RGBA', target_dimensions, (0, 0, 0, 0))
+    def _adjust_core_chained(self, img: Image, input_: BaseInput, core_size: int) -> Image:
+        """Resize the image to the core size, starting from the smallest cached intermediate that's large enough.
+
+        Resized images are kept in the input's render cache, so each size in a descending
+        size ladder is resampled from a previous one instead of from the full image. An
+        intermediate is only used if it's at least `chain_ratio` times the target size,
+        which keeps the result within a small per-pixel difference of a direct resize.
+
+        Args:
+            img (Image): The ingested image.
+            input_ (BaseInput): The input the image was ingested from.
+            core_size (int): The size of the core image.
+
+        Returns:
+            Image: The resized image.
+        """
+        core_dimensions = self._core_dimensions(img, core_size)
+        # masks are shared by every color, but not with direct resizes, so results don't depend on the job order
+        if img.mode == 'L':
+            key = MaskKey(size=core_dimensions, chain_ratio=self.chain_ratio)
         else:
-            background_img = Image.new('RGBA', target_dimensions, self.background)
+            key = RenderKey(color=self.color, size=core_dimensions)
+        cache = input_.render_cache
+        if (cached := cache.get(key)) is not None:
+            return cached
+
+        # find the smallest intermediate of the same kind, color and ratio that's still large enough
+        base = img
+        min_width = core_dimensions[0] * self.chain_ratio
+        for intermediate_key in cache:
+            if intermediate_key._replace(size=None) != key._replace(size=None):
+                continue
+            if not isinstance(intermediate_key.size, tuple):
+                continue
+            width, height = intermediate_key.size
+            if min_width <= width < base.width and height >= core_dimensions[1] * self.chain_ratio:
+                base = cache.get(intermediate_key)
+
+        resized = base.resize(core_dimensions, resample=Image.HAMMING)
+        cache.put(key, resized)
+        return resized
+
+    def _add_background(self, img: Image, target_size: int) -> Image:
+        # generate the background once per size, then copy it for each image
+        background_img = self._background_canvases.get(target_size)
+        if background_img is None:
+            target_dimensions = (target_size, target_size)
+            background_img = Image.new('RGBA', target_dimensions, self.plan.background)
+            self._background_canvases[target_size] = background_img
+        background_img = background_img.copy()
 
         # paste the img onto the background centered
         background_img.alpha_composite(
@@ -141,11 +323,220 @@ class BaseOutput(Base):
         )
         return background_img
 
+    def encode(self, img: Image) -> bytes:
+        """Encode the image in the output's format, using the output's encoder options.
+
+        Args:
+            img (Image): The generated image.
+
+        Returns:
+            bytes: The encoded image.
+        """
+        if self.quantize:
+            # flat icons only use a handful of colors, so a small palette keeps them sharp but much smaller
+            img = img.quantize(colors=self.quantize, method=Image.Quantize.FASTOCTREE)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format=self.pillow_format, **self.encoder_options)
+        return buffer.getvalue()
+
+    @property
+    def pillow_format(self) -> str:
+        return self.format
+
 
-output_provider = BaseProvider()
 register_output = partial(register, provider=output_provider)
 
 
-@register_output('png', 'jpg', 'jpeg')
+@register_output('png', 'jpg', 'jpeg', 'webp', 'avif')
 class StandardOutput(BaseOutput):
-    pass
+    @classmethod
+    def check_options(cls, output_format, sizes):
+        issues = super().check_options(output_format, sizes)
+        # newer formats depend on optional libraries Pillow may have been built without
+        if output_format in ('webp', 'avif') and not features.check(output_format):
+            issues['format'] = f'Pillow was built without {output_format} support'
+        return issues
+
+    @property
+    def pillow_format(self) -> str:
+        # Pillow only knows JPEG by its full name
+        return 'jpeg' if self.format == 'jpg' else self.format
+
+    def encode(self, img: Image) -> bytes:
+        # JPEG has no alpha channel
+        if self.pillow_format == 'jpeg':
+            img = img.convert('RGB')
+        return super().encode(img)
+
+
+class BasePackedOutput(BaseOutput):
+    """Packs several renders into each file, instead of writing a file per image and size.
+
+    Workers render every image and size the file needs in memory, and hand them to pack() at once.
+    """
+
+    # 'sizes' packs every size of an image into a file, 'images' packs every image and size of the output
+    packing = 'sizes'
+
+    @abstractmethod
+    def pack_paths(self, inputs: list[BaseInput]) -> list[Path]:
+        """Generate the paths of the files pack() writes for the inputs, without rendering anything."""
+        pass
+
+    @abstractmethod
+    def pack(self, renders: dict[BaseInput, dict[int, Image]]) -> dict[Path, bytes]:
+        """Pack the renders into files.
+
+        Args:
+            renders (dict[BaseInput, dict[int, Image]]): The generated images of each input, keyed by size.
+
+        Returns:
+            dict[Path, bytes]: The contents of each file.
+        """
+        pass
+
+
+class ContainerOutput(BasePackedOutput):
+    """Packs every size of an image into a single multi-resolution icon file."""
+
+    # the sizes the container can hold
+    supported_sizes = None
+
+    @classmethod
+    def check_options(cls, output_format, sizes):
+        issues = super().check_options(output_format, sizes)
+        unsupported = [size for size in sizes if not cls._supports(size)]
+        if unsupported:
+            issues['sizes'] = f'{output_format} files cannot hold {", ".join(map(str, unsupported))} px images'
+        return issues
+
+    def pack_paths(self, inputs):
+        return [self.generate_path(inputs[0])]
+
+    def pack(self, renders):
+        ((input_, images),) = renders.items()
+        if not images:
+            return {}
+
+        # the largest image is saved, and the rest are appended to it
+        sizes = sorted(images, reverse=True)
+        buffer = io.BytesIO()
+        images[sizes[0]].save(
+            buffer,
+            format=self.pillow_format,
+            append_images=[images[size] for size in sizes[1:]],
+            **self._save_options(sizes),
+            **self.encoder_options,
+        )
+        return {self.generate_path(input_): buffer.getvalue()}
+
+    @classmethod
+    def _supports(cls, size: int) -> bool:
+        return size in cls.supported_sizes
+
+    def _save_options(self, sizes: list[int]) -> dict:
+        return {}
+
+
+@register_output('ico')
+class IcoOutput(ContainerOutput):
+    @classmethod
+    def _supports(cls, size):
+        return 0 < size <= 256
+
+    def _save_options(self, sizes):
+        # Pillow only writes the sizes it's asked for, picking the appended image that matches each one
+        return {'sizes': [(size, size) for size in sizes]}
+
+
+@register_output('icns')
+class IcnsOutput(ContainerOutput):
+    """Packs every size of an image into an icns file, as a PNG entry per size.
+
+    Pillow's icns encoder always writes 32 to 1024 px, resizing the largest image to the sizes that weren't
+    rendered, and never 16 px, so the file is written here instead, with only the sizes of the output.
+    """
+
+    # the type of the entry holding each size
+    entry_types = {16: b'icp4', 32: b'icp5', 64: b'icp6', 128: b'ic07', 256: b'ic08', 512: b'ic09', 1024: b'ic10'}
+    supported_sizes = set(entry_types)
+
+    def pack(self, renders):
+        ((input_, images),) = renders.items()
+        if not images:
+            return {}
+
+        entries = []
+        for size in sorted(images):
+            buffer = io.BytesIO()
+            images[size].save(buffer, format='png', **self.encoder_options)
+            entries.append(self.entry_types[size] + struct.pack('>i', 8 + buffer.tell()) + buffer.getvalue())
+        # the header and every entry start with their type and length, including themselves
+        contents = b''.join(entries)
+        return {self.generate_path(input_): b'icns' + struct.pack('>i', 8 + len(contents)) + contents}
+
+
+@register_output('sprite')
+class SpriteOutput(BasePackedOutput):
+    """Packs every image and size of the output into a sprite sheet, with JSON and CSS maps of where each one is.
+
+    The sheet is named after the file prefix, or `sprite`, and each icon's CSS class is the file prefix, or
+    `icon`, followed by the image name and size. Configs are checked for sprite outputs that would write the
+    same sheet.
+
+    Args:
+        padding (int): The space between icons in the sheet.
+        sheet_format (str): The format of the sheet image.
+    """
+
+    packing = 'images'
+
+    def __init__(self, padding: int = 2, sheet_format: str = 'png', **kwargs):
+        super().__init__(**kwargs)
+        self.padding = padding
+        self.sheet_format = sheet_format
+
+    @property
+    def pillow_format(self) -> str:
+        return 'jpeg' if self.sheet_format == 'jpg' else self.sheet_format
+
+    def sheet_path(self) -> Path:
+        return self.base_path / (self.directory_override or '') / f'{self.file_prefix or "sprite"}.{self.sheet_format}'
+
+    def pack_paths(self, inputs):
+        sheet_path = self.sheet_path()
+        return [sheet_path, sheet_path.with_suffix('.json'), sheet_path.with_suffix('.css')]
+
+    def pack(self, renders):
+        tiles = [
+            (input_.path.with_suffix('').name, size, img)
+            for input_, images in renders.items()
+            for size, img in sorted(images.items())
+        ]
+        if not tiles:
+            return {}
+
+        placements, width, height = shelf_pack([img.size for _, _, img in tiles], padding=self.padding)
+        sheet = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        for (_, _, img), placement in zip(tiles, placements):
+            sheet.paste(img, (placement.x, placement.y))
+
+        sheet_path, json_path, css_path = self.pack_paths(list(renders))
+        class_prefix = self.file_prefix or 'icon'
+        coordinates = {}
+        rules = []
+        for (name, size, _), placement in zip(tiles, placements):
+            coordinates[f'{name}-{size}'] = placement._asdict()
+            rules.append(
+                f'.{class_prefix}-{name}-{size} {{ '
+                f'background: url({sheet_path.name}) {-placement.x}px {-placement.y}px; '
+                f'width: {placement.width}px; height: {placement.height}px; }}'
+            )
+
+        icon_map = {'image': sheet_path.name, 'width': width, 'height': height, 'icons': coordinates}
+        return {
+            sheet_path: self.encode(sheet),
+            json_path: json.dumps(icon_map, indent=2).encode(),
+            css_path: ('\n'.join(rules) + '\n').encode(),
+        }
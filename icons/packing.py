@@ -0,0 +1,54 @@
+import math
+from typing import NamedTuple
+
+
+class Placement(NamedTuple):
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+def shelf_pack(
+    dimensions: list[tuple[int, int]], padding: int = 0, max_width: int = None
+) -> tuple[list[Placement], int, int]:
+    """Pack rectangles into a sheet using the next-fit decreasing height shelf algorithm.
+
+    Rectangles are sorted from tallest to shortest and placed left to right on shelves, starting a new shelf
+    whenever the next one doesn't fit. Icons come in a handful of square sizes, so the shelves end up nearly
+    full and little of the sheet is wasted.
+
+    Args:
+        dimensions (list[tuple[int, int]]): The width and height of each rectangle.
+        padding (int): The space to leave between rectangles, so neighbors don't bleed in when scaled.
+        max_width (int): The width of the sheet, defaults to roughly the width of a square sheet.
+
+    Returns:
+        tuple[list[Placement], int, int]: The placement of each rectangle, in the order given, and the
+            width and height of the sheet.
+    """
+    if not dimensions:
+        return [], 0, 0
+
+    if max_width is None:
+        area = sum((width + padding) * (height + padding) for width, height in dimensions)
+        max_width = math.ceil(math.sqrt(area))
+    # every rectangle must fit on a shelf of its own
+    max_width = max(max_width, *(width for width, _ in dimensions))
+
+    order = sorted(range(len(dimensions)), key=lambda index: (-dimensions[index][1], -dimensions[index][0]))
+    placements = [None] * len(dimensions)
+    x = y = shelf_height = sheet_width = 0
+    for index in order:
+        width, height = dimensions[index]
+        if x and x + width > max_width:
+            # start a new shelf below the current one
+            y += shelf_height + padding
+            x = shelf_height = 0
+
+        placements[index] = Placement(x, y, width, height)
+        sheet_width = max(sheet_width, x + width)
+        shelf_height = max(shelf_height, height)
+        x += width + padding
+
+    return placements, sheet_width, y + shelf_height
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Callable, Hashable, Iterable
+
+from .metrics import metrics
+
+
+class Prefetcher:
+    """Reads the files of upcoming jobs on a pool of threads, while the current job is rendered.
+
+    Files are read in the order of their keys, and at most `window` of them are read ahead of the one being
+    used, which bounds the memory of files waiting to be used, and keeps slow file systems from being
+    flooded with reads that won't be needed for a while.
+
+    Args:
+        executor (Executor): The threads to read on.
+        read (Callable): Reads the file of a key.
+        keys (Iterable): The keys of the files, in the order they'll be used.
+        window (int): The number of files to read ahead.
+    """
+
+    def __init__(self, executor: Executor, read: Callable[[Hashable], object], keys: Iterable[Hashable], window: int):
+        self.executor = executor
+        self.read = read
+        self.window = window
+        self._keys = iter(keys)
+        self._futures: OrderedDict[Hashable, Future] = OrderedDict()
+        self._fill()
+
+    def _fill(self) -> None:
+        while len(self._futures) < self.window:
+            key = next(self._keys, None)
+            if key is None:
+                return
+            self._futures[key] = self.executor.submit(self.read, key)
+
+    def take(self, key: Hashable) -> object | None:
+        """Get the contents of a file, waiting for its read if it's still in flight.
+
+        Returns:
+            object | None: The contents, or None if the file wasn't prefetched, e.g. since it was used out of order.
+
+        Raises:
+            Exception: Any error raised while reading the file.
+        """
+        future = self._futures.pop(key, None)
+        # start reading the next file before waiting on this one, so the window stays full
+        self._fill()
+        if future is None:
+            return None
+        metrics.count('prefetched')
+        if not future.done():
+            with metrics.time('wait_for_read'):
+                return future.result()
+        return future.result()
+
+    def close(self) -> None:
+        """Stop reading ahead, dropping the files that were never taken."""
+        for future in self._futures.values():
+            future.cancel()
+        self._futures.clear()
+        self._keys = iter(())
@@ -0,0 +1,13 @@
+from .base import BaseProvider
+
+# the providers only know which module implements each key, and import it the first time the key is used, so
+# builds don't pay for libraries they never use, e.g. cairosvg for configs without SVG sources
+source_provider = BaseProvider(fallback_key='type', fallback_method='pop')
+source_provider.register_lazy(['file', 'directory', 'folder', 'archive', 'zip', 'url'], 'icons.sources')
+
+input_provider = BaseProvider()
+input_provider.register_lazy(['png', 'jpg', 'jpeg'], 'icons.inputs')
+input_provider.register_lazy('svg', 'icons.svg')
+
+output_provider = BaseProvider()
+output_provider.register_lazy(['png', 'jpg', 'jpeg', 'webp', 'avif', 'ico', 'icns', 'sprite'], 'icons.outputs')
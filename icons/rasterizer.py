@@ -0,0 +1,813 @@
+"""A rasterizer for the subset of SVG most icons use: filled paths and basic shapes in a single color.
+
+Documents are parsed into a Shape once, which renders an alpha mask at any size. Anything outside the
+subset, e.g. strokes, gradients, clipping, CSS or text, raises Unsupported, so the caller can fall back to
+cairosvg.
+"""
+import math
+import re
+import xml.etree.ElementTree as ElementTree
+
+from PIL import Image, ImageChops
+from PIL.ImageColor import getrgb
+
+SVG_NAMESPACE = '{http://www.w3.org/2000/svg}'
+# rows each pixel is sampled on, like the scan converter of cairo, which cairosvg renders with
+SUBROWS = 15
+# the fractions of a pixel the spans along each row are measured in
+SUBCOLUMNS = 256
+# the furthest a flattened curve strays from the real one, in pixels
+TOLERANCE = 0.05
+# the furthest a coordinate may be from the viewBox, in viewBox sizes, since curves far outside it would be
+# flattened into many segments, and much further ones overflow when scaled
+MAX_EXTENT = 64
+# the handle length of a cubic approximating a quarter circle of radius 1
+KAPPA = 4 / 3 * (math.sqrt(2) - 1)
+
+# elements that are never painted themselves, and only matter when referenced, which is unsupported anyway
+IGNORED_ELEMENTS = ('title', 'desc', 'metadata', 'defs', 'symbol', 'clipPath', 'mask', 'marker', 'pattern')
+IGNORED_ELEMENTS += ('linearGradient', 'radialGradient')
+SHAPE_ELEMENTS = ('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line')
+# properties that are inherited by child elements
+INHERITED = ('fill', 'fill-rule', 'color', 'stroke', 'fill-opacity', 'visibility')
+# properties that are fine at their default, but unsupported at any other value
+DEFAULTS = {
+    'stroke': ('none',),
+    'opacity': ('1',),
+    'fill-opacity': ('1',),
+    'visibility': ('visible',),
+    'clip-path': ('none',),
+    'mask': ('none',),
+    'filter': ('none',),
+    'marker': ('none',),
+    'marker-start': ('none',),
+    'marker-mid': ('none',),
+    'marker-end': ('none',),
+    'mix-blend-mode': ('normal',),
+}
+
+PATH_TOKEN = re.compile(r'[\s,]*([MmZzLlHhVvCcSsQqTtAa]|[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?)')
+NUMBER = re.compile(r'[-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?')
+TRANSFORM = re.compile(r'\s*(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)\s*,?')
+LENGTH = re.compile(r'^\s*([-+]?(?:\d*\.\d+|\d+\.?)(?:[eE][-+]?\d+)?)\s*(px)?\s*$')
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+class Unsupported(ValueError):
+    """Raised when a document uses a feature outside the supported subset."""
+
+
+class Shape:
+    """The filled areas of an SVG document, which render to an alpha mask at any size.
+
+    Every fill is a list of closed subpaths in viewBox coordinates, each a start point followed by line
+    segments, as (x, y), and cubic segments, as (x1, y1, x2, y2, x, y).
+    """
+
+    def __init__(self, viewbox: tuple, align: bool, fills: list, colors: set):
+        self.viewbox = viewbox
+        # whether the viewBox is scaled uniformly and centered, or stretched, to fill the image
+        self.align = align
+        self.fills = fills
+        # the fill color if the document only has one, otherwise None, since only recolored renders are exact
+        self.color = next(iter(colors)) if len(colors) == 1 else None
+
+    def mask(self, size: int) -> Image.Image:
+        """Render the coverage of the shape as a square `L` image."""
+        min_x, min_y, width, height = self.viewbox
+        scale_x, scale_y = size / width, size / height
+        offset_x = offset_y = 0
+        if self.align:
+            scale_x = scale_y = min(scale_x, scale_y)
+            offset_x, offset_y = (size - width * scale_x) / 2, (size - height * scale_y) / 2
+        transform = (scale_x, 0.0, 0.0, scale_y, offset_x - min_x * scale_x, offset_y - min_y * scale_y)
+
+        mask = Image.new('L', (size, size))
+        for rule, subpaths in self.fills:
+            polygons = [polygon for polygon in (_flatten(subpath, transform) for subpath in subpaths) if polygon]
+            if polygons:
+                # each fill is painted over the ones before it, which is a screen of their coverages
+                mask = ImageChops.screen(mask, _fill(size, polygons, rule))
+        return mask
+
+
+def parse_svg(data: bytes) -> Shape:
+    """Parse a document into a Shape.
+
+    Raises:
+        Unsupported: If the document uses anything outside the subset.
+    """
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError as e:
+        raise Unsupported(f'Invalid document: {e}')
+    if root.tag != f'{SVG_NAMESPACE}svg':
+        raise Unsupported('The root element is not an svg element')
+
+    viewbox, align = _viewport(root)
+    fills = []
+    colors = set()
+    state = {'fill': 'black', 'fill-rule': 'nonzero', 'color': 'black'}
+    _walk(root, state, IDENTITY, fills, colors, is_root=True)
+
+    min_x, min_y, width, height = viewbox
+    limit = MAX_EXTENT * max(width, height) + max(abs(min_x), abs(min_y))
+    for _, subpaths in fills:
+        # not written as abs(value) > limit, so NaNs are rejected too
+        if not all(abs(value) <= limit for subpath in subpaths for segment in subpath for value in segment):
+            raise Unsupported('Coordinates far outside the viewBox')
+    return Shape(viewbox, align, fills, colors)
+
+
+def _viewport(root: ElementTree.Element) -> tuple[tuple, bool]:
+    if root.get('viewBox'):
+        viewbox = tuple(float(value) for value in NUMBER.findall(root.get('viewBox')))
+    else:
+        viewbox = (0.0, 0.0, _length(root.get('width')), _length(root.get('height')))
+    if len(viewbox) != 4 or viewbox[2] <= 0 or viewbox[3] <= 0:
+        raise Unsupported('The document has no size')
+    if not all(map(math.isfinite, viewbox)):
+        raise Unsupported('The document has an infinite size')
+
+    preserve = root.get('preserveAspectRatio', 'xMidYMid meet').split()
+    if preserve == ['none']:
+        return viewbox, False
+    if preserve not in (['xMidYMid'], ['xMidYMid', 'meet']):
+        raise Unsupported(f'preserveAspectRatio="{" ".join(preserve)}"')
+    return viewbox, True
+
+
+def _walk(element, state: dict, transform: tuple, fills: list, colors: set, is_root: bool = False) -> None:
+    for child in [element] if is_root else element:
+        if not isinstance(child.tag, str) or not child.tag.startswith(SVG_NAMESPACE):
+            # comments, and elements of editors such as Inkscape
+            continue
+        tag = child.tag.removeprefix(SVG_NAMESPACE)
+        if tag in IGNORED_ELEMENTS:
+            continue
+        if tag == 'style':
+            if (child.text or '').strip():
+                raise Unsupported('CSS style sheets')
+            continue
+
+        properties = _properties(child)
+        if properties.get('display') == 'none':
+            continue
+        child_state = {key: value for key, value in state.items() if key in INHERITED} | {
+            key: value for key, value in properties.items() if value != 'inherit'
+        }
+        for key, defaults in DEFAULTS.items():
+            value = child_state.get(key)
+            if value is not None and value not in defaults:
+                if key.endswith('opacity') and _is_opaque(value):
+                    continue
+                raise Unsupported(f'{key}="{value}"')
+        child_transform = _multiply(transform, _parse_transform(child.get('transform', '')))
+
+        if tag in ('svg', 'g'):
+            if tag == 'svg' and child is not element:
+                raise Unsupported('Nested svg elements')
+            _walk(child, child_state, child_transform, fills, colors)
+        elif tag in SHAPE_ELEMENTS:
+            fill = child_state.get('fill', 'black')
+            if fill == 'currentColor':
+                fill = child_state.get('color', 'black')
+            if fill == 'none':
+                continue
+            if fill.startswith('url('):
+                raise Unsupported('Gradient and pattern fills')
+            try:
+                rgba = getrgb(fill)
+            except ValueError:
+                raise Unsupported(f'fill="{fill}"')
+            if len(rgba) == 4 and rgba[3] != 255:
+                raise Unsupported(f'fill="{fill}"')
+            colors.add(rgba[:3])
+
+            rule = child_state.get('fill-rule', 'nonzero')
+            if rule not in ('nonzero', 'evenodd'):
+                raise Unsupported(f'fill-rule="{rule}"')
+            subpaths = [_transform_subpath(subpath, child_transform) for subpath in _subpaths(tag, child)]
+            if subpaths:
+                fills.append((rule, subpaths))
+        else:
+            raise Unsupported(f'{tag} elements')
+
+
+def _properties(element: ElementTree.Element) -> dict[str, str]:
+    # presentation attributes, overridden by the style attribute
+    properties = {
+        key: value.strip()
+        for key, value in element.attrib.items()
+        if key in INHERITED or key in DEFAULTS or key == 'display'
+    }
+    for declaration in element.get('style', '').split(';'):
+        key, _, value = declaration.partition(':')
+        if value:
+            properties[key.strip()] = value.strip()
+    return properties
+
+
+def _is_opaque(value: str) -> bool:
+    try:
+        return float(value) >= 1
+    except ValueError:
+        return False
+
+
+def _length(value: str | None, default: float = 0.0) -> float:
+    if value is None:
+        return default
+    match = LENGTH.match(value)
+    if match is None:
+        raise Unsupported(f'The length "{value}"')
+    return float(match[1])
+
+
+def _multiply(first: tuple, second: tuple) -> tuple:
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return (
+        a1 * a2 + c1 * b2,
+        b1 * a2 + d1 * b2,
+        a1 * c2 + c1 * d2,
+        b1 * c2 + d1 * d2,
+        a1 * e2 + c1 * f2 + e1,
+        b1 * e2 + d1 * f2 + f1,
+    )
+
+
+def _parse_transform(value: str) -> tuple:
+    transform = IDENTITY
+    position = 0
+    while position < len(value.rstrip()):
+        match = TRANSFORM.match(value, position)
+        if match is None:
+            raise Unsupported(f'transform="{value}"')
+        name, arguments = match[1], [float(number) for number in NUMBER.findall(match[2])]
+        position = match.end()
+
+        if name == 'matrix' and len(arguments) == 6:
+            step = tuple(arguments)
+        elif name == 'translate' and len(arguments) in (1, 2):
+            step = (1.0, 0.0, 0.0, 1.0, arguments[0], arguments[1] if len(arguments) == 2 else 0.0)
+        elif name == 'scale' and len(arguments) in (1, 2):
+            step = (arguments[0], 0.0, 0.0, arguments[-1], 0.0, 0.0)
+        elif name == 'rotate' and len(arguments) in (1, 3):
+            angle = math.radians(arguments[0])
+            cos, sin = math.cos(angle), math.sin(angle)
+            step = (cos, sin, -sin, cos, 0.0, 0.0)
+            if len(arguments) == 3:
+                # rotate around the given point
+                x, y = arguments[1:]
+                step = _multiply(_multiply((1.0, 0.0, 0.0, 1.0, x, y), step), (1.0, 0.0, 0.0, 1.0, -x, -y))
+        elif name in ('skewX', 'skewY') and len(arguments) == 1:
+            tan = math.tan(math.radians(arguments[0]))
+            step = (1.0, 0.0, tan, 1.0, 0.0, 0.0) if name == 'skewX' else (1.0, tan, 0.0, 1.0, 0.0, 0.0)
+        else:
+            raise Unsupported(f'transform="{value}"')
+        transform = _multiply(transform, step)
+    return transform
+
+
+def _transform_subpath(subpath: list, transform: tuple) -> list:
+    a, b, c, d, e, f = transform
+    return [
+        tuple(
+            value
+            for index in range(0, len(segment), 2)
+            for value in (
+                a * segment[index] + c * segment[index + 1] + e,
+                b * segment[index] + d * segment[index + 1] + f,
+            )
+        )
+        for segment in subpath
+    ]
+
+
+def _subpaths(tag: str, element: ElementTree.Element) -> list[list]:
+    def number(name):
+        return _length(element.get(name))
+
+    if tag == 'path':
+        return _parse_path(element.get('d', ''))
+    if tag in ('polygon', 'polyline'):
+        values = [float(value) for value in NUMBER.findall(element.get('points', ''))]
+        points = list(zip(values[::2], values[1::2]))
+        return [points] if len(points) > 2 else []
+    if tag == 'line':
+        # lines have no area to fill
+        return []
+    if tag == 'circle':
+        return _ellipse(number('cx'), number('cy'), number('r'), number('r'))
+    if tag == 'ellipse':
+        return _ellipse(number('cx'), number('cy'), number('rx'), number('ry'))
+
+    # rect, with optional rounded corners
+    x, y, width, height = number('x'), number('y'), number('width'), number('height')
+    if width <= 0 or height <= 0:
+        return []
+    # a missing corner radius defaults to the other one
+    rx, ry = element.get('rx'), element.get('ry')
+    rx, ry = _length(rx if rx is not None else ry), _length(ry if ry is not None else rx)
+    rx, ry = min(rx, width / 2), min(ry, height / 2)
+    if rx <= 0 or ry <= 0:
+        return [[(x, y), (x + width, y), (x + width, y + height), (x, y + height)]]
+
+    subpath = [(x + rx, y), (x + width - rx, y)]
+    subpath += _arc(x + width - rx, y, rx, ry, 0, False, True, x + width, y + ry)
+    subpath.append((x + width, y + height - ry))
+    subpath += _arc(x + width, y + height - ry, rx, ry, 0, False, True, x + width - rx, y + height)
+    subpath.append((x + rx, y + height))
+    subpath += _arc(x + rx, y + height, rx, ry, 0, False, True, x, y + height - ry)
+    subpath.append((x, y + ry))
+    subpath += _arc(x, y + ry, rx, ry, 0, False, True, x + rx, y)
+    return [subpath]
+
+
+def _ellipse(cx: float, cy: float, rx: float, ry: float) -> list[list]:
+    if rx <= 0 or ry <= 0:
+        return []
+    kx, ky = rx * KAPPA, ry * KAPPA
+    return [
+        [
+            (cx + rx, cy),
+            (cx + rx, cy + ky, cx + kx, cy + ry, cx, cy + ry),
+            (cx - kx, cy + ry, cx - rx, cy + ky, cx - rx, cy),
+            (cx - rx, cy - ky, cx - kx, cy - ry, cx, cy - ry),
+            (cx + kx, cy - ry, cx + rx, cy - ky, cx + rx, cy),
+        ]
+    ]
+
+
+def _parse_path(data: str) -> list[list]:
+    tokens = PathTokens(data)
+    subpaths = []
+    subpath = None
+    x = y = start_x = start_y = 0.0
+    # the last control point of the previous cubic or quadratic, for the smooth commands
+    control = None
+    command = None
+
+    while not tokens.done():
+        if tokens.at_command():
+            command = tokens.command()
+        elif command is None:
+            raise Unsupported(f'Invalid path data: {data[:40]}')
+        relative = command.islower()
+        upper = command.upper()
+        dx, dy = (x, y) if relative else (0.0, 0.0)
+        previous_control, control = control, None
+
+        if upper == 'Z':
+            x, y = start_x, start_y
+            subpath = None
+            # close takes no numbers, so numbers after it are invalid rather than repeats of it
+            command = None
+            continue
+        if upper == 'M':
+            x, y = tokens.number() + dx, tokens.number() + dy
+            start_x, start_y = x, y
+            subpath = [(x, y)]
+            subpaths.append(subpath)
+            # further pairs are implicit line commands
+            command = 'l' if relative else 'L'
+            continue
+
+        if subpath is None:
+            # a drawing command right after closing a subpath starts a new one at the same point
+            subpath = [(x, y)]
+            subpaths.append(subpath)
+
+        if upper == 'L':
+            x, y = tokens.number() + dx, tokens.number() + dy
+            subpath.append((x, y))
+        elif upper == 'H':
+            x = tokens.number() + dx
+            subpath.append((x, y))
+        elif upper == 'V':
+            y = tokens.number() + dy
+            subpath.append((x, y))
+        elif upper in ('C', 'S'):
+            if upper == 'C':
+                x1, y1 = tokens.number() + dx, tokens.number() + dy
+            else:
+                x1, y1 = _reflect(previous_control, x, y, 'CS')
+            x2, y2 = tokens.number() + dx, tokens.number() + dy
+            x, y = tokens.number() + dx, tokens.number() + dy
+            subpath.append((x1, y1, x2, y2, x, y))
+            control = ('CS', x2, y2)
+        elif upper in ('Q', 'T'):
+            if upper == 'Q':
+                qx, qy = tokens.number() + dx, tokens.number() + dy
+            else:
+                qx, qy = _reflect(previous_control, x, y, 'QT')
+            end_x, end_y = tokens.number() + dx, tokens.number() + dy
+            # a quadratic is a cubic with both handles two thirds of the way to its control point
+            subpath.append(
+                (
+                    x + 2 / 3 * (qx - x),
+                    y + 2 / 3 * (qy - y),
+                    end_x + 2 / 3 * (qx - end_x),
+                    end_y + 2 / 3 * (qy - end_y),
+                    end_x,
+                    end_y,
+                )
+            )
+            x, y = end_x, end_y
+            control = ('QT', qx, qy)
+        elif upper == 'A':
+            rx, ry, rotation = tokens.number(), tokens.number(), tokens.number()
+            large_arc, sweep = tokens.flag(), tokens.flag()
+            end_x, end_y = tokens.number() + dx, tokens.number() + dy
+            subpath += _arc(x, y, rx, ry, rotation, large_arc, sweep, end_x, end_y)
+            x, y = end_x, end_y
+
+    return [subpath for subpath in subpaths if len(subpath) > 1]
+
+
+def _reflect(control: tuple | None, x: float, y: float, commands: str) -> tuple[float, float]:
+    # smooth curves mirror the previous curve's last control point, if the previous command was the same kind
+    if control is None or control[0] != commands:
+        return x, y
+    return 2 * x - control[1], 2 * y - control[2]
+
+
+class PathTokens:
+    def __init__(self, data: str):
+        self.data = data
+        self.position = 0
+
+    def done(self) -> bool:
+        return not self.data[self.position :].strip(' \t\r\n,')
+
+    def at_command(self) -> bool:
+        match = PATH_TOKEN.match(self.data, self.position)
+        return match is not None and match[1].isalpha()
+
+    def command(self) -> str:
+        match = PATH_TOKEN.match(self.data, self.position)
+        self.position = match.end()
+        return match[1]
+
+    def number(self) -> float:
+        match = PATH_TOKEN.match(self.data, self.position)
+        if match is None or match[1].isalpha():
+            raise Unsupported(f'Invalid path data: {self.data[:40]}')
+        self.position = match.end()
+        return float(match[1])
+
+    def flag(self) -> bool:
+        # arc flags are single digits, which may be written without separators, e.g. `a1 1 0 001 1`
+        while self.position < len(self.data) and self.data[self.position] in ' \t\r\n,':
+            self.position += 1
+        if self.position >= len(self.data) or self.data[self.position] not in '01':
+            raise Unsupported(f'Invalid path data: {self.data[:40]}')
+        self.position += 1
+        return self.data[self.position - 1] == '1'
+
+
+def _arc(
+    x1: float, y1: float, rx: float, ry: float, rotation: float, large_arc: bool, sweep: bool, x2: float, y2: float
+) -> list[tuple]:
+    """Approximate an elliptical arc with cubic segments of at most a quarter turn each.
+
+    See https://www.w3.org/TR/SVG11/implnote.html#ArcConversionEndpointToCenter.
+    """
+    if (x1, y1) == (x2, y2):
+        return []
+    rx, ry = abs(rx), abs(ry)
+    if not rx or not ry:
+        return [(x2, y2)]
+
+    angle = math.radians(rotation)
+    cos, sin = math.cos(angle), math.sin(angle)
+    half_x, half_y = (x1 - x2) / 2, (y1 - y2) / 2
+    x1p, y1p = cos * half_x + sin * half_y, -sin * half_x + cos * half_y
+
+    # scale the radii up if they're too small to reach the end point
+    scale = x1p**2 / rx**2 + y1p**2 / ry**2
+    if scale > 1:
+        rx, ry = rx * math.sqrt(scale), ry * math.sqrt(scale)
+
+    numerator = rx**2 * ry**2 - rx**2 * y1p**2 - ry**2 * x1p**2
+    denominator = rx**2 * y1p**2 + ry**2 * x1p**2
+    coefficient = math.sqrt(max(0.0, numerator / denominator))
+    if large_arc == sweep:
+        coefficient = -coefficient
+    cxp, cyp = coefficient * rx * y1p / ry, -coefficient * ry * x1p / rx
+    cx, cy = cos * cxp - sin * cyp + (x1 + x2) / 2, sin * cxp + cos * cyp + (y1 + y2) / 2
+
+    start = math.atan2((y1p - cyp) / ry, (x1p - cxp) / rx)
+    sweep_angle = math.atan2((-y1p - cyp) / ry, (-x1p - cxp) / rx) - start
+    if sweep and sweep_angle < 0:
+        sweep_angle += 2 * math.pi
+    elif not sweep and sweep_angle > 0:
+        sweep_angle -= 2 * math.pi
+
+    def point(ux, uy):
+        return cx + rx * ux * cos - ry * uy * sin, cy + rx * ux * sin + ry * uy * cos
+
+    count = max(1, math.ceil(abs(sweep_angle) / (math.pi / 2) - 1e-9))
+    step = sweep_angle / count
+    handle = 4 / 3 * math.tan(step / 4)
+    segments = []
+    for index in range(count):
+        a1 = start + index * step
+        a2 = a1 + step
+        segments.append(
+            (
+                *point(math.cos(a1) - handle * math.sin(a1), math.sin(a1) + handle * math.cos(a1)),
+                *point(math.cos(a2) + handle * math.sin(a2), math.sin(a2) - handle * math.cos(a2)),
+                *point(math.cos(a2), math.sin(a2)),
+            )
+        )
+    # end exactly on the end point, without rounding errors
+    segments[-1] = (*segments[-1][:4], x2, y2)
+    return segments
+
+
+def _flatten(subpath: list, transform: tuple) -> list[tuple[float, float]]:
+    """Transform a subpath into device space, and replace its curves with enough lines to stay within TOLERANCE."""
+    subpath = _transform_subpath(subpath, transform)
+    x, y = subpath[0]
+    points = [(x, y)]
+    for segment in subpath[1:]:
+        if len(segment) == 2:
+            points.append(segment)
+        else:
+            x1, y1, x2, y2, x3, y3 = segment
+            # the deviation of a uniformly subdivided cubic is bounded by its second differences
+            deviation = max(
+                math.hypot(x - 2 * x1 + x2, y - 2 * y1 + y2), math.hypot(x1 - 2 * x2 + x3, y1 - 2 * y2 + y3)
+            )
+            count = min(100, max(1, math.ceil(math.sqrt(0.75 * deviation / TOLERANCE))))
+            for index in range(1, count + 1):
+                t = index / count
+                s = 1 - t
+                a, b, c, d = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+                points.append((a * x + b * x1 + c * x2 + d * x3, a * y + b * y1 + c * y2 + d * y3))
+        x, y = points[-1]
+    return points if len(points) > 2 else []
+
+
+def _fill(size: int, polygons: list, rule: str) -> Image.Image:
+    """Render the coverage of a square image by the polygons with the fill rule, as an `L` image.
+
+    The polygons are split into chains of edges that only go down, or only up, which only start and end
+    where the polygons turn. Most rows of pixels are crossed by chains that neither start, end nor cross
+    each other within the row, so the spans inside the polygons are bounded by the same chains all the way
+    down the row, and the area each chain bounds in every pixel is added exactly.
+
+    Other rows are sampled on SUBROWS lines, whose sorted crossings with the edges give the spans inside the
+    polygons, each measured to a SUBCOLUMNS of a pixel. Both add the changes in coverage along the row,
+    which are summed once per row, so the work doesn't depend on the area of the polygons.
+    """
+    lines = size * SUBROWS
+    edges = []
+    for polygon in polygons:
+        for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]):
+            y1, y2 = y1 * SUBROWS, y2 * SUBROWS
+            if y1 == y2:
+                continue
+            direction = 1 if y2 > y1 else -1
+            if direction < 0:
+                x1, y1, x2, y2 = x2, y2, x1, y1
+            # the lines whose centers are within the half-open span of the edge, so shared vertices count once
+            first, last = max(0, math.ceil(y1 - 0.5)), min(lines, math.ceil(y2 - 0.5))
+            if first < last:
+                # crossings are measured in SUBCOLUMNS of a pixel, from the center of the first line
+                slope = (x2 - x1) / (y2 - y1) * SUBCOLUMNS
+                edges.append((first, last, x1 * SUBCOLUMNS + (first + 0.5 - y1) * slope, slope, direction))
+    edges.sort()
+    chains = sorted((chain for polygon in polygons for chain in _chains(polygon)), key=lambda chain: chain.top)
+
+    coverage = bytearray(size * size)
+    if not chains:
+        # polygons with only horizontal edges have no area
+        return Image.frombytes('L', (size, size), bytes(coverage))
+    nonzero = rule == 'nonzero'
+    width = size * SUBCOLUMNS
+    active_edges = []
+    active_chains = []
+    edge_index = chain_index = 0
+    for row in range(max(0, math.floor(chains[0].top)), min(size, math.ceil(max(c.bottom for c in chains)))):
+        top, bottom = row * SUBROWS, (row + 1) * SUBROWS
+        while edge_index < len(edges) and edges[edge_index][0] < bottom:
+            active_edges.append(edges[edge_index])
+            edge_index += 1
+        active_edges = [edge for edge in active_edges if edge[1] > top]
+        while chain_index < len(chains) and chains[chain_index].top < row + 1:
+            active_chains.append(chains[chain_index])
+            chain_index += 1
+        active_chains = [chain for chain in active_chains if chain.bottom > row]
+        if not active_chains:
+            continue
+
+        changes = [0] * (size + 2)
+        # the pixels whose coverage changes, since it's the same between them
+        touched = []
+        boundaries = _row_boundaries(active_chains, row, size, nonzero)
+        if boundaries is not None:
+            for start, end in boundaries:
+                start.add_area(changes, touched, row, 1)
+                end.add_area(changes, touched, row, -1)
+        else:
+            for line in range(top, bottom):
+                crossings = sorted(
+                    (x + (line - first) * slope, direction)
+                    for first, last, x, slope, direction in active_edges
+                    if first <= line < last
+                )
+                for start, end in _boundaries(crossings, [direction for _, direction in crossings], nonzero):
+                    _add_span(changes, touched, start[0], end[0], width)
+        _store_row(coverage, row * size, size, changes, touched)
+    return Image.frombytes('L', (size, size), bytes(coverage))
+
+
+def _store_row(coverage: bytearray, offset: int, size: int, changes: list[int], touched: list[int]) -> None:
+    """Sum the changes of a row into the coverage of its pixels, writing the runs between changes at once."""
+    full = SUBROWS * SUBCOLUMNS
+    value = 0
+    level = 0
+    previous = 0
+    for pixel in sorted(set(touched)):
+        if pixel >= size:
+            break
+        if level and pixel > previous:
+            coverage[offset + previous : offset + pixel] = bytes((level,)) * (pixel - previous)
+        value += changes[pixel]
+        level = min(255, max(0, (value * 255 + full // 2) // full))
+        coverage[offset + pixel] = level
+        previous = pixel + 1
+    if level and previous < size:
+        coverage[offset + previous : offset + size] = bytes((level,)) * (size - previous)
+
+
+class _Chain:
+    """Consecutive edges of a polygon that only go down, or only up, with their points from the top down."""
+
+    __slots__ = ('points', 'direction', 'top', 'bottom', 'index')
+
+    def __init__(self, points: list[tuple[float, float]], direction: int):
+        self.points = points
+        self.direction = direction
+        self.top = points[0][1]
+        self.bottom = points[-1][1]
+        # the first edge that may end below the current row, since rows are visited from the top down
+        self.index = 0
+
+    def x_at(self, y: float, below: bool) -> float:
+        """Find where the chain is at a height, leaving it downwards if `below`, or arriving from above."""
+        points = self.points
+        index = self.index
+        if below:
+            while points[index + 1][1] <= y:
+                index += 1
+        else:
+            while points[index + 1][1] < y:
+                index += 1
+        (x1, y1), (x2, y2) = points[index], points[index + 1]
+        return x1 + (y - y1) * (x2 - x1) / (y2 - y1) if y2 != y1 else x2
+
+    def add_area(self, changes: list[int], touched: list[int], row: int, sign: int) -> None:
+        """Add the area of each pixel of a row right of the chain to the changes of the row, signed."""
+        points = self.points
+        index = self.index
+        full = SUBROWS * SUBCOLUMNS
+        while index + 1 < len(points) and points[index][1] < row + 1:
+            (x1, y1), (x2, y2) = points[index], points[index + 1]
+            top, bottom = max(y1, row), min(y2, row + 1)
+            if bottom > top:
+                slope = (x2 - x1) / (y2 - y1)
+                # heights are rounded from both ends, so the pieces of the chain add up to the whole row exactly
+                weight = sign * (round((bottom - row) * full) - round((top - row) * full))
+                _add_area(changes, touched, x1 + (top - y1) * slope, x1 + (bottom - y1) * slope, weight)
+            index += 1
+
+
+def _chains(polygon: list[tuple[float, float]]) -> list[_Chain]:
+    """Split a closed polygon into chains, keeping horizontal edges in the chain before them."""
+    segments = list(zip(polygon, polygon[1:] + polygon[:1]))
+    directions = [(y2 > y1) - (y2 < y1) for (_, y1), (_, y2) in segments]
+    sloped = [index for index, direction in enumerate(directions) if direction]
+    # start at an edge that turns from the sloped edge before it, so no chain wraps around the end
+    starts = [
+        index for previous, index in zip(sloped[-1:] + sloped, sloped) if directions[previous] != directions[index]
+    ]
+    if not starts:
+        return []
+
+    chains = []
+    points = direction = None
+    for offset in range(len(segments)):
+        index = (starts[0] + offset) % len(segments)
+        (start, end), turn = segments[index], directions[index]
+        if turn and turn != direction:
+            if points:
+                chains.append(_Chain(points if direction > 0 else points[::-1], direction))
+            points, direction = [start], turn
+        points.append(end)
+    chains.append(_Chain(points if direction > 0 else points[::-1], direction))
+    return chains
+
+
+def _row_boundaries(chains: list[_Chain], row: int, size: int, nonzero: bool) -> list[tuple] | None:
+    """Pair the chains that start and end each span inside the polygons on a whole row, with the fill rule.
+
+    Returns:
+        list[tuple] | None: The pairs of chains, or None if the row must be sampled on lines instead, since
+            chains start, end or cross within it, or leave the sides of the image.
+    """
+    for chain in chains:
+        if chain.top > row or chain.bottom < row + 1:
+            return None
+        points = chain.points
+        while points[chain.index + 1][1] <= row:
+            chain.index += 1
+
+    # the order of the chains must hold at the top and bottom of the row, and every vertex within it
+    heights = [(row, True), (row + 1, False)]
+    for chain in chains:
+        points = chain.points
+        index = chain.index + 1
+        while points[index][1] < row + 1:
+            heights += [(points[index][1], True), (points[index][1], False)]
+            index += 1
+    middle = [chain.x_at(row + 0.5, False) for chain in chains]
+    order = sorted(range(len(chains)), key=middle.__getitem__)
+    for y, below in heights:
+        xs = [chains[index].x_at(y, below) for index in order]
+        if any(x > next_x for x, next_x in zip(xs, xs[1:])) or xs[0] < 0 or xs[-1] > size:
+            return None
+
+    ordered = [chains[index] for index in order]
+    return _boundaries(ordered, [chain.direction for chain in ordered], nonzero)
+
+
+def _boundaries(crossings: list, directions: list[int], nonzero: bool) -> list[tuple]:
+    """Pair the sorted crossings of a line that start and end each span inside the edges, with the fill rule."""
+    if not nonzero:
+        return list(zip(crossings[::2], crossings[1::2]))
+
+    pairs = []
+    winding = 0
+    start = None
+    for crossing, direction in zip(crossings, directions):
+        if not winding:
+            start = crossing
+        winding += direction
+        if not winding:
+            pairs.append((start, crossing))
+    return pairs
+
+
+def _add_span(changes: list[int], touched: list[int], start: float, end: float, width: int) -> None:
+    """Add the coverage of a span of a line, in SUBCOLUMNS of a pixel, to the changes of its row."""
+    left = 0 if start < 0 else width if start > width else int(start + 0.5)
+    right = 0 if end < 0 else width if end > width else int(end + 0.5)
+    if left < right:
+        # the span covers the rest of its first pixel, every pixel after it, and part of its last
+        first, fraction = divmod(left, SUBCOLUMNS)
+        changes[first] += SUBCOLUMNS - fraction
+        changes[first + 1] += fraction
+        last, fraction = divmod(right, SUBCOLUMNS)
+        changes[last] -= SUBCOLUMNS - fraction
+        changes[last + 1] -= fraction
+        touched += (first, first + 1, last, last + 1)
+
+
+def _add_area(changes: list[int], touched: list[int], entry: float, exit: float, weight: int) -> None:
+    """Add the area of each pixel of a row right of an edge within it, in pixels, to the changes of the row.
+
+    The weight is the signed height of the edge, in the units of the spans of all SUBROWS lines of a row,
+    and the areas add up to it exactly.
+    """
+    left, right = (entry, exit) if entry < exit else (exit, entry)
+    first, last = math.floor(left), math.ceil(right)
+    if last <= first + 1:
+        # the edge stays within a pixel, covering the part of it right of the edge's middle
+        covered = round(weight * ((entry + exit) / 2 - first))
+        changes[first] += weight - covered
+        changes[first + 1] += covered
+        touched += (first, first + 1)
+        return
+
+    # the edge crosses several pixels, leaving a triangle in the first and last, and trapezoids between
+    inverse = 1 / (right - left)
+    start = round(weight * 0.5 * inverse * (first + 1 - left) ** 2)
+    end = round(weight * 0.5 * inverse * (right - last + 1) ** 2)
+    changes[first] += start
+    if last == first + 2:
+        changes[first + 1] += weight - start - end
+    else:
+        step = round(weight * inverse * (1.5 - left + first)) - start
+        changes[first + 1] += step
+        middle = round(weight * inverse)
+        for pixel in range(first + 2, last - 1):
+            changes[pixel] += middle
+        # the pixel before the last takes what's left, so the areas add up to the weight
+        changes[last - 1] += weight - start - step - (last - first - 3) * middle - end
+    changes[last] += end
+    touched += range(first, last + 1)
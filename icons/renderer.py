@@ -0,0 +1,224 @@
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Hashable
+
+from .config import check_config, load_config
+from .downloads import fetch_sources
+from .inputs import BaseInput
+from .outputs import BaseOutput
+from .providers import input_provider, output_provider
+from .scheduler import load_context
+
+# 64 MiB of encoded images
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# the number of source images kept loaded, each with its own cache of parsed and decoded renders
+DEFAULT_MAX_INPUTS = 256
+# the number of distinct output configs kept built, each with its own cache of background canvases
+DEFAULT_MAX_OUTPUTS = 64
+
+# output options that only affect where the build writes files, or which images it writes them for
+PATH_OPTIONS = ('directory-override', 'file-prefix', 'selectors', 'sizes')
+
+
+class LruCache:
+    """A thread-safe least-recently-used cache, bounded by the total weight of its values."""
+
+    def __init__(self, max_weight: int, weigh: Callable[[object], int] = lambda value: 1):
+        self.max_weight = max_weight
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self._weigh = weigh
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._values.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value) -> None:
+        weight = self._weigh(value)
+        # don't let a single oversized value flush the rest of the cache
+        if weight > self.max_weight:
+            return
+
+        with self._lock:
+            if key in self._values:
+                self.weight -= self._weigh(self._values.pop(key))
+            self._values[key] = value
+            self.weight += weight
+
+            while self.weight > self.max_weight:
+                _, evicted = self._values.popitem(last=False)
+                self.weight -= self._weigh(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.weight = 0
+
+
+class Renderer:
+    """Renders icons on demand from the sources of a config, without writing any files.
+
+    Loaded source images, with their parsed SVG trees and decoded bitmaps, and the encoded renders are kept
+    in memory, so repeated requests are served without touching the sources. Renderers don't change any
+    module-level state, so several can be used side by side, and a single one can be shared between threads.
+
+    Args:
+        icon_config (dict): The parsed icons config.
+        source_folder (str | Path): The folder source paths are relative to.
+        max_bytes (int): The total size of the encoded renders to keep.
+        max_inputs (int): The number of source images to keep loaded.
+    """
+
+    def __init__(
+        self,
+        icon_config: dict,
+        source_folder: str | Path = 'source',
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_inputs: int = DEFAULT_MAX_INPUTS,
+    ):
+        check_config(icon_config)
+        self.context = load_context(icon_config, source_folder)
+        fetch_sources(self.context.sources)
+
+        # unset render options fall back to the config's output defaults
+        self.output_defaults = {
+            key: value for key, value in icon_config.get('output-defaults', {}).items() if key not in PATH_OPTIONS
+        }
+
+        self.renders = LruCache(max_bytes, weigh=len)
+        self.inputs = LruCache(max_inputs)
+        self.outputs = LruCache(DEFAULT_MAX_OUTPUTS)
+        self._paths = {}
+        self._paths_lock = threading.Lock()
+        self._inputs_lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, config: str | Path, source_folder: str | Path = 'source', **kwargs) -> 'Renderer':
+        return cls(load_config(config), source_folder, **kwargs)
+
+    def names(self) -> list[str]:
+        """Generate the sorted names of every icon that can be rendered."""
+        return sorted(self._scan())
+
+    def icon(
+        self,
+        name: str,
+        size: int,
+        color: str = None,
+        background: str = None,
+        margin: int | str = None,
+        format: str = 'png',
+    ) -> bytes:
+        """Render an icon and encode it, reusing a previous render of the same icon if there is one.
+
+        Args:
+            name (str): The name of the source image, without its extension.
+            size (int): The size of the icon.
+            color (str): The color to change the image to, defaults to the config's output default.
+            background (str): The background color, defaults to the config's output default.
+            margin (int | str): The margin around the image, defaults to the config's output default.
+            format (str): The format to encode the icon in.
+
+        Returns:
+            bytes: The encoded icon.
+
+        Raises:
+            KeyError: If no source has an image with the name.
+            ValueError: If the options are invalid, or the size is larger than a bitmap source image.
+        """
+        options = {'color': color, 'background': background, 'margin': margin}
+        output_config = (
+            self.output_defaults
+            | {key: value for key, value in options.items() if value is not None}
+            | {'format': format, 'sizes': [size]}
+        )
+        output_key = json.dumps(output_config, sort_keys=True, default=str)
+        render_key = (name, output_key)
+
+        data = self.renders.get(render_key)
+        if data is not None:
+            return data
+
+        lock, input_ = self._get_input(name)
+        output = self._get_output(output_key, output_config)
+
+        # inputs cache their renders, which isn't thread-safe, so only render one variant of an image at a time
+        with lock:
+            # another thread may have rendered the icon while this one was waiting
+            data = self.renders.get(render_key)
+            if data is None:
+                data = self._render(input_, output, size)
+                self.renders.put(render_key, data)
+        return data
+
+    def clear(self) -> None:
+        """Forget every loaded image and render, so changes to the sources are picked up."""
+        self.renders.clear()
+        self.inputs.clear()
+        self.outputs.clear()
+        with self._paths_lock:
+            self._paths = {}
+
+    def _scan(self) -> dict[str, tuple[int, Path]]:
+        paths = {}
+        for source_index, source in enumerate(self.context.sources):
+            for image_path in source.get():
+                # the first source in the config wins when several have an image with the same name
+                paths.setdefault(image_path.stem, (source_index, image_path))
+        with self._paths_lock:
+            self._paths = paths
+        return paths
+
+    def _get_input(self, name: str) -> tuple[threading.Lock, BaseInput]:
+        # read the paths once, since clear() or another thread's scan may replace them at any time
+        paths = self._paths
+        if name not in paths:
+            # the image may have been added since the sources were last listed
+            paths = self._scan()
+        if name not in paths:
+            raise KeyError(f'No source has an image named "{name}"')
+        source_index, image_path = paths[name]
+
+        # load each image once, even if several threads ask for it at the same time
+        with self._inputs_lock:
+            cached = self.inputs.get((source_index, image_path))
+            if cached is None:
+                source = self.context.sources[source_index]
+                input_ = input_provider.get(
+                    {'path': image_path, 'source': source, 'format': source.format}
+                    | self.context.input_configs[source_index]
+                )
+                cached = (threading.Lock(), input_)
+                self.inputs.put((source_index, image_path), cached)
+        return cached
+
+    def _get_output(self, output_key: str, output_config: dict) -> BaseOutput:
+        output = self.outputs.get(output_key)
+        if output is None:
+            # outputs only build paths, they never write, so the provider's base path is never used
+            output = output_provider.get(dict(output_config))
+            self.outputs.put(output_key, output)
+        return output
+
+    @staticmethod
+    def _render(input_: BaseInput, output: BaseOutput, size: int) -> bytes:
+        core_size = output.plan.core_size(size)
+        img, _ = output.generate(
+            img=output.ingest(input_, core_size), input=input_, target_size=size, core_size=core_size
+        )
+        return output.encode(img)
@@ -0,0 +1,272 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import TYPE_CHECKING, Generator, NamedTuple
+
+from .manifest import config_key
+from .providers import output_provider, source_provider
+
+if TYPE_CHECKING:
+    # only imported with the first source and output, since they import Pillow
+    from .outputs import OutputPlan
+    from .sources import BaseSource
+
+LOGGER = logging.getLogger(__name__)
+
+# the number of chunks handed to each worker, trading scheduling overhead for load balancing
+CHUNKS_PER_WORKER = 4
+# the number of sources listed at once, since listing folders on network file systems mostly waits on the server
+LIST_THREADS = 8
+
+# output options that only decide where the files go and which images get them, not what the images look like
+PLACEMENT_OPTIONS = ('directory-override', 'file-prefix', 'selectors')
+
+
+class BuildContext(NamedTuple):
+    """Everything the workers need to resolve a job, sent once to each worker instead of with every job."""
+
+    sources: list['BaseSource']
+    input_configs: list[dict]
+    output_configs: list[list[dict]]
+    # the names selected by each output, or None if it applies to every image
+    selectors: list[list[frozenset[str] | None]]
+    # the key of each output's source and output config, so config edits only rebuild what they change
+    config_keys: list[list[str]]
+    # how each output groups renders into files, see BaseOutput.packing
+    packing: list[list[str | None]]
+    # outputs of a source with the same render key generate identical images for the sizes they share
+    render_keys: list[list[str]]
+    # the core size of every output size and the parsed background of each output
+    plans: list[list['OutputPlan']]
+
+
+class BuildJob(NamedTuple):
+    """A single output image to render: one size of one output for one source image.
+
+    Sources and outputs are referenced by their index in the BuildContext to keep jobs small.
+    """
+
+    source_index: int
+    image_path: Path
+    output_index: int
+    target_size: int
+    # other outputs that generate the same image at this size, which get a copy of this job's file
+    duplicates: tuple[int, ...] = ()
+
+    @property
+    def output_indexes(self) -> tuple[int, ...]:
+        return (self.output_index, *self.duplicates)
+
+
+class PackJob(NamedTuple):
+    """Every size of one output for one or more source images, rendered in memory and packed into shared files."""
+
+    source_index: int
+    image_paths: tuple[Path, ...]
+    output_index: int
+
+    @property
+    def output_indexes(self) -> tuple[int, ...]:
+        return (self.output_index,)
+
+
+def is_selected(names: frozenset[str] | None, image_path: Path) -> bool:
+    return names is None or image_path.stem in names
+
+
+def render_key(output_config: dict) -> str:
+    """Generate a key for the options of an output that affect the images it generates."""
+    config = {key: value for key, value in output_config.items() if key not in PLACEMENT_OPTIONS}
+    # chained resampling derives each size from the output's other sizes, so the sizes matter too
+    if not config.get('resample-chain'):
+        config.pop('sizes', None)
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+def compile_selectors(output_config: dict) -> frozenset[str] | None:
+    """Generate the set of image names selected by an output, or None if it applies to every image."""
+    selectors = output_config.get('selectors')
+    if not selectors or selectors == '*':
+        return None
+    return frozenset(selectors)
+
+
+def selector_union(selectors: list[frozenset[str] | None]) -> frozenset[str] | None:
+    """Generate the set of image names used by any of the outputs, or None if any output uses every image."""
+    if not selectors or None in selectors:
+        return None
+    return frozenset().union(*selectors)
+
+
+def load_context(icon_config: dict, source_folder: str | Path = None) -> BuildContext:
+    """Create the sources and defaulted configs for every source in the config.
+
+    The config is expected to be valid, see icons.config.load_config().
+
+    Args:
+        icon_config (dict): The parsed icons config.
+        source_folder (str | Path): The folder source paths are relative to, defaults to the provider's base path.
+
+    Returns:
+        BuildContext: The context for the config.
+    """
+    from .outputs import OutputPlan
+
+    context = BuildContext([], [], [], [], [], [], [], [])
+    source_defaults = icon_config.get('source-defaults') or {}
+    output_defaults = icon_config.get('output-defaults') or {}
+    for source_config in icon_config['sources']:
+        # combine the default config with the source config
+        defaulted_source_config = source_defaults | source_config
+        LOGGER.debug('Processing source config: %s', defaulted_source_config)
+        # the provider pops the type from the config, so copy the config for the key first
+        source_key_config = {key: value for key, value in defaulted_source_config.items() if key != 'outputs'}
+        context.sources.append(source_provider.get(defaulted_source_config, base_path=source_folder))
+
+        # options that are passed through to the inputs created from the source
+        input_config = {}
+        for key in ('delta-rank', 'fast-rasterizer'):
+            if key in defaulted_source_config:
+                input_config[key] = defaulted_source_config[key]
+        context.input_configs.append(input_config)
+
+        output_configs = [output_defaults | output_config for output_config in defaulted_source_config['outputs']]
+        context.output_configs.append(output_configs)
+        context.selectors.append([compile_selectors(output_config) for output_config in output_configs])
+        context.packing.append(
+            [output_provider.get_class(output_config['format']).packing for output_config in output_configs]
+        )
+        context.config_keys.append([config_key(source_key_config, output_config) for output_config in output_configs])
+        context.render_keys.append([render_key(output_config) for output_config in output_configs])
+        context.plans.append(
+            [
+                OutputPlan.compile(
+                    output_config['sizes'],
+                    output_config.get('margin'),
+                    output_config.get('background'),
+                    output_config.get('color'),
+                )
+                for output_config in output_configs
+            ]
+        )
+
+    return context
+
+
+def expand_jobs(context: BuildContext, threads: int = LIST_THREADS) -> Generator[BuildJob | PackJob, None, None]:
+    """Expand every source, image, output and size in the context into individual jobs.
+
+    Jobs for the same image are yielded next to each other, so chunks sent to a worker
+    share as many ingested images as possible. Outputs that pack every image into shared
+    files get a single job for the whole source, after its other jobs. Sources are listed
+    on a pool of threads, while the jobs of the sources before them are yielded.
+
+    Args:
+        context (BuildContext): The context to expand.
+        threads (int): The number of sources to list at once.
+
+    Yields:
+        BuildJob | PackJob: The jobs for the context.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(context.sources)))) as executor:
+        listings = [executor.submit(list_images, context, source_index) for source_index in range(len(context.sources))]
+        for source_index, listing in enumerate(listings):
+            yield from _source_jobs(context, source_index, listing.result())
+
+
+def list_images(context: BuildContext, source_index: int) -> list[Path]:
+    # let the source skip images that no output selects, so they're never opened
+    return list(context.sources[source_index].get(names=selector_union(context.selectors[source_index])))
+
+
+def _source_jobs(
+    context: BuildContext, source_index: int, image_paths: list[Path]
+) -> Generator[BuildJob | PackJob, None, None]:
+    source = context.sources[source_index]
+    for image_path in image_paths:
+        LOGGER.debug('Found %s image: %s', source.format, image_path)
+        yield from image_jobs(context, source_index, image_path)
+    yield from sheet_jobs(context, source_index, image_paths)
+
+    if source.pruned:
+        LOGGER.info(
+            'Pruned %s of %s images from %s since no selector includes them',
+            source.pruned,
+            source.pruned + len(image_paths),
+            source,
+        )
+
+
+def image_jobs(context: BuildContext, source_index: int, image_path: Path) -> Generator[BuildJob | PackJob, None, None]:
+    """Expand every output and size that applies to a single image of a source into individual jobs.
+
+    Outputs that generate the same image at a size share a single job, which writes the file for
+    every one of them. Outputs that pack every size of an image into a file get a single job for the
+    image, and outputs that pack every image are left to sheet_jobs().
+    """
+    selectors = context.selectors[source_index]
+    render_keys = context.render_keys[source_index]
+    # the outputs that share each render, in the order they were first seen
+    renders = {}
+    for output_index, output_config in enumerate(context.output_configs[source_index]):
+        # skip output if image not specified by any selectors
+        if not is_selected(selectors[output_index], image_path):
+            continue
+
+        packing = context.packing[source_index][output_index]
+        if packing is not None:
+            if packing == 'sizes':
+                yield PackJob(source_index, (image_path,), output_index)
+            continue
+
+        # chained resampling derives each size from a larger one, so build the largest first
+        sizes = output_config['sizes']
+        if output_config.get('resample-chain'):
+            sizes = sorted(sizes, reverse=True)
+
+        for target_size in sizes:
+            renders.setdefault((render_keys[output_index], target_size), []).append(output_index)
+
+    for (_, target_size), output_indexes in renders.items():
+        yield BuildJob(source_index, image_path, output_indexes[0], target_size, tuple(output_indexes[1:]))
+
+
+def sheet_jobs(context: BuildContext, source_index: int, image_paths: list[Path]) -> Generator[PackJob, None, None]:
+    """Generate a job for each output of a source that packs every image it selects into shared files."""
+    selectors = context.selectors[source_index]
+    for output_index, packing in enumerate(context.packing[source_index]):
+        if packing != 'images':
+            continue
+
+        selected = tuple(sorted(path for path in image_paths if is_selected(selectors[output_index], path)))
+        if selected:
+            yield PackJob(source_index, selected, output_index)
+
+
+def chunk_size(job_count: int, processes: int) -> int:
+    """Generate the number of jobs to send to a worker at once."""
+    size, remainder = divmod(job_count, processes * CHUNKS_PER_WORKER)
+    return size + 1 if remainder else max(size, 1)
+
+
+def batch_jobs(build_jobs: list[BuildJob | PackJob], size: int) -> list[list[BuildJob | PackJob]]:
+    """Split the jobs into consecutive batches of about the given size, without splitting the jobs of an image.
+
+    Chained resampling derives smaller sizes from larger ones rendered earlier by the same worker, so an
+    image split between workers would render differently depending on the number of workers.
+    """
+    batches = []
+    batch = []
+    previous = None
+    for build_job in build_jobs:
+        image_paths = build_job.image_paths if isinstance(build_job, PackJob) else (build_job.image_path,)
+        images = (build_job.source_index, image_paths)
+        if len(batch) >= size and images != previous:
+            batches.append(batch)
+            batch = []
+        batch.append(build_job)
+        previous = images
+    if batch:
+        batches.append(batch)
+    return batches
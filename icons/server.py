@@ -0,0 +1,123 @@
+import json
+import logging
+import mimetypes
+import re
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .renderer import Renderer
+
+LOGGER = logging.getLogger(__name__)
+
+HOST = '127.0.0.1'
+PORT = 8000
+# the largest icon the server renders, so a single request can't exhaust the server's memory
+MAX_SIZE = 4096
+
+# /icons/<name>/<size>.<format>
+ICON_PATH = re.compile(r'^/icons/(?P<name>[^/]+)/(?P<size>\d+)\.(?P<format>\w+)$')
+HEX_COLOR = re.compile(r'^[0-9a-fA-F]{3,8}$')
+
+
+class IconRequestHandler(BaseHTTPRequestHandler):
+    """Serves renders of a Renderer's icons, with the render options passed as query parameters.
+
+    `GET /icons` lists the icon names, and `GET /icons/<name>/<size>.<format>?color=&background=&margin=`
+    renders an icon. Colors may be given without their leading `#`, and margins without a unit are in pixels.
+    """
+
+    # keep connections open, so clients can send many requests without reconnecting
+    protocol_version = 'HTTP/1.1'
+    server: 'IconServer'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip('/') == '/icons':
+            body = json.dumps(self.server.renderer.names()).encode()
+            return self._send(HTTPStatus.OK, body, 'application/json')
+
+        match = ICON_PATH.match(url.path)
+        if match is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, 'Not found')
+
+        size = int(match['size'])
+        if not 0 < size <= MAX_SIZE:
+            return self._send_error(HTTPStatus.BAD_REQUEST, f'Size must be between 1 and {MAX_SIZE}')
+
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            data = self.server.renderer.icon(
+                unquote(match['name']),
+                size,
+                color=parse_color(query.get('color')),
+                background=parse_color(query.get('background')),
+                margin=parse_margin(query.get('margin')),
+                format=match['format'].lower(),
+            )
+        except KeyError as e:
+            return self._send_error(HTTPStatus.NOT_FOUND, e.args[0])
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+
+        content_type, _ = mimetypes.guess_type(f'icon.{match["format"]}')
+        self._send(HTTPStatus.OK, data, content_type or 'application/octet-stream')
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format, *args)
+
+    def _send_error(self, status: HTTPStatus, message: str):
+        self._send(status, message.encode(), 'text/plain; charset=utf-8')
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class IconServer(ThreadingHTTPServer):
+    """Serves icons from a renderer, handling each connection on its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, renderer: Renderer, host: str = HOST, port: int = PORT):
+        super().__init__((host, port), IconRequestHandler)
+        self.renderer = renderer
+
+
+def parse_color(value: str | None) -> str | None:
+    if value and HEX_COLOR.match(value):
+        return f'#{value}'
+    return value or None
+
+
+def parse_margin(value: str | None) -> int | str | None:
+    if value and value.isdigit():
+        return int(value)
+    return value or None
+
+
+def serve(renderer: Renderer, host: str = HOST, port: int = PORT) -> None:
+    """Serve icons from the renderer until interrupted."""
+    with IconServer(renderer, host, port) as server:
+        print(f'Serving icons on http://{host}:{server.server_port}/icons, press Ctrl+C to stop')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve icons rendered on demand over HTTP.')
+    parser.add_argument('-c', '--config', default='icons-config.yaml', help='path to config file')
+    parser.add_argument('-s', '--source-folder', default='source', help='path to source folder')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.WARNING)
+    serve(Renderer.from_file(args.config, args.source_folder), args.host, args.port)
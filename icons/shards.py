@@ -0,0 +1,212 @@
+import json
+import logging
+from pathlib import Path, PurePath
+from typing import Iterable, NamedTuple
+
+from .files import LINK_MODES, link_file
+from .manifest import BuildManifest, code_version, hash_bytes
+from .scheduler import BuildContext, BuildJob, PackJob
+
+LOGGER = logging.getLogger(__name__)
+
+SHARD_NAME = '.icons-shard.json'
+SHARD_VERSION = 1
+
+
+class Shard(NamedTuple):
+    """One of `count` disjoint slices of a build, numbered from 1 like CI parallel jobs usually are."""
+
+    index: int
+    count: int
+
+    def __str__(self):
+        return f'{self.index}/{self.count}'
+
+    @classmethod
+    def parse(cls, value: str) -> 'Shard':
+        """Parse a shard written as `i/N`, e.g. `2/4`.
+
+        Raises:
+            ValueError: If the value isn't a shard from 1/N to N/N.
+        """
+        index, _, count = value.partition('/')
+        try:
+            shard = cls(int(index), int(count))
+        except ValueError:
+            raise ValueError(f'{value!r} is not a shard, e.g. 2/4') from None
+        if not 1 <= shard.index <= shard.count:
+            raise ValueError(f'{value!r} is not a shard, the index must be from 1 to {shard.count}')
+        return shard
+
+
+class ShardError(ValueError):
+    """Raised with every problem found when merging shards, so a broken merge can be diagnosed at once."""
+
+    def __init__(self, problems: list[str]):
+        self.problems = problems
+        super().__init__("Can't merge the shards:\n" + '\n'.join(f'  {problem}' for problem in problems))
+
+
+def unit_key(context: BuildContext, build_job: BuildJob | PackJob) -> str:
+    """Generate the key a job is sharded by, which is the same on every machine building the config.
+
+    Jobs are sharded by image rather than one by one, so each image is only loaded by one shard, and the
+    sizes it shares between outputs or resamples from each other are built together. Outputs that pack
+    every image of a source into shared files are a unit of their own.
+    """
+    source = context.sources[build_job.source_index]
+    if isinstance(build_job, PackJob) and context.packing[build_job.source_index][build_job.output_index] == 'images':
+        return f'{build_job.source_index}:sheet:{build_job.output_index}'
+
+    image_path = build_job.image_paths[0] if isinstance(build_job, PackJob) else build_job.image_path
+    # source folders may be checked out to a different place on each machine
+    try:
+        image_path = PurePath(image_path).relative_to(source.base_path)
+    except ValueError:
+        pass
+    return f'{build_job.source_index}:image:{PurePath(image_path).as_posix()}'
+
+
+def shard_of(unit: str, count: int) -> int:
+    # a stable hash, unlike hash(), which is randomized for every interpreter
+    return int(hash_bytes(unit)[:16], 16) % count + 1
+
+
+def select_jobs(
+    context: BuildContext, build_jobs: Iterable[BuildJob | PackJob], shard: Shard
+) -> tuple[list[BuildJob | PackJob], set[str]]:
+    """Select the jobs of a shard.
+
+    Returns:
+        tuple[list[BuildJob | PackJob], set[str]]: The jobs of the shard, in their original order, and their units.
+    """
+    selected = []
+    units = set()
+    for build_job in build_jobs:
+        unit = unit_key(context, build_job)
+        if shard_of(unit, shard.count) == shard.index:
+            selected.append(build_job)
+            units.add(unit)
+    return selected, units
+
+
+def plan_key(context: BuildContext) -> str:
+    """Generate a key for the config and code of a build, so shards built from different ones aren't merged."""
+    return hash_bytes(code_version(), *(key for keys in context.config_keys for key in keys))
+
+
+def save_shard(output_folder: str | Path, shard: Shard, context: BuildContext, units: set[str]) -> None:
+    """Record which shard was built into an output folder, and the units it built, for merge_shards()."""
+    path = Path(output_folder) / SHARD_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(
+            {'version': SHARD_VERSION, 'shard': str(shard), 'plan': plan_key(context), 'units': sorted(units)},
+            f,
+            indent=2,
+        )
+
+
+def merge_shards(
+    context: BuildContext,
+    build_jobs: Iterable[BuildJob | PackJob],
+    shard_folders: list[str | Path],
+    output_folder: str | Path,
+    link_mode: str = LINK_MODES[0],
+) -> BuildManifest:
+    """Combine the output folders of every shard of a build into one, after checking that they're complete.
+
+    Every shard of the build must be there once, built from the same config, and together they must have
+    built every job of the build. Every file in their manifests must exist with the hash it was built with.
+
+    Args:
+        context (BuildContext): The context of the whole build.
+        build_jobs (Iterable[BuildJob | PackJob]): Every job of the whole build.
+        shard_folders (list[str | Path]): The output folders of the shards.
+        output_folder (str | Path): The folder to combine them into.
+        link_mode (str): The cheapest way to give the shards' files their path in the output folder.
+
+    Raises:
+        ShardError: With every problem found, before anything is written.
+
+    Returns:
+        BuildManifest: The manifest of the combined output folder, which is saved to it.
+    """
+    problems = []
+    expected_plan = plan_key(context)
+    records = {}
+    count = None
+    for shard_folder in map(Path, shard_folders):
+        try:
+            with open(shard_folder / SHARD_NAME) as f:
+                record = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            problems.append(f'{shard_folder} is not a shard: {e}')
+            continue
+        if record.get('version') != SHARD_VERSION:
+            problems.append(f'{shard_folder} was built by an incompatible version')
+            continue
+
+        shard = Shard.parse(record['shard'])
+        if record['plan'] != expected_plan:
+            problems.append(f'{shard_folder} (shard {shard}) was built from a different config')
+        if count is None:
+            count = shard.count
+        elif shard.count != count:
+            problems.append(f'{shard_folder} is shard {shard}, but other shards are of {count}')
+        if shard.index in records:
+            problems.append(f'{shard_folder} and {records[shard.index][0]} are both shard {shard}')
+        records[shard.index] = (shard_folder, record)
+
+    if count is not None:
+        missing = sorted(set(range(1, count + 1)) - records.keys())
+        if missing:
+            problems.append(f'Missing shards {", ".join(f"{index}/{count}" for index in missing)}')
+
+        # every unit of the build must have been built by the shard it hashes to
+        expected_units = {unit_key(context, build_job) for build_job in build_jobs}
+        for index, (shard_folder, record) in sorted(records.items()):
+            built = set(record['units'])
+            assigned = {unit for unit in expected_units if shard_of(unit, count) == index}
+            for unit in sorted(assigned - built):
+                problems.append(f'{shard_folder} (shard {index}/{count}) is missing {unit}')
+            for unit in sorted(built - expected_units):
+                problems.append(f"{shard_folder} (shard {index}/{count}) built {unit}, which isn't in the config")
+    elif not problems:
+        problems.append('No shards to merge')
+
+    # every file the shards recorded must be there, unchanged, and no two shards may write the same file
+    entries = {}
+    owners = {}
+    for index, (shard_folder, _) in sorted(records.items()):
+        for relative_path, entry in BuildManifest.load(shard_folder).entries.items():
+            path = shard_folder / relative_path
+            if relative_path in owners:
+                problems.append(f'{relative_path} was built by both {owners[relative_path]} and {shard_folder}')
+                continue
+            try:
+                data_hash = hash_bytes(path.read_bytes())
+            except FileNotFoundError:
+                problems.append(f"{path} is in the manifest of {shard_folder}, but doesn't exist")
+                continue
+            if data_hash != entry.get('hash'):
+                problems.append(f'{path} changed since it was built')
+                continue
+            owners[relative_path] = shard_folder
+            entries[relative_path] = entry
+
+    if problems:
+        raise ShardError(problems)
+
+    manifest = BuildManifest(output_folder)
+    for relative_path, shard_folder in owners.items():
+        output_path = manifest.output_folder / relative_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        link_file(shard_folder / relative_path, output_path, link_mode)
+    # remove outputs of a previous build into the folder that no shard built this time
+    for path in BuildManifest.load(output_folder).prune(entries):
+        LOGGER.info('Removed stale output %s', path)
+    manifest.entries = entries
+    manifest.save()
+    LOGGER.info('Merged %s files from %s shards into %s', len(entries), len(records), output_folder)
+    return manifest
@@ -1,35 +1,88 @@
+import mmap
+import os
 import tempfile
 import zipfile
 from abc import abstractmethod
 from functools import partial
 from pathlib import Path, PurePath, PurePosixPath
-from typing import Generator
+from typing import Generator, Iterable
 
-import requests
-
-from .base import Base, BaseBuilder, BaseProvider
+from .base import Base, BaseBuilder
+from .downloads import Downloader
+from .providers import source_provider
 from .utils import register
 
 
+# files smaller than this are read, since mapping them costs more than it saves
+MMAP_THRESHOLD = 1024 * 1024
+
+
 class BaseSource(Base):
     requires_fetching = False
+    # the number of files skipped by the last get() since no selector matched them
+    pruned = 0
 
     @abstractmethod
-    def get(self) -> Generator[Path, None, None]:
+    def get(self, names: set[str] = None) -> Generator[Path, None, None]:
+        """Yield the paths of the source's images.
+
+        Args:
+            names (set[str]): If set, only yield images whose name without the extension is included.
+        """
         pass
 
+    def _select(self, paths: Iterable[PurePath], names: set[str] = None) -> Generator[PurePath, None, None]:
+        # filter on the path alone, so skipped files are never opened
+        self.pruned = 0
+        for path in paths:
+            if names is None or path.stem in names:
+                yield path
+            else:
+                self.pruned += 1
+
+    def read(self, path: Path) -> bytes:
+        """Read the contents of a path yielded by get()."""
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def map(self, path: Path) -> bytes | mmap.mmap:
+        """Map the contents of a path yielded by get() into memory, or read it if it's too small to be worth it.
+
+        Mapped pages are backed by the file, so the OS can drop them under memory pressure instead of
+        counting them against the process. The file must not be truncated while it's mapped.
+        """
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < MMAP_THRESHOLD:
+                return f.read()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load(self, path: Path, memory_map: bool = False) -> bytes | mmap.mmap:
+        """Get the contents of a path yielded by get(), mapping large files into memory if `memory_map` is set."""
+        return self.map(path) if memory_map else self.read(path)
+
+    def stamp(self, path: Path) -> tuple | None:
+        """Generate a cheap fingerprint of a path yielded by get() that changes when its contents do.
+
+        Returns:
+            tuple | None: The fingerprint, or None if the path no longer exists.
+        """
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
 
-source_provider = BaseProvider(fallback_key='type', fallback_method='pop')
 register_source = partial(register, provider=source_provider)
 
 
 @register_source('file')
 class FileSource(BaseSource):
-    def get(self):
-        if self.path.suffix != self.format:
+    def get(self, names=None):
+        if self.path.suffix != f'.{self.format}':
             raise ValueError('Path {} does not have the correct extension for {}'.format(self.path, self.format))
 
-        yield self.base_path / self.path
+        yield from self._select([self.base_path / self.path], names)
 
 
 class FileSourceBuilder(BaseBuilder):
@@ -46,7 +99,10 @@ class DirectorySource(BaseSource):
             target_folders = []
         self.target_folders = [PurePath(folder) for folder in target_folders]
 
-    def get(self):
+    def get(self, names=None):
+        yield from self._select(self._glob(), names)
+
+    def _glob(self):
         path = self.base_path / self.path
         # set glob pattern based on recursion
         pattern = '**/*' if self.recurse else '*'
@@ -60,8 +116,84 @@ class DirectorySource(BaseSource):
                 yield from (path / folder).glob(pattern)
 
 
+@register_source('archive', 'zip')
+class ArchiveSource(DirectorySource):
+    """Reads images straight out of a zip archive without extracting it.
+
+    Members are yielded as paths under the base path, as if the archive had been extracted there.
+    """
+
+    def __init__(self, root: str = '', **kwargs):
+        super().__init__(**kwargs)
+        # the folder inside the archive that target folders are relative to
+        self.root = PurePosixPath(root)
+        self._zip_file = None
+        self._zip_file_key = None
+
+    def __getstate__(self):
+        # open zip files can't be pickled, so each worker opens its own
+        state = self.__dict__.copy()
+        state['_zip_file'] = None
+        state['_zip_file_key'] = None
+        return state
+
+    @property
+    def archive_path(self) -> Path:
+        return self.base_path / self.path
+
+    @property
+    def zip_file(self) -> zipfile.ZipFile:
+        # forked workers would share the parent's file offset, so reopen the archive in each process,
+        # and reopen it when the archive is replaced so watch mode sees the new members
+        key = (os.getpid(), BaseSource.stamp(self, self.archive_path))
+        if self._zip_file is None or self._zip_file_key != key:
+            if self._zip_file is not None and self._zip_file_key[0] == key[0]:
+                self._zip_file.close()
+            self._zip_file = zipfile.ZipFile(self.archive_path, 'r')
+            self._zip_file_key = key
+        return self._zip_file
+
+    def get(self, names=None):
+        yield from self._select(self._list_members(), names)
+
+    def _list_members(self):
+        folders = [self.root / folder for folder in self.target_folders] or [self.root]
+        suffix = f'.{self.format}'
+
+        # filter the members by listing the archive's central directory, without reading any of them
+        for info in self.zip_file.infolist():
+            member = PurePosixPath(info.filename)
+            if info.is_dir() or member.suffix != suffix:
+                continue
+
+            for folder in folders:
+                if not member.is_relative_to(folder):
+                    continue
+
+                # only include direct children of the folder unless recursing
+                if self.recurse or len(member.relative_to(folder).parts) == 1:
+                    yield self.base_path / member
+                    break
+
+    def read(self, path: Path) -> bytes:
+        member = PurePath(path).relative_to(self.base_path).as_posix()
+        return self.zip_file.read(member)
+
+    def map(self, path: Path) -> bytes:
+        # members are usually compressed, so they have to be read
+        return self.read(path)
+
+    def stamp(self, path: Path) -> tuple | None:
+        member = PurePath(path).relative_to(self.base_path).as_posix()
+        try:
+            info = self.zip_file.getinfo(member)
+        except KeyError:
+            return None
+        return info.CRC, info.file_size
+
+
 @register_source('url')
-class UrlSource(DirectorySource, FileSource):
+class UrlSource(ArchiveSource, FileSource):
     requires_fetching = True
 
     def __init__(self, **kwargs):
@@ -71,24 +203,45 @@ class UrlSource(DirectorySource, FileSource):
         super().__init__(**kwargs)
         self.path = PurePath(self.url_path.name)
         self.base_path = Path(tempfile.gettempdir())
+        # set by fetch(), or by fetch_sources() when fetching every source up front
+        self.download_path = None
+        self.is_archive = None
+
+    @property
+    def archive_path(self) -> Path:
+        return self.download_path
+
+    def fetch(self, downloader=None) -> Path:
+        downloader = downloader or Downloader()
+        self.download_path = downloader.fetch(self.url)
+        return self.download_path
 
-    def get(self):
+    def get(self, names=None):
         # get the file, downloading it if necessary
-        download_path = self.base_path / self.path
-        if not download_path.exists():
-            request = requests.get(self.url)
-            request.raise_for_status()
-            with open(download_path, 'wb') as f:
-                f.write(request.content)
-
-        # check if the file is an archive and extract it if needed
-        if zipfile.is_zipfile(download_path):
-            with zipfile.ZipFile(download_path, 'r') as zip_ref:
-                zip_ref.extractall(self.base_path)
-
-            # run the DirectorySource super get method
-            self.path = self.base_path / self.path.stem
-            return super().get()
+        download_path = self.download_path or self.fetch()
+
+        # check if the file is an archive and read the images from it if needed
+        self.is_archive = zipfile.is_zipfile(download_path)
+        if self.is_archive:
+            # archives are expected to contain a folder with the same name as the archive
+            self.root = PurePosixPath(self.url_path.stem)
+            return super().get(names)
         else:
-            # run the FileSource super get method
-            return super(DirectorySource, self).get()
+            # run the FileSource super get method on the downloaded file
+            self.base_path = download_path.parent
+            return super(DirectorySource, self).get(names)
+
+    def read(self, path: Path) -> bytes:
+        if self.is_archive:
+            return super().read(path)
+        return BaseSource.read(self, path)
+
+    def map(self, path: Path) -> bytes | mmap.mmap:
+        if self.is_archive:
+            return super().map(path)
+        return BaseSource.map(self, path)
+
+    def stamp(self, path: Path) -> tuple | None:
+        if self.is_archive:
+            return super().stamp(path)
+        return BaseSource.stamp(self, path)
@@ -0,0 +1,107 @@
+import io
+import logging
+import sys
+from functools import cached_property
+
+from PIL import Image
+
+from .inputs import BaseLosslessInput, fill_mask, register_input
+from .metrics import metrics
+from .rasterizer import Shape, Unsupported, parse_svg
+
+LOGGER = logging.getLogger(__name__)
+
+
+@register_input('svg')
+class SvgInput(BaseLosslessInput):
+    # recoloring replaces the color of everything drawn and keeps its alpha, whatever the document draws
+    maskable = True
+
+    def __init__(self, fast_rasterizer: bool = False, **kwargs):
+        self._tree = None
+        # the built-in rasterizer isn't faster than cairosvg for every document, so it's only used when asked for
+        self.fast_rasterizer = fast_rasterizer
+        super().__init__(**kwargs)
+
+    @property
+    def tree(self) -> 'cairosvg.parser.Tree':
+        # parse the document (and resolve its CSS) once, then render every size and color from it
+        if self._tree is None:
+            # cairosvg is only imported for documents the fast rasterizer can't render
+            from cairosvg.parser import Tree
+
+            self._tree = Tree(bytestring=bytes(self.byte_string))
+        return self._tree
+
+    @cached_property
+    def shape(self) -> Shape | None:
+        """The document parsed for the fast rasterizer, or None if it's off or the document uses anything else."""
+        if not self.fast_rasterizer:
+            return None
+        try:
+            return parse_svg(bytes(self.byte_string))
+        except Unsupported as e:
+            LOGGER.debug(f'Rendering {self} with cairosvg: {e}')
+            metrics.count('svg_fallbacks')
+            return None
+
+    def release(self) -> None:
+        super().release()
+        self._tree = None
+        self.__dict__.pop('shape', None)
+
+    def _render(self, size, color):
+        # the fast rasterizer only renders coverage, so it also needs a single color to render uncolored documents
+        if color or (self.shape is not None and self.shape.color):
+            return fill_mask(self.ingest_mask(size=size), color or self.shape.color)
+
+        # specify output size to scale the vector as needed
+        return self.rasterize(self.tree, output_width=size, output_height=size)
+
+    def _render_mask(self, size):
+        if self.shape is not None:
+            return self.shape.mask(size)
+        return self.ingest(size=size, color=None).getchannel('A')
+
+    @staticmethod
+    def rasterize(
+        tree: 'cairosvg.parser.Tree',
+        *,
+        dpi=96,
+        parent_width=None,
+        parent_height=None,
+        scale=1,
+        background_color=None,
+        map_rgba=None,
+        map_image=None,
+        output_width=None,
+        output_height=None,
+    ) -> Image:
+        from cairosvg.surface import PNGSurface
+
+        output = io.BytesIO()
+        instance = PNGSurface(
+            tree,
+            output,
+            dpi,
+            None,
+            parent_width,
+            parent_height,
+            scale,
+            output_width,
+            output_height,
+            background_color,
+            map_rgba=map_rgba,
+            map_image=map_image,
+        )
+
+        # cairo's ARGB32 is premultiplied and native-endian, which Pillow can only unpack on little-endian systems
+        if sys.byteorder != 'little':
+            instance.finish()
+            return Image.open(io.BytesIO(output.getvalue()))
+
+        # read the pixels straight from the cairo surface to skip a PNG encode and decode
+        surface = instance.cairo
+        surface.flush()
+        size = (surface.get_width(), surface.get_height())
+        return Image.frombuffer('RGBA', size, bytes(surface.get_data()), 'raw', 'BGRa', surface.get_stride(), 1)
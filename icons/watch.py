@@ -0,0 +1,49 @@
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+from .scheduler import BuildContext, selector_union
+
+# the number of seconds between checks for changes
+POLL_INTERVAL = 0.5
+
+
+class Changes(NamedTuple):
+    """The images of each source that changed between two snapshots, keyed by source index and image path."""
+
+    changed: set[tuple[int, Path]]
+    removed: set[tuple[int, Path]]
+
+    def __bool__(self):
+        return bool(self.changed or self.removed)
+
+
+def file_stamp(path: str | Path) -> tuple | None:
+    """Generate a cheap fingerprint of a file that changes when its contents do, or None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def snapshot(context: BuildContext) -> dict[tuple[int, Path], tuple]:
+    """Fingerprint every image the context builds from, without reading any of them.
+
+    Args:
+        context (BuildContext): The context to fingerprint.
+
+    Returns:
+        dict[tuple[int, Path], tuple]: The fingerprint of each image, keyed by source index and image path.
+    """
+    stamps = {}
+    for source_index, source in enumerate(context.sources):
+        for image_path in source.get(names=selector_union(context.selectors[source_index])):
+            stamps[(source_index, image_path)] = source.stamp(image_path)
+    return stamps
+
+
+def diff(old: dict[tuple[int, Path], tuple], new: dict[tuple[int, Path], tuple]) -> Changes:
+    """Compare two snapshots, treating new images as changed ones."""
+    changed = {key for key, stamp in new.items() if old.get(key) != stamp}
+    return Changes(changed, old.keys() - new.keys())